@@ -1,4 +1,4 @@
-from coda.reparser import Marks, Block, compile, marks, text
+from coda.utils.reparser import Marks, Block, compile, marks, text
 from grammar import grammar, seq
 from typing import Optional
 import re
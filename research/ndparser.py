@@ -49,6 +49,10 @@ class Dual(NamedTuple):
 class Inline(NamedTuple):
     start: re.Pattern[str]
     end: Optional[re.Pattern[str]]
+    # The content of a verbatim inline (like code) is not parsed
+    verbatim: bool = False
+    # When false, the delimiters don't open or close within a word
+    intraword: bool = True
 
 
 class Prefix(NamedTuple):
@@ -70,10 +74,21 @@ class Grammar(NamedTuple):
     inlines: dict[str, Inline]
 
 
-def inline(start: str | re.Pattern[str], end: Optional[str | re.Pattern[str]] = None):
+def inline(
+    start: str | re.Pattern[str],
+    end: Optional[str | re.Pattern[str]] = None,
+    *,
+    verbatim: bool = False,
+    intraword: bool = True,
+):
+    # Text delimiters are symmetric unless an end is given, while patterns
+    # without an end match atoms (like microformats).
+    end = start if end is None and isinstance(start, str) else end
     return Inline(
         start=re.compile(re.escape(start)) if isinstance(start, str) else start,
         end=re.compile(re.escape(end)) if isinstance(end, str) else end,
+        verbatim=verbatim,
+        intraword=intraword,
     )
 
 
@@ -99,8 +114,8 @@ def grammar(
 with declared() as Inlines:
     Strong = inline("**")
     Emphasis = inline("*")
-    Term = inline("_")
-    Code = inline("`")
+    Term = inline("_", intraword=False)
+    Code = inline("`", verbatim=True)
     Quote = inline("<<", ">>")
     Link = inline("[", re.compile(r"\)\[(?P<target>[^\]]*)\]"))
     Anchor = inline("[", "]")
@@ -169,6 +184,70 @@ class MatchedBlock(NamedTuple):
     end: Optional[re.Match[str]] = None
 
 
+class InlineRules(NamedTuple):
+    """Inline rules compiled into a single alternation of groups, where
+    `kinds` maps each group to its kind (`open`, `close`, `toggle` or
+    `atom`) and to the names of the rules it applies to."""
+
+    regexp: re.Pattern[str]
+    kinds: dict[str, tuple[str, tuple[str, ...]]]
+
+
+# Compiled inline rules, by identity of the rules dict
+COMPILED_INLINES: dict[int, tuple[dict[str, Inline], InlineRules]] = {}
+RE_NAMED_GROUP = re.compile(r"\(\?P<\w+>")
+
+
+def compileInlines(inlines: dict[str, Inline]) -> InlineRules:
+    """Compiles the inline rules into one regular expression, in the style of
+    `reparser.compile`. Named groups within the rules are made anonymous, as
+    the alternation uses group names to tell which rule matched. Rules
+    that share a start (like `Link` and `Anchor`) share the opening group,
+    and the first rule to declare an expression takes precedence."""
+    if (cached := COMPILED_INLINES.get(id(inlines))) and cached[0] is inlines:
+        return cached[1]
+    groups: list[str] = []
+    kinds: dict[str, tuple[str, tuple[str, ...]]] = {}
+    by_expr: dict[tuple[str, str], str] = {}
+
+    def group(kind: str, name: str, expr: str):
+        if (g := by_expr.get((kind, expr))) is not None:
+            kinds[g] = (kind, kinds[g][1] + (name,))
+        else:
+            by_expr[(kind, expr)] = g = f"{kind[0]}{len(groups)}"
+            kinds[g] = (kind, (name,))
+            groups.append(f"(?P<{g}>{RE_NAMED_GROUP.sub('(?:', expr)})")
+
+    for name, rule in inlines.items():
+        if rule.end is None:
+            group("atom", name, rule.start.pattern)
+        elif rule.end.pattern == rule.start.pattern:
+            group("toggle", name, rule.start.pattern)
+        else:
+            group("open", name, rule.start.pattern)
+            group("close", name, rule.end.pattern)
+    res = InlineRules(re.compile("|".join(groups)), kinds)
+    COMPILED_INLINES[id(inlines)] = (inlines, res)
+    return res
+
+
+def mergeInlines(items: list) -> list:
+    """Merges the consecutive strings in the given items."""
+    res: list = []
+    text: list[str] = []
+    for item in items:
+        if isinstance(item, str):
+            text.append(item)
+        else:
+            if text:
+                res.append("".join(text))
+                text = []
+            res.append(item)
+    if text:
+        res.append("".join(text))
+    return res
+
+
 def parseInlines(
     line: str,
     inlines: dict[str, Inline] = Microformats | Inlines,
@@ -176,41 +255,222 @@ def parseInlines(
     start: int = 0,
     end: Optional[int] = None,
 ):
+    """Parses the inlines in `line`, yielding strings and `[name, children]`
+    lists. This tokenizes the line in one pass using the compiled rules, and
+    matches delimiters with a stack, so that parsing is linear in the length
+    of the line. Openers that are never closed are kept as text. Within a
+    verbatim inline, only its end is recognized, and the delimiters of
+    inlines that are not `intraword` only open before a word and only
+    close after one."""
+    rules = compileInlines(inlines)
+    kinds = rules.kinds
+    n: int = len(line) if end is None else end
+    # Items are appended to a flat output, where an opener is kept as text
+    # until it's closed, at which point the items that follow it are
+    # replaced by the inline node.
+    out: list = []
+    # Each frame is `(rule names, index of the opener in out)`
+    stack: list[tuple[tuple[str, ...], int]] = []
+    # The number of open frames for each rule, so that we only look for an
+    # opener in the stack when there is one.
+    opened: dict[str, int] = {}
+    # The verbatim inline that is open, and those that can't be closed
+    # anymore as their end is not in the rest of the line.
+    literal: Optional[str] = None
+    unclosed: set[str] = set()
     o: int = start
-    n: int = end or len(line)
-    while o < n:
-        i: int = n
-        # We iterate on the active parsers
-        starts: dict[str, re.Match[str]] = {}
-        ends: dict[str, re.Match[str]] = {}
-        for k, v in inlines.items():
-            if v.end and (m := v.start.search(line, o)):
-                # This expects an end
-                starts[k] = m
-                if (e := v.end.search(line, m.end())) and (e and e.end() <= n):
-                    # If we've found the end then we register the end
-                    ends[k] = e
-                else:
-                    # No end match, the parser becomes inactive
-                    pass
-        closest: Optional[str] = None
-        for k, e in ends.items():
-            if (j := starts[k].start()) < i:
-                closest = k
-                i = j
-        if closest:
-            yield [
-                closest,
-                list(
-                    parseInlines(
-                        line, inlines, start=starts[k].end(), end=ends[closest].start()
-                    )
-                ),
+    for match in rules.regexp.finditer(line, start, n):
+        kind, names = kinds[match.lastgroup or ""]
+        closing: Optional[str] = None
+        if literal is not None:
+            if kind in ("open", "atom") or literal not in names:
+                continue
+            closing, literal = literal, None
+        elif kind != "atom":
+            i, j = match.start(), match.end()
+            # Word boundaries, for the inlines that are not intraword
+            can_open = i == start or not line[i - 1].isalnum()
+            can_close = j >= n or not line[j].isalnum()
+            if kind != "open":
+                closing = next(
+                    (
+                        _
+                        for _ in names
+                        if opened.get(_) and (can_close or inlines[_].intraword)
+                    ),
+                    None,
+                )
+            if not closing:
+                names = tuple(
+                    _
+                    for _ in names
+                    if (can_open or inlines[_].intraword) and _ not in unclosed
+                )
+                for name in names:
+                    rule = inlines[name]
+                    if rule.verbatim and rule.end:
+                        if rule.end.search(line, j, n):
+                            literal = name
+                        else:
+                            unclosed.add(name)
+                if literal is not None:
+                    names = (literal,)
+                elif unclosed:
+                    names = tuple(_ for _ in names if _ not in unclosed)
+                if kind == "close" or not names:
+                    continue
+        if match.start() > o:
+            out.append(line[o : match.start()])
+        o = match.end()
+        if closing:
+            # We unwind up to the opener, the openers above are unmatched
+            # and stay as text.
+            while True:
+                frame_names, i = stack.pop()
+                for _ in frame_names:
+                    opened[_] -= 1
+                if closing in frame_names:
+                    break
+            children = mergeInlines(out[i + 1 :])
+            del out[i:]
+            out.append([closing, children])
+        elif kind == "atom":
+            out.append([names[0], [match.group()]])
+        else:
+            for _ in names:
+                opened[_] = opened.get(_, 0) + 1
+            stack.append((names, len(out)))
+            out.append(match.group())
+    if n > o:
+        out.append(line[o:n])
+    yield from mergeInlines(out)
+
+
+# The regular expression parser, which we use to find the first characters
+# that a pattern can match.
+try:
+    import re._parser as sre_parse
+    import re._constants as sre_constants
+except ImportError:
+    import sre_parse  # type: ignore
+    import sre_constants  # type: ignore
+
+
+def firstChars(pattern: re.Pattern[str]) -> Optional[set[str]]:
+    """Returns the set of characters that a match of `pattern` can start
+    with, or `None` if it can start with any character (or be empty)."""
+    if pattern.flags & re.IGNORECASE:
+        return None
+
+    def first(items) -> tuple[Optional[set[str]], bool]:
+        """Returns the first characters and whether `items` can be empty."""
+        res: set[str] = set()
+        for op, av in items:
+            if op is sre_constants.AT:
+                continue
+            elif op is sre_constants.LITERAL:
+                chars: Optional[set[str]] = {chr(av)}
+                nullable = False
+            elif op is sre_constants.IN:
+                chars, nullable = set(), False
+                for iop, iav in av:
+                    if iop is sre_constants.LITERAL:
+                        chars.add(chr(iav))
+                    elif iop is sre_constants.RANGE and iav[1] - iav[0] < 256:
+                        chars.update(chr(_) for _ in range(iav[0], iav[1] + 1))
+                    else:
+                        return None, True
+            elif op is sre_constants.SUBPATTERN:
+                chars, nullable = first(av[-1])
+            elif op in (sre_constants.MAX_REPEAT, sre_constants.MIN_REPEAT):
+                chars, nullable = first(av[2])
+                nullable = nullable or av[0] == 0
+            elif op is sre_constants.BRANCH:
+                chars, nullable = set(), False
+                for branch in av[1]:
+                    c, e = first(branch)
+                    if c is None:
+                        return None, True
+                    chars |= c
+                    nullable = nullable or e
+            else:
+                return None, True
+            if chars is None:
+                return None, True
+            res |= chars
+            if not nullable:
+                return res, False
+        return res, True
+
+    chars, nullable = first(sre_parse.parse(pattern.pattern, pattern.flags))
+    return None if nullable else chars
+
+
+class BlockRules:
+    """Block rules compiled into a dispatch table from the first character
+    of a line to a single regular expression: most lines only need
+    a dictionary lookup, and any line needs at most one match call to tell
+    which rule matches, preserving the precedence of the rules."""
+
+    def __init__(self, blocks: dict[str, Block | Line]):
+        self.blocks = blocks
+        self.rules: list[tuple[str, Block | Line, Optional[set[str]]]] = [
+            (k, v, firstChars(v.start.text)) for k, v in blocks.items()
+        ]
+        # Maps a first character to the dispatch expression and to the
+        # candidate rules. Each alternative is a group named after the index
+        # of its rule, the groups within the rules being made non-capturing
+        # when named, like in `compileInlines`.
+        self.table: dict[str, Optional[tuple[re.Pattern[str], list[str]]]] = {}
+
+    def dispatch(self, char: str) -> Optional[tuple[re.Pattern[str], list[str]]]:
+        if char in self.table:
+            return self.table[char]
+        candidates = [k for k, _, c in self.rules if c is None or char in c]
+        if not candidates:
+            res = None
+        elif len(candidates) == 1:
+            res = (self.blocks[candidates[0]].start.text, candidates)
+        else:
+            patterns = [
+                RE_NAMED_GROUP.sub("(?:", self.blocks[k].start.text.pattern)
+                for k in candidates
             ]
-            o = ends[closest].end() + 1
+            res = (
+                re.compile("|".join(f"(?P<r{i}>{_})" for i, _ in enumerate(patterns))),
+                candidates,
+            )
+        self.table[char] = res
+        return res
+
+    def match(self, line: str) -> Optional[tuple[str, re.Match[str]]]:
+        """Returns the name of the first rule that matches the line, along
+        with the match of its start."""
+        if not (dispatch := self.dispatch(line[:1])):
+            return None
+        regexp, candidates = dispatch
+        if not (m := regexp.match(line)):
+            return None
+        elif len(candidates) == 1:
+            return candidates[0], m
         else:
-            yield line[start:n]
-            o = n + 1
+            # The dispatch group of the alternative closes last, after the
+            # groups of its rule, so it's the last group.
+            name = candidates[int((m.lastgroup or "r0")[1:])]
+            start = self.blocks[name].start.text
+            # The rule's own match is only needed for its groups, and only
+            # for lines that start a block.
+            return name, (start.match(line) if start.groups else m) or m
+
+
+# Compiled block rules, by identity of the blocks dict
+COMPILED_BLOCKS: dict[int, BlockRules] = {}
+
+
+def compileBlocks(blocks: dict[str, Block | Line]) -> BlockRules:
+    if (res := COMPILED_BLOCKS.get(id(blocks))) is None or res.blocks is not blocks:
+        COMPILED_BLOCKS[id(blocks)] = res = BlockRules(blocks)
+    return res
 
 
 def parseBlocks(
@@ -218,6 +478,7 @@ def parseBlocks(
     blocks: dict[str, Block | Line] = Lines | Blocks,
 ) -> Iterator[MatchedBlock]:
     """Takes a stream of lines and outputs matched blocks as they are parsed."""
+    rules = compileBlocks(blocks)
     cur: Optional[MatchedBlock] = None
     for line in input:
         if cur and cur.block and isinstance(cur.block, Block) and cur.block.end:
@@ -230,30 +491,26 @@ def parseBlocks(
                 cur = None
             else:
                 cur.lines.append(line)
+        # Note that here the order of blocks matters, the first match
+        # will take precedence over the other one.
+        elif matched := rules.match(line):
+            k, m = matched
+            b = blocks[k]
+            if cur:
+                yield cur
+            if isinstance(b, Block):
+                cur = MatchedBlock(k, b, [line], m)
+            else:
+                yield MatchedBlock(k, b, [line], m)
+                cur = None
+        # If we haven't found a matched block, then we either create
+        # a new text block or append to the current one.
+        elif not cur or cur.name != "":
+            if cur:
+                yield cur
+            cur = MatchedBlock("", None, [line])
         else:
-            matched: Optional[MatchedBlock] = None
-            # Note that here the order of blocks matters, the first match
-            # will take precedence over the other one.
-            for k, b in blocks.items():
-                if m := b.start.text.match(line):
-                    if cur:
-                        yield cur
-                    matched = MatchedBlock(k, b, [line], m)
-                    if isinstance(b, Block):
-                        cur = matched
-                    else:
-                        yield matched
-                        cur = None
-                    break
-            # If we haven't found a matched block, then we either create
-            # a new text block or append to the current one.
-            if not matched:
-                if not cur or cur.name != "":
-                    if cur:
-                        yield cur
-                    cur = MatchedBlock("", None, [line])
-                else:
-                    cur.lines.append(line)
+            cur.lines.append(line)
     if cur:
         yield cur
 
@@ -287,6 +544,29 @@ def parseLines(input: Iterator[str]):
         #     yield f"<p>{''.join(trimlines(b.lines))}</p>"
 
 
+# --
+# ## Checks
+
+assert list(parseInlines("a **b** c")) == ["a ", ["Strong", ["b"]], " c"]
+# Code spans are verbatim
+assert list(parseInlines("`code **x** _y_`")) == [["Code", ["code **x** _y_"]]]
+assert list(parseInlines("*a `b*` c*")) == [
+    ["Emphasis", ["a ", ["Code", ["b*"]], " c"]]
+]
+# An unclosed code span is text, and doesn't prevent parsing the rest
+assert list(parseInlines("a ` **b**")) == ["a ` ", ["Strong", ["b"]]]
+# Terms don't open or close within words
+assert list(parseInlines("my_var_name")) == ["my_var_name"]
+assert list(parseInlines("_my_var_ x")) == [["Term", ["my_var"]], " x"]
+assert list(parseInlines("a _b_c")) == ["a _b_c"]
+assert list(parseInlines("see #tag")) == ["see ", ["Tag", ["#tag"]]]
+# Block rules are dispatched by name, whatever the groups of the rules before
+rules = BlockRules({"A": Line(prefix("(x)y")), "B": Line(prefix("xz"))})
+assert rules.match("xz")[0] == "B" and rules.match("xy")[0] == "A"
+rules = BlockRules({"Code": Block(Fence, Fence), "Tick": Line(prefix("`x"))})
+assert rules.match("`x")[0] == "Tick"
+assert (code := rules.match("``` py")) and code[1].group("lang") == "py"
+
 # --
 # ## Parsing passes
 import sys
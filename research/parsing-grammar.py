@@ -1,7 +1,25 @@
-from coda.reparser import Marks, marks
+from coda.utils.reparser import Marks, marks
+from coda.utils.files import atomicWrite
 from pathlib import Path
-from statemachine import StateMachine, Transition, Status, TMachine, TAtom, iterPretty
-from typing import Optional
+from typing import Optional, Iterable, Iterator, NamedTuple
+from array import array
+import hashlib
+import json
+import os
+import re
+import sys
+
+# The `statemachine` notebook lives in the attic, next to a `json` module
+# that would shadow the standard one if the directory came first in the path.
+sys.path.append(str(Path(__file__).parent.parent / "attic/v0/src/utils"))
+from statemachine import (  # noqa: E402
+    StateMachine,
+    Transition,
+    Status,
+    TMachine,
+    TAtom,
+    iterPretty,
+)
 
 # --
 # The next step after our `statemachine` notebook is to integrate the
@@ -161,7 +179,325 @@ def grammar(rules: dict[str, TMachine]) -> TMachine:
     return combine(*(makes(machine, event) for event, machine in rules.items()))
 
 
+# --
+# ## Compiling grammars to a DFA
+#
+# Combining machines with `grammar` still requires running them like
+# separate machines. Instead, we can compile the `seq` specifications of
+# all the rules into a single deterministic automaton: an NFA is built from
+# the specifications, which is then turned into a DFA using the subset
+# construction, and minimized by partition refinement. Each state knows the
+# rules it accepts, so that all rules are recognized in one pass, with one
+# table lookup per atom.
+
+# Bump this when the compiled format changes, to invalidate the cache
+DFA_VERSION: str = "1"
+# The code for atoms that are not named in the grammar, which only match
+# wildcards.
+OTHER: int = 0
+
+
+def cardinality(match: str) -> tuple[str, str]:
+    """Returns the `(name, cardinality)` of a `seq` match, where the name
+    is `*` for the wildcard `_`."""
+    name, card = (match[:-1], match[-1]) if match[-1] in "?+*" else (match, "")
+    return ("*" if name == "_" else name), card
+
+
+class DFA(NamedTuple):
+    """A minimized DFA recognizing the rules of a grammar. Atoms are encoded
+    as integers (`OTHER` being 0), and `table[state * width + atom]` is the
+    next state, or -1. The start state is 0, and `accepts[state]` lists the
+    ids of the rules accepted in that state, in declaration order."""
+
+    rules: list[str]
+    atoms: list[str]
+    table: "array[int]"
+    accepts: list[tuple[int, ...]]
+
+    @property
+    def width(self) -> int:
+        return len(self.atoms) + 1
+
+    @staticmethod
+    def Compile(rules: dict[str, Iterable[str]]) -> "DFA":
+        """Compiles the rules, given as sequences of `seq` matches."""
+        specs: list[list[tuple[str, str]]] = [
+            [cardinality(_) for _ in matches] for matches in rules.values()
+        ]
+        atoms: list[str] = sorted(
+            {name for spec in specs for name, _ in spec if name != "*"}
+        )
+        codes: dict[str, int] = {k: i + 1 for i, k in enumerate(atoms)}
+        width: int = len(atoms) + 1
+        # --
+        # The NFA has one state before each match of each rule, plus a loop
+        # state for `+` matches, and an accepting state at the end of each
+        # rule. Transitions are `(state, code or -1 for wildcard, target)`.
+        epsilon: list[list[int]] = []
+        moves: list[list[tuple[int, int]]] = []
+        accepting: list[int] = []
+
+        def state(rule: int = -1) -> int:
+            epsilon.append([])
+            moves.append([])
+            accepting.append(rule)
+            return len(moves) - 1
+
+        starts: list[int] = []
+        for r, spec in enumerate(specs):
+            current = state()
+            starts.append(current)
+            for name, card in spec:
+                code = -1 if name == "*" else codes[name]
+                following = state()
+                if card == "":
+                    moves[current].append((code, following))
+                elif card == "?":
+                    moves[current].append((code, following))
+                    epsilon[current].append(following)
+                elif card == "*":
+                    moves[current].append((code, current))
+                    epsilon[current].append(following)
+                else:
+                    loop = state()
+                    moves[current].append((code, loop))
+                    moves[loop].append((code, loop))
+                    epsilon[loop].append(following)
+                current = following
+            accepting[current] = r
+
+        def closure(states: Iterable[int]) -> frozenset[int]:
+            res = set(states)
+            pending = list(res)
+            while pending:
+                for _ in epsilon[pending.pop()]:
+                    if _ not in res:
+                        res.add(_)
+                        pending.append(_)
+            return frozenset(res)
+
+        # --
+        # Subset construction, where the empty set is the dead state.
+        subsets: dict[frozenset[int], int] = {}
+        order: list[frozenset[int]] = []
+        table: list[int] = []
+
+        def subset(states: frozenset[int]) -> int:
+            if not states:
+                return -1
+            if (i := subsets.get(states)) is None:
+                subsets[states] = i = len(order)
+                order.append(states)
+                table.extend([-1] * width)
+            return i
+
+        subset(closure(starts))
+        i = 0
+        while i < len(order):
+            targets: list[set[int]] = [set() for _ in range(width)]
+            for s in order[i]:
+                for code, target in moves[s]:
+                    if code == -1:
+                        for _ in targets:
+                            _.add(target)
+                    else:
+                        targets[code].add(target)
+            for code, t in enumerate(targets):
+                table[i * width + code] = subset(closure(t))
+            i += 1
+        accepts: list[tuple[int, ...]] = [
+            tuple(sorted(accepting[_] for _ in states if accepting[_] >= 0))
+            for states in order
+        ]
+        return DFA.Minimize(DFA(list(rules), atoms, array("i", table), accepts))
+
+    @staticmethod
+    def Minimize(dfa: "DFA") -> "DFA":
+        """Returns the minimal equivalent DFA, refining the partition of the
+        states by accepted rules until the transitions of the states in each
+        block lead to the same blocks."""
+        width = dfa.width
+        n = len(dfa.accepts)
+        keys: dict[tuple[int, ...], int] = {}
+        blocks: list[int] = [keys.setdefault(_, len(keys)) for _ in dfa.accepts]
+        count = len(keys)
+        while True:
+            keys = {}
+            refined: list[int] = []
+            for s in range(n):
+                row = dfa.table[s * width : (s + 1) * width]
+                key = (blocks[s],) + tuple(-1 if _ < 0 else blocks[_] for _ in row)
+                refined.append(keys.setdefault(key, len(keys)))
+            blocks = refined
+            if len(keys) == count:
+                break
+            count = len(keys)
+        # We renumber the blocks so that the start state stays 0
+        renumbered: dict[int, int] = {}
+        for b in blocks:
+            renumbered.setdefault(b, len(renumbered))
+        table: array[int] = array("i", [-1]) * (count * width)
+        accepts: list[tuple[int, ...]] = [()] * count
+        for s in range(n):
+            b = renumbered[blocks[s]]
+            accepts[b] = dfa.accepts[s]
+            for code in range(width):
+                t = dfa.table[s * width + code]
+                table[b * width + code] = -1 if t < 0 else renumbered[blocks[t]]
+        return DFA(dfa.rules, dfa.atoms, table, accepts)
+
+    @staticmethod
+    def Load(
+        rules: dict[str, Iterable[str]], cache: Optional[str | Path] = None
+    ) -> "DFA":
+        """Returns the compiled DFA for the given rules, using the compiled
+        DFA stored in the `cache` directory if there is one."""
+        spec = {k: list(v) for k, v in rules.items()}
+        base = Path(
+            cache
+            or Path(os.environ.get("XDG_CACHE_HOME", Path.home() / ".cache"))
+            / "coda"
+            / "grammars"
+        )
+        key = hashlib.blake2b(
+            json.dumps([DFA_VERSION, spec]).encode("utf8"), digest_size=16
+        ).hexdigest()
+        path = base / f"{key}.json"
+        if path.exists():
+            try:
+                with open(path, "rt") as f:
+                    data = json.load(f)
+                return DFA(
+                    data["rules"],
+                    data["atoms"],
+                    array("i", data["table"]),
+                    [tuple(_) for _ in data["accepts"]],
+                )
+            except (ValueError, KeyError):
+                # A corrupted cache entry is compiled again
+                pass
+        res = DFA.Compile(spec)
+        atomicWrite(
+            path,
+            json.dumps(
+                dict(
+                    rules=res.rules,
+                    atoms=res.atoms,
+                    table=res.table.tolist(),
+                    accepts=res.accepts,
+                )
+            ),
+        )
+        return res
+
+    def encode(self, stream: Iterable[TAtom]) -> "array[int]":
+        codes = {k: i + 1 for i, k in enumerate(self.atoms)}
+        return array("i", (codes.get(_, OTHER) for _ in stream))
+
+    def match(self, codes: "array[int]") -> Iterator[tuple[str, int, int]]:
+        """Yields the `(rule, start, end)` matches in the encoded stream,
+        where each match is the longest one from its start, and the first
+        declared rule wins when several rules match. Atoms that start no
+        match are skipped."""
+        table = self.table
+        width = self.width
+        accepts = self.accepts
+        rules = self.rules
+        n = len(codes)
+        start = 0
+        while start < n:
+            state = 0
+            end = -1
+            rule = -1
+            i = start
+            while i < n and (state := table[state * width + codes[i]]) >= 0:
+                i += 1
+                if accepted := accepts[state]:
+                    end = i
+                    rule = accepted[0]
+            if end < 0:
+                start += 1
+            else:
+                yield rules[rule], start, end
+                start = end
+
+
+def interpret(
+    rules: dict[str, Iterable[str]], stream: list[str]
+) -> Iterator[tuple[str, int, int]]:
+    """The reference for `DFA.match`, interpreting the `seq` specifications
+    directly: each rule is turned into a regular expression on the atoms
+    (one character each), and the longest match is searched from each
+    start, by trying every end."""
+    atoms = sorted(
+        set(stream) | {cardinality(_)[0] for r in rules.values() for _ in r}
+    )
+    chars = {k: chr(0x100 + i) for i, k in enumerate(atoms)}
+    text = "".join(chars[_] for _ in stream)
+    exprs = [
+        (
+            name,
+            re.compile(
+                "".join(
+                    ("." if n == "*" else re.escape(chars[n])) + c
+                    for n, c in (cardinality(_) for _ in matches)
+                ),
+                re.DOTALL,
+            ),
+        )
+        for name, matches in rules.items()
+    ]
+    start = 0
+    while start < len(text):
+        found = next(
+            (
+                (name, start, end)
+                for end in range(len(text), start, -1)
+                for name, expr in exprs
+                if expr.fullmatch(text, start, end)
+            ),
+            None,
+        )
+        if found:
+            yield found
+            start = found[2]
+        else:
+            start += 1
+
+
 if __name__ == "__main__":
+    import random
+    import tempfile
+
+    print("=== TEST DFA: compiled grammar matches the interpreted one")
+    dfa_rules: dict[str, list[str]] = {
+        "Doc": ["blockStart", "comment*"],
+        "Comment": ["comment+"],
+        "Decorated": ["decorator?", "def", "_*", "end"],
+        "Code": ["_+", "end"],
+    }
+    dfa = DFA.Compile(dfa_rules)
+    # Minimization is idempotent, and the start state stays 0
+    assert len(DFA.Minimize(dfa).accepts) == len(dfa.accepts)
+    rng = random.Random(0)
+    alphabet = ["blockStart", "comment", "decorator", "def", "end", "code"]
+    for _ in range(500):
+        stream = [rng.choice(alphabet) for _ in range(rng.randint(0, 12))]
+        expected = list(interpret(dfa_rules, stream))
+        assert list(dfa.match(dfa.encode(stream))) == expected, (stream, expected)
+    assert list(dfa.match(dfa.encode(["blockStart", "comment", "comment", "def"]))) == [
+        ("Doc", 0, 3)
+    ]
+    # The compiled DFA is cached, and a corrupted cache entry is recompiled
+    with tempfile.TemporaryDirectory() as cache:
+        assert DFA.Load(dfa_rules, cache) == dfa
+        assert DFA.Load(dfa_rules, cache) == dfa
+        for path in Path(cache).iterdir():
+            path.write_text("{")
+        assert DFA.Load(dfa_rules, cache) == dfa
+    print("--- OK")
+
     print("=== TEST seq: defining a sequence of transitions")
     res = seq("commentStart", "commentLine+")
     # NOTE: remap and sor should be equivalent
@@ -223,7 +559,7 @@ if __name__ == "__main__":
     if True:
         parser.reset()
         print("=== TEST Parsing a file using the state machine")
-        with open(Path(__file__).parent.parent / "src/py/coda/domish.py", "rt") as f:
+        with open(__file__, "rt") as f:
             atoms = []
             for i, atom in enumerate(marks(text := f.read(), python_tokens)):
                 # for i, line in enumerate(atom.text.split("\n")):
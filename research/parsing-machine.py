@@ -1,6 +1,8 @@
-from typing import Optional, Union, Callable, Iterable, Iterator
+from typing import Optional, Union, Callable, Iterable, Iterator, NamedTuple
 from enum import Enum
 from dataclasses import dataclass
+from array import array
+import heapq
 
 # --
 # A general way to implement state machines, with the idea of using
@@ -176,6 +178,216 @@ def mux(
             yield from machine.feed(atom)
 
 
+# --
+# ## Compiled machines
+#
+# The compiled form of a state machine maps atoms to integer codes and
+# states to dense indexes, so that transitions are stored in a flat
+# `states × atoms` table. A whole stream of codes can then be processed
+# in a single loop, with events returned in bulk as integer arrays. The
+# atom codes are shared by all the machines that run over the same stream,
+# so that the stream is encoded once.
+
+# The code of the atoms that are not known to any machine, which only
+# match wildcard transitions.
+OTHER: int = 0
+STATUS_READY: int = Status.Ready.value
+STATUS_COMPLETE: int = Status.Complete.value
+STATUS_END: int = Status.End.value
+
+
+class Atoms:
+    """Interns atoms as integer codes."""
+
+    def __init__(self, atoms: Iterable[TAtom] = ()):
+        self.codes: dict[TAtom, int] = {}
+        self.atoms: list[Optional[TAtom]] = [None]
+        for atom in atoms:
+            self.intern(atom)
+
+    def __len__(self) -> int:
+        return len(self.atoms)
+
+    def intern(self, atom: TAtom) -> int:
+        if (code := self.codes.get(atom)) is None:
+            self.codes[atom] = code = len(self.atoms)
+            self.atoms.append(atom)
+        return code
+
+    def encode(self, stream: Iterable[TAtom]) -> "array[int]":
+        """Encodes the stream, mapping unknown atoms to `OTHER`."""
+        get = self.codes.get
+        return array("i", (get(_, OTHER) for _ in stream))
+
+
+class Events(NamedTuple):
+    """Completion events as parallel arrays, where `events[i]` is the index of
+    the event name in the machine's `events` (or -1)."""
+
+    events: "array[int]"
+    starts: "array[int]"
+    ends: "array[int]"
+
+    @staticmethod
+    def Create() -> "Events":
+        return Events(array("i"), array("i"), array("i"))
+
+    def __len__(self) -> int:
+        return len(self.ends)
+
+
+class CompiledMachine:
+    """The compiled form of a `StateMachine`, which behaves like its `feed`
+    but over arrays of atom codes. Transitions' effects are not supported,
+    just like in `feed`."""
+
+    @staticmethod
+    def Make(machine: StateMachine, atoms: Atoms) -> "CompiledMachine":
+        """Compiles the machine, registering its atoms in `atoms`."""
+        for transitions in machine.transitions.values():
+            for atom in transitions:
+                if atom != "*":
+                    atoms.intern(atom)
+        return CompiledMachine(machine, atoms)
+
+    def __init__(self, machine: StateMachine, atoms: Atoms):
+        self.machine = machine
+        self.name = machine.name
+        self.atoms = atoms
+        self.width: int = 0
+        self.compile()
+        self.reset()
+
+    def compile(self):
+        """Builds the transition table, which is as wide as the atoms. As
+        atoms may be shared with other machines, this is done again when
+        new atoms were added."""
+        machine = self.machine
+        atoms = self.atoms
+        self.width = len(atoms)
+        # States are mapped to dense indexes, the start state being 0
+        states: dict[TState, int] = {0: 0}
+        for state in machine.transitions:
+            states.setdefault(state, len(states))
+        # Transitions are stored as parallel arrays
+        self.targets: array[int] = array("i")
+        self.statuses: array[int] = array("b")
+        self.transitionEvents: array[int] = array("i")
+        self.events: list[str] = []
+        self.table: array[int] = array("i", [-1]) * (len(states) * self.width)
+        event_ids: dict[str, int] = {}
+        for state, transitions in machine.transitions.items():
+            row = states[state] * self.width
+            for atom, t in transitions.items():
+                target = states.setdefault(t.target, len(states))
+                if target * self.width >= len(self.table):
+                    self.table.extend(array("i", [-1]) * self.width)
+                i = len(self.targets)
+                self.targets.append(target)
+                self.statuses.append(t.status.value)
+                if t.event is None:
+                    self.transitionEvents.append(-1)
+                else:
+                    if (e := event_ids.get(t.event)) is None:
+                        event_ids[t.event] = e = len(self.events)
+                        self.events.append(t.event)
+                    self.transitionEvents.append(e)
+                if atom == "*":
+                    # The wildcard covers all the atoms not explicitly listed
+                    for code in range(self.width):
+                        if code == OTHER or atoms.atoms[code] not in transitions:
+                            self.table[row + code] = i
+                else:
+                    self.table[row + atoms.codes[atom]] = i
+        self.states: int = len(states)
+
+    def reset(self, offset: int = 0):
+        self.state: int = 0
+        self.start: int = -1
+        self.offset: int = offset
+        self.status: int = Status.Start.value
+        self.transition: int = -1
+
+    def feedMany(self, codes: Iterable[int], events: Optional[Events] = None) -> Events:
+        """Feeds the given atom codes, returning the completion events. This
+        is equivalent to calling `StateMachine.feed` for each atom."""
+        if self.width != len(self.atoms):
+            self.compile()
+        res = Events.Create() if events is None else events
+        res_events, res_starts, res_ends = res
+        table = self.table
+        width = self.width
+        targets = self.targets
+        statuses = self.statuses
+        transition_events = self.transitionEvents
+        state = self.state
+        start = self.start
+        offset = self.offset
+        status = self.status
+        t = self.transition
+        for code in codes:
+            while True:
+                t = table[state * width + code]
+                if t >= 0:
+                    previous = state
+                    status = statuses[t]
+                    if status > STATUS_READY and start < 0:
+                        start = offset
+                    state = targets[t]
+                    if status == STATUS_END:
+                        res_events.append(transition_events[t])
+                        res_starts.append(start)
+                        res_ends.append(offset)
+                        start = -1
+                        # After a completion, the atom is fed again
+                        if previous != state:
+                            continue
+                elif status == STATUS_COMPLETE:
+                    res_events.append(-1)
+                    res_starts.append(offset if start < 0 else start)
+                    res_ends.append(offset)
+                break
+            offset += 1
+        self.state = state
+        self.start = start
+        self.offset = offset
+        self.status = status
+        self.transition = t
+        return res
+
+    def peek(self) -> Optional[CompletionEvent]:
+        """Like `StateMachine.peek`."""
+        if self.start >= 0 and Status.Partial.value <= self.status < Status.Fail.value:
+            e = self.transitionEvents[self.transition] if self.transition >= 0 else -1
+            return CompletionEvent(
+                self.machine,
+                self.events[e] if e >= 0 else None,
+                self.start,
+                self.offset,
+            )
+        else:
+            return None
+
+    def completions(self, events: Events) -> Iterator[CompletionEvent]:
+        """Iterates on the given events as completion events."""
+        names = self.events
+        for e, start, end in zip(*events):
+            yield CompletionEvent(
+                self.machine, names[e] if e >= 0 else None, start, end
+            )
+
+
+def muxMany(
+    codes: "array[int]", machines: list[CompiledMachine]
+) -> Iterator[CompletionEvent]:
+    """Like `mux`, but runs each compiled machine over the whole stream of
+    codes in turn, and then merges their events in stream order."""
+    return heapq.merge(
+        *(_.completions(_.feedMany(codes)) for _ in machines),
+        key=lambda _: _.end,
+    )
+
+
 if __name__ == "__main__":
     # --
     # We define a state machine to recognise blocks based on a stream of tokens.
@@ -258,5 +470,29 @@ if __name__ == "__main__":
         )
         assert expected == actual
     print("--- OK")
+
+    print("=== TEST Compiled machines match the interpreted ones")
+    import random
+    import time
+
+    atoms = Atoms()
+    compiled = [CompiledMachine.Make(_, atoms) for _ in (blocks, comments, aabb)]
+    random.seed(0)
+    stream = random.choices(["block", "comment", "line", "A", "B", " "], k=100_000)
+    codes = atoms.encode(stream)
+    for machine in (blocks, comments, aabb):
+        machine.reset()
+    t = time.monotonic()
+    expected = [
+        (_.machine.name, _.name, _.start, _.end)
+        for _ in mux(stream, [blocks, comments, aabb])
+    ]
+    t_interpreted = time.monotonic() - t
+    t = time.monotonic()
+    actual = [(_.machine.name, _.name, _.start, _.end) for _ in muxMany(codes, compiled)]
+    t_compiled = time.monotonic() - t
+    assert actual == expected, "Compiled machines differ"
+    print(f"... {len(actual)} events: {t_interpreted:.3f}s, compiled {t_compiled:.3f}s")
+    print("--- OK")
     print("EOK")
 # EOF
@@ -11,6 +11,7 @@ from typing import (
     Any,
     ContextManager,
 )
+from itertools import chain
 
 # --
 # # Templates
@@ -240,6 +241,11 @@ class VNode:
             children=children,
         )
 
+    def compile(self) -> "Template":
+        """Compiles this node into a template that renders the same HTML
+        as `apply` followed by `repr`, without copying the tree."""
+        return Template.Compile(self)
+
     def __repr__(self):
         """The string representation is straight up HTML"""
 
@@ -312,6 +318,170 @@ class Proxy(Generic[T]):
             return res
 
 
+# --
+# ## Compiled Templates
+#
+# Applying a `VNode` template deep-copies the tree for each context, and
+# then serializes the copy. Templates are instead compiled once into a flat
+# list of operations, which are either static strings or functions that
+# take the context and append the rendered chunks to an output list. Adjacent
+# static chunks are merged, so rendering is mostly a string join.
+#
+# Operations return the number of nodes they produced, which is how an
+# element whose children are all slots knows if it is empty (`<a/>`) or not.
+
+TOperation = Union[str, Callable[[dict[Slot, Any], list[str]], int]]
+
+
+class Template:
+    @staticmethod
+    def Compile(node: VNode) -> "Template":
+        return Template(Template.Operations(node))
+
+    @staticmethod
+    def Operations(node: VNode) -> list[TOperation]:
+        """Returns the list of operations that render the given node."""
+        if node.name == "#text":
+            return [f"{node.attributes['value']}"]
+        elif node.name == "#slot":
+            return [Template.SlotOperation(node.value)]
+        sq = "'"
+        dq = '"'
+        res: list[TOperation] = [f"<{node.name}"]
+        for k, v in node.attributes.items():
+            res.append(
+                Template.AttributeOperation(k, v)
+                if isinstance(v, (Slot, list, dict))
+                else f" {k}={str(v).replace(dq, sq)}"
+            )
+        if not node.children:
+            res.append("/>")
+        elif all(_.name == "#slot" for _ in node.children):
+            # Whether the node is empty depends on what the slots produce
+            res.append(
+                Template.ChildrenOperation(
+                    node.name,
+                    list(chain(*(Template.Operations(_) for _ in node.children))),
+                )
+            )
+        else:
+            res.append(">")
+            for child in node.children:
+                res += Template.Operations(child)
+            res.append(f"</{node.name}>")
+        return Template.Merge(res)
+
+    @staticmethod
+    def Merge(operations: Iterable[TOperation]) -> list[TOperation]:
+        """Merges consecutive static chunks together."""
+        res: list[TOperation] = []
+        for op in operations:
+            if isinstance(op, str) and res and isinstance(res[-1], str):
+                res[-1] += op
+            else:
+                res.append(op)
+        return res
+
+    @staticmethod
+    def AttributeOperation(name: str, value: TTemplate) -> TOperation:
+        sq = "'"
+        dq = '"'
+
+        def operation(context: dict[Slot, Any], out: list[str]) -> int:
+            out.append(f" {name}={str(Slot.Apply(value, context)).replace(dq, sq)}")
+            return 0
+
+        return operation
+
+    @staticmethod
+    def ChildrenOperation(name: str, children: list[TOperation]) -> TOperation:
+        def operation(context: dict[Slot, Any], out: list[str]) -> int:
+            buffer: list[str] = []
+            count: int = 0
+            for op in children:
+                if isinstance(op, str):
+                    buffer.append(op)
+                else:
+                    count += op(context, buffer)
+            if count:
+                out.append(">")
+                out += buffer
+                out.append(f"</{name}>")
+            else:
+                out.append("/>")
+            return 0
+
+        return operation
+
+    @staticmethod
+    def SlotOperation(slot: Slot) -> TOperation:
+        if isinstance(slot, Effect) and isinstance(slot.effector, MappingEffector):
+            # Mapping effects are compiled as well, which is where the
+            # biggest gain is, as the original implementation applies (and
+            # copies) the mapped nodes for each item.
+            source = slot.source
+            templates = [Template.Compile(_) for _ in slot.effector.nodes]
+
+            def mapping(context: dict[Slot, Any], out: list[str]) -> int:
+                value = source.apply(context)
+                items: Iterable[Any] = (
+                    value
+                    if isinstance(value, list)
+                    else value.items()
+                    if isinstance(value, dict)
+                    else ()
+                    if value is None
+                    else (value,)
+                )
+                # We reuse the same derived context for all the items
+                scope = dict(context)
+                count: int = 0
+                for item in items:
+                    scope[CurrentSlot] = item
+                    for template in templates:
+                        template.emit(scope, out)
+                        count += 1
+                return count
+
+            return mapping
+        else:
+
+            def value(context: dict[Slot, Any], out: list[str]) -> int:
+                applied = slot.apply(context)
+                items: Iterable[Any] = (
+                    applied
+                    if isinstance(applied, list)
+                    else ()
+                    if applied is None
+                    else (applied,)
+                )
+                count: int = 0
+                for item in items:
+                    out.append(
+                        str(item)
+                        if type(item) in (str, int, float, bool)
+                        else repr(VNode.Ensure(item))
+                    )
+                    count += 1
+                return count
+
+            return value
+
+    def __init__(self, operations: list[TOperation]):
+        self.operations: list[TOperation] = operations
+
+    def emit(self, context: dict[Slot, Any], out: list[str]) -> list[str]:
+        for op in self.operations:
+            if isinstance(op, str):
+                out.append(op)
+            else:
+                op(context, out)
+        return out
+
+    def render(self, context: dict[Slot, Any]) -> str:
+        return "".join(self.emit(context, []))
+
+
 def slot() -> Input:
     return Input()
 
@@ -350,6 +520,22 @@ if __name__ == "__main__":
             {items: [{"name": "One"}, {"name": "Two"}]}
         )
     )
+    print("--- TEST compiled: Rendering compiled templates")
+    name = slot()
+    # NOTE: `_` is rebound by the `with` test above
+    _ = CurrentSlot
+    for template, context in (
+        (h.div("Hello, ", name), {name: "World"}),
+        (h.div({"title": name}, name), {name: "World"}),
+        (h.ul(items.map(h.li(h.span("My name is ", _)))), {items: ["One", "Two"]}),
+        (h.ul(items.map(h.li(h.span("My name is ", _.name)))), {items: [{"name": "One"}]}),
+        (h.ul(items.map(h.li(_))), {items: []}),
+        (h.ul(items.map(h.li(h.b(_[0]), _[1]))), {items: {"k": "v"}}),
+    ):
+        expected = str(template.apply(context))
+        actual = template.compile().render(context)
+        print(f"... OK  {actual}" if actual == expected else f"... ERR {actual} != {expected}")
+        assert actual == expected
     print("--- EOK")
 
 # EOF
@@ -37,17 +37,7 @@ class Token:
 
     @staticmethod
     def Expand(text: str, context: dict[str, TContextValue]) -> str:
-        o: int = 0
-        r: list[str] = []
-        while match := Token.RE_EXPR.search(text, o):
-            r.append(text[o : match.start()])
-            if token := Token.Parse(match["content"]):
-                r.append(str(token.eval(context).value))
-            else:
-                r.append(match.group())
-            o = match.end()
-        r.append(text[o:])
-        return "".join(r)
+        return Template.Compile(text).expand(context)
 
     @staticmethod
     def Parse(text: str, strict: bool = True) -> Optional["Token"]:
@@ -118,11 +108,114 @@ class Token:
 
     def __init__(self, chunks: Iterable[TokenChunk]):
         self.chunks = [_ for _ in chunks]
+        # Used as the memoization key, see `Tokens`
+        self.key: tuple[TokenChunk, ...] = tuple(self.chunks)
 
     def eval(self, context: dict[str, TContextValue]):
         return Token.Eval(self.chunks, context)
 
 
+class Tokens(dict[str, TContextValue]):
+    """A token context that memoizes the evaluated tokens. Token values
+    may be functions of any other token, so the memo is invalidated as
+    a whole whenever a token changes."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.memo: dict[tuple[TokenChunk, ...], str] = {}
+
+    def __setitem__(self, key: str, value: TContextValue) -> None:
+        self.memo.clear()
+        super().__setitem__(key, value)
+
+    def __delitem__(self, key: str) -> None:
+        self.memo.clear()
+        super().__delitem__(key)
+
+    def update(self, *args, **kwargs) -> None:
+        self.memo.clear()
+        super().update(*args, **kwargs)
+
+    def __ior__(self, other) -> "Tokens":
+        self.update(other)
+        return self
+
+    def pop(self, key: str, *default):
+        self.memo.clear()
+        return super().pop(key, *default)
+
+    def popitem(self) -> tuple[str, TContextValue]:
+        self.memo.clear()
+        return super().popitem()
+
+    def setdefault(self, key: str, default: TContextValue = None):
+        if key not in self:
+            self.memo.clear()
+        return super().setdefault(key, default)
+
+    def clear(self) -> None:
+        self.memo.clear()
+        super().clear()
+
+    def derive(self, **tokens: TContextValue) -> "Tokens":
+        """Returns a new context with the given tokens overridden, which is
+        how themes are derived from a base."""
+        res = Tokens(self)
+        res.update(tokens)
+        return res
+
+    def value(self, token: Token) -> str:
+        if (res := self.memo.get(token.key)) is None:
+            self.memo[token.key] = res = str(token.eval(self).value)
+        return res
+
+
+class Template:
+    """A template string compiled once into a sequence of literal strings
+    and tokens, so that expanding it only evaluates the tokens."""
+
+    # Compiled templates, by text, the oldest being evicted past `Limit`
+    All: ClassVar[dict[str, "Template"]] = {}
+    Limit: ClassVar[int] = 1024
+
+    @staticmethod
+    def Reset() -> None:
+        Template.All.clear()
+
+    @staticmethod
+    def Compile(text: str) -> "Template":
+        if (res := Template.All.get(text)) is None:
+            if len(Template.All) >= Template.Limit:
+                del Template.All[next(iter(Template.All))]
+            o: int = 0
+            nodes: list[str | Token] = []
+            for match in Token.RE_EXPR.finditer(text):
+                if match.start() > o:
+                    nodes.append(text[o : match.start()])
+                # Expressions that are not tokens are kept as-is
+                nodes.append(Token.Parse(match["content"]) or match.group())
+                o = match.end()
+            if o < len(text):
+                nodes.append(text[o:])
+            Template.All[text] = res = Template(nodes)
+        return res
+
+    def __init__(self, nodes: list[str | Token]):
+        self.nodes = nodes
+
+    def expand(self, context: dict[str, TContextValue]) -> str:
+        if isinstance(context, Tokens):
+            value = context.value
+            return "".join(
+                _ if isinstance(_, str) else value(_) for _ in self.nodes
+            )
+        else:
+            return "".join(
+                _ if isinstance(_, str) else str(_.eval(context).value)
+                for _ in self.nodes
+            )
+
+
 def token(text: str) -> Token:
     return Token.Parse(text)
 
@@ -305,6 +398,43 @@ if __name__ == "__main__":
 
     print(expand("color: ${Blue.focused}", tokens))
 
+    print("=== TEST: Memoized design tokens")
+    import time
+
+    stylesheet = "\n".join(
+        f".c{i} {{ color: ${{Blue.focused}}; background: ${{Background}}; }}"
+        for i in range(1000)
+    )
+    base = Tokens(tokens)
+    themes = [base.derive(Blue=color(f"#{i:02X}8ebe")) for i in range(100)]
+    t = time.monotonic()
+    expected = [expand(stylesheet, dict(_)) for _ in themes]
+    t_plain = time.monotonic() - t
+    t = time.monotonic()
+    memoized = [expand(stylesheet, _) for _ in themes]
+    t_memo = time.monotonic() - t
+    assert memoized == expected
+    # Changing a token invalidates the memoized values
+    base["Blue"] = color("#FF0000")
+    assert expand("${Blue}", base) == "#FF0000FF"
+    # …and so does any other way of changing them
+    base.pop("Blue")
+    base.setdefault("Blue", color("#00FF00"))
+    assert expand("${Blue}", base) == "#00FF00FF"
+    base |= dict(Blue=color("#0000FF"))
+    assert expand("${Blue}", base) == "#0000FFFF"
+    assert base.popitem()[0] == "Blue" and "Blue" not in base
+    base.clear()
+    base.update(Blue=color("#FF0000"))
+    assert expand("${Blue}", base) == "#FF0000FF"
+    # The compiled templates are bounded
+    for i in range(Template.Limit + 10):
+        Template.Compile(f"${{Blue}} {i}")
+    assert len(Template.All) == Template.Limit
+    Template.Reset()
+    assert not Template.All
+    print(f"... {len(themes)} themes: {t_plain:.3f}s plain, {t_memo:.3f}s memoized")
+
 # --
 # ## References
 #
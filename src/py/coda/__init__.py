@@ -0,0 +1,6 @@
+from .utils.compiled import install
+
+# Loads the mypyc-compiled modules when they were built
+install()
+
+# EOF
@@ -0,0 +1,69 @@
+from typing import NamedTuple
+import sys
+
+# --
+# # Command line
+#
+# The `coda` command dispatches to the commands of the modules, which are
+# their `__main__` blocks. As the command is run from editor hooks and
+# pre-commit, startup time matters: only the module of the given command is
+# imported, along with what it needs, so that `coda blocks FILE` doesn't
+# load the renderer, the pipeline or the JSON encoder. Keep the imports of
+# this module to the standard minimum.
+
+
+class Command(NamedTuple):
+    module: str
+    description: str
+
+
+COMMANDS: dict[str, Command] = {
+    "blocks": Command("coda.parser.blocks", "Prints the blocks of source files"),
+    "tags": Command("coda.parser.ctags", "Generates or parses ctags files"),
+    "references": Command(
+        "coda.parser.references", "Resolves symbol references in files"
+    ),
+    "html": Command("coda.render.html", "Renders source files as HTML"),
+    "site": Command("coda.render.site", "Renders a site from source files"),
+    "pipeline": Command("coda.pipeline", "Renders sources through a pipeline"),
+    "files": Command("coda.collect.files", "Walks and catalogues files"),
+    "inspect": Command("coda.collect.inspect", "Introspects the API of modules"),
+    "changes": Command("coda.utils.changes", "Lists the files changed since a state"),
+}
+
+
+def usage() -> str:
+    width = max(len(_) for _ in COMMANDS)
+    return "\n".join(
+        ["Usage: coda COMMAND [ARGS…]", "", "Commands:"]
+        + [f"  {k:<{width}}  {v.description}" for k, v in COMMANDS.items()]
+    )
+
+
+def main(args: list[str] = sys.argv[1:]) -> int:
+    """Runs the command given by the first argument with the rest of the
+    arguments, returning the exit status."""
+    if not args or args[0] in ("-h", "--help", "help"):
+        print(usage())
+        return 0
+    name, *rest = args
+    if not (command := COMMANDS.get(name)):
+        print(f"coda: unknown command '{name}'\n\n{usage()}", file=sys.stderr)
+        return 2
+    import runpy
+    from .utils.compiled import EXCLUDED
+
+    # The module sees its own path as `argv[0]`, like with `python -m`
+    sys.argv[1:] = rest
+    EXCLUDED.add(command.module)
+    try:
+        runpy.run_module(command.module, run_name="__main__", alter_sys=True)
+    finally:
+        EXCLUDED.discard(command.module)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
+
+# EOF
@@ -0,0 +1,330 @@
+from typing import Any, Iterable, Iterator, NamedTuple
+from importlib import import_module
+from importlib.util import find_spec
+from inspect import ismodule, isclass, isfunction, ismethod, isbuiltin
+from collections import deque
+from multiprocessing import get_context
+from multiprocessing.connection import Connection, wait
+from multiprocessing.context import DefaultContext
+from pathlib import Path
+import hashlib
+import json
+import os
+import sys
+import time
+from ..model import SymbolType
+from ..utils.files import atomicWrite
+
+# --
+# # Introspection
+#
+# Introspection extracts the runtime API of modules, which requires importing
+# them. As imports run arbitrary code, which may be slow, hang, crash or have
+# side effects, modules are imported in a pool of worker processes. Each
+# module is bounded by a timeout from the moment its worker starts importing
+# it: a worker that is stuck past its timeout is killed and replaced, as is
+# a worker that dies, so that neither stalls the rest of the run. Submodules
+# are discovered on the file system rather than by importing packages, and
+# results are cached by the hash of the module file.
+
+# Bump this when the records change, to invalidate the cache
+INSPECT_VERSION: str = "1"
+
+
+class Record(NamedTuple):
+    """A symbol extracted by introspection, where `type` is
+    a `SymbolType` value."""
+
+    qualname: str
+    type: str
+    line: int = -1
+
+
+class Result(NamedTuple):
+    module: str
+    path: str
+    records: list[Record] | None
+    error: str | None = None
+
+
+# The result of `Introspector.Worker`: the records as tuples, or the error
+TWorkerResult = tuple[list[tuple[str, str, int]] | None, str | None]
+
+
+def submodules(name: str) -> Iterator[tuple[str, str]]:
+    """Yields the `(name, path)` of the given module and of its submodules,
+    without importing them."""
+    parts = name.split(".")
+    spec = find_spec(parts[0])
+    if spec is None or spec.origin is None:
+        return
+    origin = Path(spec.origin)
+    base = origin.parent if origin.name == "__init__.py" else origin
+    for part in parts[1:]:
+        base = base / part
+    if base.is_dir():
+        stack: list[tuple[str, Path]] = [(name, base)]
+        while stack:
+            module, path = stack.pop()
+            if (init := path / "__init__.py").exists():
+                yield module, str(init)
+            children: list[tuple[str, Path]] = []
+            with os.scandir(path) as entries:
+                for entry in sorted(entries, key=lambda _: _.name):
+                    if entry.name.startswith("__"):
+                        continue
+                    elif entry.is_file() and entry.name.endswith(".py"):
+                        yield f"{module}.{entry.name[:-3]}", entry.path
+                    elif entry.is_dir() and os.path.exists(
+                        os.path.join(entry.path, "__init__.py")
+                    ):
+                        children.append((f"{module}.{entry.name}", Path(entry.path)))
+            stack.extend(reversed(children))
+    elif (path := base.with_suffix(".py")).exists():
+        yield name, str(path)
+
+
+class WorkerProcess:
+    """A worker process introspecting the modules it's sent, one at
+    a time, along with the task it's running."""
+
+    def __init__(self, context: DefaultContext):
+        self.connection, child = context.Pipe()
+        self.process = context.Process(
+            target=Introspector.Serve, args=(child,), daemon=True
+        )
+        self.process.start()
+        # Only the worker keeps its end, so that its death closes the pipe
+        child.close()
+        # The `(name, path, cache key)` of the current module
+        self.task: tuple[str, str, str | None] | None = None
+        self.started: float = 0.0
+        self.tasks: int = 0
+
+    def submit(self, task: tuple[str, str, str | None]) -> None:
+        self.connection.send(task[0])
+        self.task = task
+        self.started = time.monotonic()
+        self.tasks += 1
+
+    def stop(self, graceful: bool = True) -> None:
+        """Stops the worker, asking it to exit when `graceful`, and killing
+        it otherwise (or if it doesn't exit)."""
+        if graceful and self.process.is_alive():
+            try:
+                self.connection.send(None)
+            except OSError:
+                pass
+            self.process.join(1.0)
+        if self.process.is_alive():
+            self.process.kill()
+        self.process.join()
+        self.connection.close()
+
+
+def lineOf(value: Any, path: str | None) -> int:
+    """Returns the line where the function is defined in the module at
+    `path`, or -1 if it's defined elsewhere (like generated methods)."""
+    code = getattr(getattr(value, "__func__", value), "__code__", None)
+    return code.co_firstlineno if code and code.co_filename == path else -1
+
+
+class Introspector:
+    @staticmethod
+    def Module(name: str) -> list[Record]:
+        """Imports the module and returns the records of the symbols it
+        defines. Classes and functions imported from other modules are
+        skipped, as they are references rather than definitions."""
+        module = import_module(name)
+        path: str | None = getattr(module, "__file__", None)
+        res: list[Record] = [Record(name, SymbolType.Module.value, 0)]
+        seen: set[int] = set()
+        # Each entry is `(qualname, value, is class)`
+        stack: list[tuple[str, Any, bool]] = [(name, module, False)]
+        while stack:
+            scope, value, in_class = stack.pop()
+            for slot, child in list(vars(value).items()):
+                if slot.startswith("__") and slot.endswith("__"):
+                    continue
+                qualname = f"{scope}.{slot}"
+                if ismodule(child):
+                    continue
+                elif isclass(child):
+                    if getattr(child, "__module__", None) != name:
+                        continue
+                    res.append(Record(qualname, SymbolType.Class.value))
+                    if id(child) not in seen:
+                        seen.add(id(child))
+                        stack.append((qualname, child, True))
+                elif isinstance(child, (staticmethod, classmethod)) or (
+                    in_class and isfunction(child)
+                ):
+                    res.append(
+                        Record(qualname, SymbolType.Method.value, lineOf(child, path))
+                    )
+                elif isfunction(child) or ismethod(child) or isbuiltin(child):
+                    if getattr(child, "__module__", None) != name:
+                        continue
+                    res.append(
+                        Record(qualname, SymbolType.Function.value, lineOf(child, path))
+                    )
+                elif isinstance(child, property):
+                    res.append(Record(qualname, SymbolType.Property.value))
+                elif in_class:
+                    res.append(Record(qualname, SymbolType.Attribute.value))
+                else:
+                    res.append(
+                        Record(
+                            qualname,
+                            (
+                                SymbolType.Constant
+                                if slot.isupper()
+                                else SymbolType.Variable
+                            ).value,
+                        )
+                    )
+        return res
+
+    @staticmethod
+    def Worker(name: str) -> TWorkerResult:
+        """Runs in a worker, returning records as plain tuples, or the error."""
+        try:
+            return [tuple(_) for _ in Introspector.Module(name)], None  # type: ignore
+        except BaseException as e:
+            return None, f"{e.__class__.__name__}: {e}"
+
+    @staticmethod
+    def Init() -> None:
+        """Initializes a worker, silencing the output of imports."""
+        sys.stdout = open(os.devnull, "wt")
+
+    @staticmethod
+    def Serve(connection: Connection) -> None:
+        """Runs in a worker, introspecting the modules received on the
+        connection and sending back the results, until it receives `None`."""
+        Introspector.Init()
+        while (name := connection.recv()) is not None:
+            connection.send(Introspector.Worker(name))
+
+    @staticmethod
+    def Key(name: str, path: str) -> str | None:
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+        except OSError:
+            return None
+        h = hashlib.blake2b(digest_size=16)
+        h.update(f"{INSPECT_VERSION}:{sys.version}:{name}\0".encode("utf8"))
+        h.update(data)
+        return h.hexdigest()
+
+    @staticmethod
+    def Run(
+        modules: Iterable[tuple[str, str]],
+        *,
+        jobs: int | None = None,
+        timeout: float = 30.0,
+        tasksPerWorker: int | None = 8,
+        cache: str | Path | None = None,
+    ) -> Iterator[Result]:
+        """Introspects the given `(name, path)` modules in a pool of `jobs`
+        worker processes, yielding results as they're collected. Modules
+        that fail, crash their worker, or take longer than `timeout` seconds
+        once their worker started them yield a result with an error, the
+        worker being replaced. Workers are also replaced after
+        `tasksPerWorker` modules, limiting how import side effects
+        accumulate. Records are cached in the `cache` directory, keyed by
+        the hash of the module file (the modules it imports are not part of
+        the key)."""
+        cache_path = Path(cache) if cache else None
+        pending: deque[tuple[str, str, str | None]] = deque()
+        for name, path in modules:
+            key = Introspector.Key(name, path) if cache_path else None
+            if cache_path and key and (cache_path / f"{key}.json").exists():
+                try:
+                    with open(cache_path / f"{key}.json", "rt") as f:
+                        records = [Record(*_) for _ in json.load(f)]
+                    yield Result(name, path, records)
+                    continue
+                except ValueError:
+                    pass
+            pending.append((name, path, key))
+        context = get_context()
+        size: int = jobs or os.cpu_count() or 1
+        workers: list[WorkerProcess] = []
+        try:
+            while pending or workers:
+                # Idle workers take the next modules, and workers are
+                # started as needed.
+                for worker in workers:
+                    if pending and worker.task is None:
+                        worker.submit(pending.popleft())
+                while pending and len(workers) < size:
+                    workers.append(worker := WorkerProcess(context))
+                    worker.submit(pending.popleft())
+                if not (busy := [_ for _ in workers if _.task is not None]):
+                    break
+                deadline = min(_.started for _ in busy) + timeout
+                ready = wait(
+                    [_.connection for _ in busy],
+                    max(0.0, deadline - time.monotonic()),
+                )
+                for worker in busy:
+                    assert worker.task is not None
+                    name, path, key = worker.task
+                    tuples: list[tuple[str, str, int]] | None = None
+                    error: str | None = None
+                    # Whether the worker died, or is stuck on the module
+                    lost: bool = False
+                    if worker.connection in ready:
+                        try:
+                            tuples, error = worker.connection.recv()
+                        except (EOFError, OSError):
+                            worker.process.join(1.0)
+                            code = worker.process.exitcode
+                            error, lost = f"Worker crashed (exit code {code})", True
+                    elif time.monotonic() - worker.started >= timeout:
+                        error, lost = f"Timed out after {timeout}s", True
+                    else:
+                        continue
+                    worker.task = None
+                    if lost or (tasksPerWorker and worker.tasks >= tasksPerWorker):
+                        worker.stop(graceful=not lost)
+                        workers.remove(worker)
+                    if tuples is None:
+                        yield Result(name, path, None, error)
+                        continue
+                    if cache_path and key:
+                        atomicWrite(cache_path / f"{key}.json", json.dumps(tuples))
+                    yield Result(name, path, [Record(*_) for _ in tuples])
+        finally:
+            for worker in workers:
+                worker.stop(graceful=worker.task is None)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Introspects the API of modules")
+    parser.add_argument("modules", nargs="+")
+    parser.add_argument("-j", "--jobs", type=int, default=None)
+    parser.add_argument("-t", "--timeout", type=float, default=30.0)
+    parser.add_argument("-c", "--cache", help="Cache directory")
+    args = parser.parse_args()
+    t = time.monotonic()
+    count = 0
+    for result in Introspector.Run(
+        (_ for name in args.modules for _ in submodules(name)),
+        jobs=args.jobs,
+        timeout=args.timeout,
+        cache=args.cache,
+    ):
+        if result.records is None:
+            print(f"!!! {result.module}: {result.error}", file=sys.stderr)
+        else:
+            count += len(result.records)
+            for record in result.records:
+                print(f"{record.type}\t{record.qualname}\t{result.path}:{record.line}")
+    print(f"--- {count} symbols in {time.monotonic() - t:.3f}s", file=sys.stderr)
+
+# EOF
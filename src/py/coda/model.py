@@ -1,6 +1,12 @@
-from typing import NamedTuple, Iterator
+from typing import NamedTuple, Iterator, BinaryIO, ClassVar
 from pathlib import Path
+from array import array
+from bisect import bisect_left
 from enum import Enum
+import os
+import struct
+import sys
+from .utils.profile import PROFILER, count, counted
 
 
 # --
@@ -17,6 +23,7 @@ class Fragment(NamedTuple):
     path: str | None = None
 
     @staticmethod
+    @counted("fragment.find.found", calls="fragment.find")
     def Find(
         path: Path, pattern: str, *, base: Path | None = None
     ) -> Iterator["Fragment"]:
@@ -25,6 +32,8 @@ class Fragment(NamedTuple):
         pattern = pattern.replace("\\/", "/").replace("\\\\","\\")
         offset: int = 0
         rel_path = path.relative_to(base) if base else path
+        if PROFILER.enabled:
+            count("fragment.find.bytes", os.path.getsize(path))
         if pattern.startswith("/^") and pattern.endswith('$/;"'):
             pat = pattern[2:-4]
             with open(path, "rt") as f:
@@ -241,4 +250,423 @@ class SymbolType(Enum):
     Variable = "Var"
 
 
+# --
+# ## Symbol Index
+#
+# Definitions and references are what consumers (cross-linking,
+# search-as-you-type) need to look up. The index stores them in columns of
+# integer arrays rather than as one object per symbol, so that it can hold
+# millions of symbols and be saved to/loaded from a compact binary form.
+
+
+class Definition(NamedTuple):
+    """A symbol definition, identified by its fully qualified name."""
+
+    qualname: str
+    type: SymbolType | None = None
+    fragment: Fragment | None = None
+
+    @property
+    def name(self) -> str:
+        return self.qualname.rsplit(".", 1)[-1]
+
+    @property
+    def parent(self) -> str | None:
+        i = self.qualname.rfind(".")
+        return self.qualname[:i] if i > 0 else None
+
+
+class Reference(NamedTuple):
+    """A reference to a defined symbol at a given fragment."""
+
+    qualname: str
+    fragment: Fragment
+
+
+SYMBOL_TYPES: list[SymbolType] = list(SymbolType)
+SYMBOL_TYPE_CODES: dict[SymbolType, int] = {v: i for i, v in enumerate(SYMBOL_TYPES)}
+
+
+def group(keys: "array[int]", count: int) -> tuple["array[int]", "array[int]"]:
+    """Groups the positions of `keys` (in `[0,count[`, negative keys being
+    skipped) using a counting sort, returning `(starts, order)` where the
+    positions with key `k` are `order[starts[k]:starts[k+1]]`."""
+    starts = array("i", bytes(4 * (count + 1)))
+    for k in keys:
+        if k >= 0:
+            starts[k + 1] += 1
+    for i in range(count):
+        starts[i + 1] += starts[i]
+    cursor = array("i", starts[:-1])
+    order = array("i", bytes(4 * starts[count]))
+    for i, k in enumerate(keys):
+        if k >= 0:
+            order[cursor[k]] = i
+            cursor[k] += 1
+    return starts, order
+
+
+class SymbolIndex:
+    """Stores symbol definitions and references, supporting lookup by
+    qualname, by name and by qualname prefix, as well as listing
+    the references of a definition."""
+
+    MAGIC: ClassVar[bytes] = b"CODASYM\x01"
+    HEADER: ClassVar[struct.Struct] = struct.Struct("<8sIIIII")
+
+    def __init__(self) -> None:
+        # Definitions, one column per field, indexed by definition id.
+        self.qualnames: list[str] = []
+        self.types: array[int] = array("b")
+        self.paths: array[int] = array("i")
+        self.offsets: array[int] = array("i")
+        self.lengths: array[int] = array("i")
+        self.lines: array[int] = array("i")
+        self.columns: array[int] = array("i")
+        # References, indexed by reference id. The `refSymbols` column holds
+        # the id of the referenced definition.
+        self.refSymbols: array[int] = array("i")
+        self.refPaths: array[int] = array("i")
+        self.refOffsets: array[int] = array("i")
+        self.refLengths: array[int] = array("i")
+        self.refLines: array[int] = array("i")
+        self.refColumns: array[int] = array("i")
+        # Paths are interned, as there are many more symbols than files.
+        self.pathNames: list[str] = []
+        self.pathIds: dict[str, int] = {}
+        self.ids: dict[str, int] = {}
+        # These are derived lazily, and reset on updates
+        self._names: dict[str, list[int]] | None = None
+        self._sorted: list[str] | None = None
+        self._order: array[int] | None = None
+        self._refStarts: array[int] | None = None
+        self._refOrder: array[int] | None = None
+        self._pathStarts: array[int] | None = None
+        self._pathOrder: array[int] | None = None
+        self._refPathStarts: array[int] | None = None
+        self._refPathOrder: array[int] | None = None
+
+    # --
+    # ### Updates
+
+    def path(self, path: str | None) -> int:
+        """Returns the interned id for the given path, -1 for `None`."""
+        if path is None:
+            return -1
+        elif (i := self.pathIds.get(path)) is not None:
+            return i
+        else:
+            self.pathIds[path] = i = len(self.pathNames)
+            self.pathNames.append(path)
+            return i
+
+    def define(
+        self,
+        qualname: str,
+        type: SymbolType | None = None,
+        fragment: Fragment | None = None,
+    ) -> int:
+        """Registers a definition, returning its id. Qualnames are unique,
+        so defining an existing qualname returns the existing id."""
+        if (i := self.ids.get(qualname)) is not None:
+            return i
+        self.ids[qualname] = i = len(self.qualnames)
+        self.qualnames.append(qualname)
+        self.types.append(-1 if type is None else SYMBOL_TYPE_CODES[type])
+        if fragment is None:
+            self.paths.append(-1)
+            self.offsets.append(-1)
+            self.lengths.append(0)
+            self.lines.append(-1)
+            self.columns.append(-1)
+        else:
+            self.paths.append(self.path(fragment.path))
+            self.offsets.append(fragment.offset)
+            self.lengths.append(fragment.length)
+            self.lines.append(fragment.line)
+            self.columns.append(fragment.column)
+        if self._names is not None:
+            self._names.setdefault(qualname.rsplit(".", 1)[-1], []).append(i)
+        self._sorted = None
+        self._order = None
+        self._pathStarts = None
+        self._pathOrder = None
+        self._refPathStarts = None
+        self._refPathOrder = None
+        return i
+
+    def add(self, definition: Definition) -> int:
+        return self.define(definition.qualname, definition.type, definition.fragment)
+
+    def reference(self, symbol: str | int, fragment: Fragment) -> int:
+        """Registers a reference to the given symbol (qualname or id) at the
+        given fragment, returning the reference id."""
+        sid: int = self.ids[symbol] if isinstance(symbol, str) else symbol
+        if sid < 0 or sid >= len(self.qualnames):
+            raise IndexError(f"Undefined symbol id: {sid}")
+        i = len(self.refSymbols)
+        self.refSymbols.append(sid)
+        self.refPaths.append(self.path(fragment.path))
+        self.refOffsets.append(fragment.offset)
+        self.refLengths.append(fragment.length)
+        self.refLines.append(fragment.line)
+        self.refColumns.append(fragment.column)
+        self._refStarts = None
+        self._refOrder = None
+        self._refPathStarts = None
+        self._refPathOrder = None
+        return i
+
+    # --
+    # ### Queries
+
+    def __len__(self) -> int:
+        return len(self.qualnames)
+
+    def __contains__(self, qualname: str) -> bool:
+        return qualname in self.ids
+
+    def __getitem__(self, symbol: str | int) -> Definition:
+        return self.definition(self.ids[symbol] if isinstance(symbol, str) else symbol)
+
+    def get(self, qualname: str) -> Definition | None:
+        i = self.ids.get(qualname)
+        return None if i is None else self.definition(i)
+
+    def definition(self, i: int) -> Definition:
+        """Returns the definition with the given id."""
+        t = self.types[i]
+        p = self.paths[i]
+        return Definition(
+            self.qualnames[i],
+            None if t < 0 else SYMBOL_TYPES[t],
+            (
+                None
+                if self.offsets[i] < 0
+                else Fragment(
+                    offset=self.offsets[i],
+                    length=self.lengths[i],
+                    line=self.lines[i],
+                    column=self.columns[i],
+                    path=None if p < 0 else self.pathNames[p],
+                )
+            ),
+        )
+
+    def named(self, name: str) -> list[Definition]:
+        """Returns the definitions with the given (unqualified) name."""
+        return [self.definition(_) for _ in self.namedIds(name)]
+
+    def namedIds(self, name: str) -> list[int]:
+        """Returns the ids of the definitions with the given (unqualified) name."""
+        if self._names is None:
+            names: dict[str, list[int]] = {}
+            for i, qualname in enumerate(self.qualnames):
+                names.setdefault(qualname.rsplit(".", 1)[-1], []).append(i)
+            self._names = names
+        return self._names.get(name, [])
+
+    def definedIn(self, path: str) -> "array[int]":
+        """Returns the ids of the definitions located in the given path,
+        in definition order."""
+        if (p := self.pathIds.get(path)) is None:
+            return array("i")
+        if self._pathStarts is None or self._pathOrder is None:
+            self._pathStarts, self._pathOrder = group(self.paths, len(self.pathNames))
+        return self._pathOrder[self._pathStarts[p] : self._pathStarts[p + 1]]
+
+    def prefixed(self, prefix: str, limit: int | None = None) -> Iterator[Definition]:
+        """Iterates on the definitions whose qualname starts with `prefix`,
+        in lexicographic order. This is a binary search over the sorted
+        qualnames, so `O(log n)` plus the number of results."""
+        order = self.order()
+        if self._sorted is None:
+            self._sorted = [self.qualnames[_] for _ in order]
+        sorted_names = self._sorted
+        n = len(sorted_names)
+        i = bisect_left(sorted_names, prefix)
+        j = i + n if limit is None else i + limit
+        while i < n and i < j and sorted_names[i].startswith(prefix):
+            yield self.definition(order[i])
+            i += 1
+
+    def referencedFrom(self, path: str) -> "array[int]":
+        """Returns the ids of the references located in the given path."""
+        if (p := self.pathIds.get(path)) is None:
+            return array("i")
+        if self._refPathStarts is None or self._refPathOrder is None:
+            self._refPathStarts, self._refPathOrder = group(
+                self.refPaths, len(self.pathNames)
+            )
+        return self._refPathOrder[self._refPathStarts[p] : self._refPathStarts[p + 1]]
+
+    def order(self) -> "array[int]":
+        """Returns the definition ids sorted by qualname."""
+        if self._order is None:
+            self._order = array(
+                "i", sorted(range(len(self.qualnames)), key=self.qualnames.__getitem__)
+            )
+        return self._order
+
+    def references(self, symbol: str | int) -> list[Reference]:
+        """Returns the references to the given symbol (qualname or id)."""
+        sid = self.ids.get(symbol, -1) if isinstance(symbol, str) else symbol
+        if sid < 0 or sid >= len(self.qualnames):
+            return []
+        if self._refStarts is None or self._refOrder is None:
+            self._refStarts, self._refOrder = group(self.refSymbols, len(self.qualnames))
+        qualname = self.qualnames[sid]
+        return [
+            Reference(
+                qualname,
+                Fragment(
+                    offset=self.refOffsets[r],
+                    length=self.refLengths[r],
+                    line=self.refLines[r],
+                    column=self.refColumns[r],
+                    path=None if (p := self.refPaths[r]) < 0 else self.pathNames[p],
+                ),
+            )
+            for r in self._refOrder[self._refStarts[sid] : self._refStarts[sid + 1]]
+        ]
+
+    # --
+    # ### Serialization
+
+    def _columns(self) -> tuple[list["array[int]"], list["array[int]"]]:
+        """Returns the definitions and references integer columns, in the
+        order in which they are serialized."""
+        return (
+            [
+                self.types,
+                self.paths,
+                self.offsets,
+                self.lengths,
+                self.lines,
+                self.columns,
+                self.order(),
+            ],
+            [
+                self.refSymbols,
+                self.refPaths,
+                self.refOffsets,
+                self.refLengths,
+                self.refLines,
+                self.refColumns,
+            ],
+        )
+
+    def write(self, stream: BinaryIO) -> int:
+        """Writes the index in binary form to the given stream, returning
+        the number of bytes written. Sections are padded to 4 bytes so that
+        the integer columns can be used in place when mapped."""
+        names = "\0".join(self.qualnames).encode("utf8")
+        paths = "\0".join(self.pathNames).encode("utf8")
+        n = stream.write(
+            self.HEADER.pack(
+                self.MAGIC,
+                len(self.qualnames),
+                len(self.refSymbols),
+                len(self.pathNames),
+                len(names),
+                len(paths),
+            )
+        )
+        definitions, references = self._columns()
+        for section in [names, paths] + definitions + references:
+            if isinstance(section, array):
+                if sys.byteorder == "big":
+                    section = array(section.typecode, section)
+                    section.byteswap()
+                section = section.tobytes()
+            n += stream.write(section)
+            n += stream.write(bytes(-n % 4))
+        return n
+
+    @classmethod
+    def Read(cls, stream: BinaryIO) -> "SymbolIndex":
+        """Reads an index that was written with `write`."""
+        return cls.FromBuffer(memoryview(stream.read()))
+
+    @classmethod
+    def FromBuffer(cls, buffer: memoryview, *, copy: bool = True) -> "SymbolIndex":
+        """Loads an index from the given buffer. When `copy` is false, the
+        integer columns are views on the buffer, and the resulting index
+        is read-only."""
+        magic, ndefs, nrefs, npaths, nnames, nbpaths = cls.HEADER.unpack_from(buffer)
+        if magic != cls.MAGIC:
+            raise ValueError(f"Not a symbol index, got magic: {bytes(magic)!r}")
+        # Views can't be byteswapped
+        copy = copy or sys.byteorder == "big"
+        o: int = cls.HEADER.size
+        o += -o % 4
+        index = cls()
+        # Offsets are advanced separately, as compiled code (mypyc) does not
+        # evaluate `buffer[o : (o := o + n)]` left to right.
+        names = str(buffer[o : o + nnames], "utf8")
+        o += nnames
+        o += -o % 4
+        paths = str(buffer[o : o + nbpaths], "utf8")
+        o += nbpaths
+        o += -o % 4
+        index.qualnames = names.split("\0") if ndefs else []
+        index.pathNames = paths.split("\0") if npaths else []
+        index.ids = {k: i for i, k in enumerate(index.qualnames)}
+        index.pathIds = {k: i for i, k in enumerate(index.pathNames)}
+        # The sorted order is serialized as well, so that prefix search does
+        # not need to sort again after loading.
+        index._order = array("i")
+        definitions, references = index._columns()
+        loaded: list[array[int] | memoryview] = []
+        for n, columns in ((ndefs, definitions), (nrefs, references)):
+            for column in columns:
+                data = buffer[o : o + n * column.itemsize]
+                o += n * column.itemsize
+                o += -o % 4
+                if copy:
+                    column.frombytes(data)
+                    if sys.byteorder == "big":
+                        column.byteswap()
+                    loaded.append(column)
+                else:
+                    # Typecodes are integer ones, which typeshed can't tell
+                    loaded.append(data.cast(column.typecode))  # type: ignore[arg-type]
+        (
+            index.types,
+            index.paths,
+            index.offsets,
+            index.lengths,
+            index.lines,
+            index.columns,
+            index._order,
+            index.refSymbols,
+            index.refPaths,
+            index.refOffsets,
+            index.refLengths,
+            index.refLines,
+            index.refColumns,
+        ) = loaded  # type: ignore[assignment]
+        return index
+
+    @classmethod
+    def Map(cls, path: str | Path) -> "SymbolIndex":
+        """Maps the index file at the given path in memory. The integer
+        columns are views on the mapping, so processes mapping the same
+        file share them. The resulting index is read-only."""
+        import mmap
+
+        with open(path, "rb") as f:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return cls.FromBuffer(memoryview(mapped), copy=False)
+
+    def save(self, path: str | Path) -> int:
+        with open(path, "wb") as f:
+            return self.write(f)
+
+    @classmethod
+    def Load(cls, path: str | Path) -> "SymbolIndex":
+        with open(path, "rb") as f:
+            return cls.Read(f)
+
+
 # EOF
@@ -1,6 +1,7 @@
 from typing import Iterable, Iterator, NamedTuple
 import re
 from ..model import Fragment
+from ..utils.profile import counted
 
 
 RE_CODA_START = re.compile(r"^(?P<space>[ \t]*)#[ \t]?--+([ \t]*(?P<meta>.*))?$")
@@ -30,9 +31,22 @@ class CodaLine(NamedTuple):
 BlockLine = CodaLine | TextLine
 
 
+def splitLines(text: str) -> list[str]:
+    """Splits the text into lines ending with `\n`, so that the offsets of
+    the lines match the text. Unlike `str.splitlines`, other line breaks
+    (`\r`, `\x0c`, `\u2028`…) are kept within the lines."""
+    lines = text.split("\n")
+    last = lines.pop()
+    res = [f"{_}\n" for _ in lines]
+    if last:
+        res.append(last)
+    return res
+
+
 class BlockParser:
 
     @staticmethod
+    @counted("blocks.lines", "blocks.chars", lambda _: len(_.text))
     def Lines(
         lines: Iterable[str], *, path: str | None = None, eol: bool = True
     ) -> Iterator[Line]:
@@ -64,6 +78,7 @@ class BlockParser:
                 yield TextLine(line)
 
     @staticmethod
+    @counted("blocks")
     def Blocks(lines: Iterator[BlockLine]) -> Iterator[Block]:
         first: BlockLine | None = None
         last: BlockLine | None = None
@@ -110,10 +125,12 @@ class BlockParser:
 # TODO: Given a code block, find the symbols defined
 if __name__ == "__main__":
     import sys
+    from ..utils.profile import options, span
 
-    for path in sys.argv[1:]:
+    # Usage: blocks.py [--profile] [--trace TRACE] PATH…
+    for path in options(sys.argv[1:]):
         i = 0
-        with open(path) as f:
+        with span("blocks", path=path), open(path) as f:
             for b in BlockParser.Blocks(
                 BlockParser.BlockLines(BlockParser.Lines(f.readlines(), path=path))
             ):
@@ -2,10 +2,18 @@ from typing import NamedTuple, Iterator
 from pathlib import Path
 from subprocess import run
 from enum import Enum
-from glob import glob
+from glob import has_magic
+import os
+import re
 
 from ..model import Fragment
-from ..utils.export import asPrimitive
+from ..collect.files import Files, globRegex
+from ..utils.files import atomicWrite
+from ..utils.profile import count, span
+
+# The number of paths given to each ctags run
+BATCH_SIZE: int = 10_000
+RE_HIDDEN = re.compile(r"(^|/)\.[^./]")
 
 
 class TagSymbolType(Enum):
@@ -30,28 +38,145 @@ class TagEntry(NamedTuple):
 
 class Tags:
 
-    # TODO: Support tag file location
-    @classmethod
-    def Make(cls, *paths: str | Path) -> Iterator[TagEntry]:
-        """Generates ctags content for a list of file paths (including globs)."""
-        expanded_paths = []
+    @staticmethod
+    def Expand(*paths: str | Path) -> list[str]:
+        """Expands the given paths and globs (where `**` matches any number of
+        directories) into a list of unique paths. All the globs are matched
+        in a single traversal of each distinct base directory, and like
+        `glob`, wildcards don't match hidden files unless the pattern does.
+        Unlike `glob`:
+
+        - a leading `./` is stripped, so `./a.py` and `a.py` are the same,
+        - directories matched by a pattern (like `src/*`) are expanded into
+          all the files below them, as ctags would recurse into them,
+          skipping the pruned directories (see `Files.Walk`),
+        - paths without wildcards, including directories, are passed
+          through unchanged when they exist."""
+        res: dict[str, None] = {}
+        # The patterns by base directory, each with its expression and
+        # whether it can match hidden files.
+        patterns: dict[str, list[tuple[re.Pattern[str], bool]]] = {}
         for path in paths:
-            expanded_paths.extend(
-                glob(str(path), recursive=True)
-            )  # Expand glob patterns
-
-        result = run(
-            ["ctags", "-R"] + [str(_) for _ in expanded_paths],
-            capture_output=True,
-            text=True,
-            check=True,
-        )
+            pattern = str(path)
+            pattern = pattern[2:] if pattern.startswith("./") else pattern
+            if not has_magic(pattern):
+                if os.path.exists(pattern):
+                    res[pattern] = None
+                continue
+            parts = pattern.split("/")
+            i = next(i for i, _ in enumerate(parts) if has_magic(_))
+            base = "/".join(parts[:i]) or ("/" if pattern.startswith("/") else ".")
+            patterns.setdefault(base, []).append(
+                (
+                    # Matched directories are expanded to their files, as
+                    # ctags would recurse into them.
+                    re.compile(
+                        globRegex("/".join(parts[i:])) + "(?:/.*)?", re.DOTALL
+                    ),
+                    bool(RE_HIDDEN.search(pattern)),
+                )
+            )
+        # Bases that are within another base are walked as part of it, and
+        # the patterns are then matched after the base's relative prefix.
+        roots: dict[str, list[tuple[str, re.Pattern[str], bool]]] = {}
+        for base in sorted(patterns):
+            root = next((_ for _ in roots if Tags.IsWithin(base, _)), base)
+            prefix = (
+                ""
+                if base == root
+                else (base if root == "." else base[len(root) :].lstrip("/")) + "/"
+            )
+            roots.setdefault(root, []).extend(
+                (prefix, regexp, hidden) for regexp, hidden in patterns[base]
+            )
+        for root, matchers in roots.items():
+            if not os.path.isdir(root):
+                continue
+            for rel in Files.Walk(root, gitignore=False):
+                is_hidden = bool(RE_HIDDEN.search(rel))
+                for prefix, regexp, hidden in matchers:
+                    if (
+                        rel.startswith(prefix)
+                        and (hidden or not is_hidden)
+                        and regexp.fullmatch(rel, len(prefix))
+                    ):
+                        res[rel if root == "." else os.path.join(root, rel)] = None
+                        break
+        return list(res)
+
+    @staticmethod
+    def IsWithin(path: str, base: str) -> bool:
+        """Tells if the (normalized) `path` is `base` or within it."""
+        if base == ".":
+            return not path.startswith(("/", ".."))
+        return path == base or path.startswith(f"{base.rstrip('/')}/")
+
+    @classmethod
+    def Make(
+        cls,
+        *paths: str | Path,
+        output: str | Path = "tags",
+        batch: int = BATCH_SIZE,
+        changed: set[str] | None = None,
+    ) -> Iterator[TagEntry]:
+        """Generates ctags content for a list of file paths (including globs)
+        in the `output` tags file. Paths are given to ctags as file lists on
+        its input, in batches that are appended to the same tags file. When
+        the `changed` paths are given, only these are tagged again, updating
+        the existing tags file (ctags doesn't run when none of them is part
+        of the paths). Paths in the tags file are relative to its directory,
+        which is how `Parse` resolves them."""
+        with span("tags.expand"):
+            expanded_paths = cls.Expand(*paths)
+        count("tags.files", len(expanded_paths))
+        append: bool = False
+        if changed is not None and os.path.exists(output):
+            directory = os.path.dirname(os.path.abspath(output))
+            cls.Remove(
+                output,
+                {os.path.relpath(os.path.abspath(_), directory) for _ in changed},
+            )
+            normalized = {os.path.normpath(_) for _ in changed}
+            expanded_paths = [
+                _ for _ in expanded_paths if os.path.normpath(_) in normalized
+            ]
+            append = True
+        # Without any path, ctags still runs to create an empty tags file
+        runs = len(expanded_paths) if append else max(1, len(expanded_paths))
+        for i in range(0, runs, batch):
+            with span("tags.ctags", batch=i // batch):
+                result = run(
+                    ["ctags", "-R", "--tag-relative=yes", "-f", str(output), "-L", "-"]
+                    + (["--append=yes"] if i or append else []),
+                    input="\n".join(expanded_paths[i : i + batch]),
+                    capture_output=True,
+                    text=True,
+                )
+            if result.returncode != 0:
+                raise RuntimeError(
+                    "ctags execution failed with error:\n" + result.stderr
+                )
+        yield from cls.ParseFile(output)
 
-        if result.returncode == 0:
-            for _ in cls.ParseFile("tags"):
-                yield _
-        else:
-            raise RuntimeError("ctags execution failed with error:\n" + result.stderr)
+    @staticmethod
+    def Remove(path: str | Path, paths: set[str]) -> int:
+        """Removes the entries for the given `paths` from the tags file,
+        returning the number of removed entries."""
+        kept: list[str] = []
+        removed: int = 0
+        with open(path, "rt") as f:
+            for line in f:
+                # Entries are `SYMBOL\tPATH\t…`, paths may be prefixed by `./`
+                if not line.startswith("!") and (
+                    (p := line.split("\t", 2)[1]).removeprefix("./") in paths
+                    or p in paths
+                ):
+                    removed += 1
+                else:
+                    kept.append(line)
+        if removed:
+            atomicWrite(path, "".join(kept))
+        return removed
 
     @classmethod
     def ParseFile(cls, path: str | Path) -> Iterator[TagEntry]:
@@ -77,6 +202,7 @@ class Tags:
                 # !_TAG_EXTRA_DESCRIPTION	anonymous	/Include tags for non-named objects like lambda/
                 continue
 
+            count("tags.entries")
             symbol, path, pattern = line.split("\t", 2)
             pattern, t = pattern.strip("\n").rsplit("\t", 1)
             # TODO: We could source the location from the path and regexp
@@ -106,8 +232,11 @@ class Tags:
 
 if __name__ == "__main__":
     import sys, json
+    from ..utils.export import asPrimitive
+    from ..utils.profile import options
 
-    args = sys.argv[1:]
+    # Usage: ctags.py [--profile] [--trace TRACE] [TAGS]
+    args = options(sys.argv[1:])
     if not args:
         paths = ["*.*", "src/**/*.*"]
         for _ in Tags.Make(*paths):
@@ -0,0 +1,218 @@
+from typing import Iterable, Iterator, NamedTuple
+from array import array
+from keyword import kwlist, softkwlist
+import re
+from ..model import Fragment, SymbolIndex
+from .blocks import Block, BlockParser, splitLines
+from ..utils.profile import count, span
+
+# --
+# The reference parser computes the `BLOCK -[references]→ SYMBOL` relation:
+# identifiers found in the text of blocks are resolved against the symbol
+# index, taking into account the definitions that enclose them.
+
+RE_IDENTIFIER = re.compile(r"[A-Za-z_][A-Za-z0-9_]*(?:\.[A-Za-z_][A-Za-z0-9_]*)*")
+KEYWORDS: frozenset[str] = frozenset(kwlist) | frozenset(softkwlist)
+
+
+class Identifier(NamedTuple):
+    offset: int
+    line: int
+    column: int
+    name: str
+
+
+class Edges(NamedTuple):
+    """The references from blocks to symbols, as parallel integer arrays
+    where edge `i` goes from block `blocks[i]` to the definition
+    `symbols[i]`, and is found at `offsets[i]`."""
+
+    blocks: "array[int]"
+    symbols: "array[int]"
+    offsets: "array[int]"
+    lengths: "array[int]"
+    lines: "array[int]"
+    columns: "array[int]"
+
+    @staticmethod
+    def Create() -> "Edges":
+        return Edges(*(array("i") for _ in Edges._fields))
+
+    def __len__(self) -> int:
+        return len(self.symbols)
+
+    def register(self, index: SymbolIndex, path: str | None = None) -> int:
+        """Registers the edges as references in the given index, returning
+        the number of registered references."""
+        for i, symbol in enumerate(self.symbols):
+            index.reference(
+                symbol,
+                Fragment(
+                    offset=self.offsets[i],
+                    length=self.lengths[i],
+                    line=self.lines[i],
+                    column=self.columns[i],
+                    path=path,
+                ),
+            )
+        return len(self.symbols)
+
+
+class ReferenceParser:
+    @staticmethod
+    def Identifiers(
+        text: str, start: int = 0, end: int | None = None, *, line: int = 0
+    ) -> Iterator[Identifier]:
+        """Iterates on the (possibly dotted) identifiers found in `text`
+        between `start` and `end`, where `line` is the line number
+        at `start`."""
+        o: int = start
+        bol: int = text.rfind("\n", 0, start) + 1
+        for match in RE_IDENTIFIER.finditer(
+            text, start, len(text) if end is None else end
+        ):
+            name = match.group()
+            if name in KEYWORDS:
+                continue
+            i = match.start()
+            if (n := text.count("\n", o, i)) > 0:
+                line += n
+                bol = text.rfind("\n", o, i) + 1
+            o = i
+            yield Identifier(i, line, i - bol, name)
+
+    @staticmethod
+    def Resolve(
+        text: str,
+        blocks: Iterable[Block],
+        index: SymbolIndex,
+        *,
+        path: str | None = None,
+        scope: str | None = None,
+    ) -> Edges:
+        """Resolves the identifiers in the given blocks of `text` (the
+        contents of the file at `path`), returning block→symbol edges. The
+        blocks are expected in offset order, so that the file is processed
+        in a single pass. Names are looked up first in the definitions
+        enclosing the identifier (innermost first), then in the module
+        `scope`, then as absolute qualnames, and finally by unique
+        unqualified name."""
+        with span("resolve", path=path or ""):
+            edges = ReferenceParser.Sweep(text, blocks, index, path=path, scope=scope)
+        count("references.resolved", len(edges))
+        return edges
+
+    @staticmethod
+    def Sweep(
+        text: str,
+        blocks: Iterable[Block],
+        index: SymbolIndex,
+        *,
+        path: str | None = None,
+        scope: str | None = None,
+    ) -> Edges:
+        """The single pass of `Resolve`."""
+        edges = Edges.Create()
+        # The definitions of this file, as `(start, end, id)` sorted by start,
+        # which we sweep along with the identifiers to maintain the stack of
+        # enclosing definitions.
+        defined: list[tuple[int, int, int]] = sorted(
+            (index.offsets[_], index.offsets[_] + index.lengths[_], _)
+            for _ in (index.definedIn(path) if path else ())
+            if index.offsets[_] >= 0
+        )
+        definition_lines: dict[int, int] = {_[2]: index.lines[_[2]] for _ in defined}
+        n_defined: int = len(defined)
+        enclosing: list[tuple[int, int, int]] = []
+        j: int = 0
+        # Resolution only depends on the innermost enclosing definition and
+        # the name, so we memoize it for the whole file.
+        resolved: dict[tuple[int, str], int] = {}
+        lookups: int = 0
+        line: int = 0
+        last: int = 0
+        for b, block in enumerate(blocks):
+            start = block.fragment.offset
+            line += text.count("\n", last, start)
+            for ident in ReferenceParser.Identifiers(
+                text, start, start + block.fragment.length, line=line
+            ):
+                o = ident.offset
+                while j < n_defined and defined[j][0] <= o:
+                    enclosing.append(defined[j])
+                    j += 1
+                while enclosing and enclosing[-1][1] <= o:
+                    enclosing.pop()
+                # The stack may contain definitions that are closed but that
+                # were shadowed by a longer-lived definition on top.
+                scopes = [_[2] for _ in enclosing if _[1] > o]
+                key = (scopes[-1] if scopes else -1, ident.name)
+                lookups += 1
+                if (symbol := resolved.get(key)) is None:
+                    resolved[key] = symbol = ReferenceParser.Lookup(
+                        index,
+                        ident.name,
+                        [index.qualnames[_] for _ in reversed(scopes)]
+                        + ([scope] if scope else []),
+                    )
+                if symbol < 0:
+                    continue
+                # We skip the identifiers that are the definition themselves
+                if definition_lines.get(symbol) == ident.line:
+                    continue
+                edges.blocks.append(b)
+                edges.symbols.append(symbol)
+                edges.offsets.append(o)
+                edges.lengths.append(len(ident.name))
+                edges.lines.append(ident.line)
+                edges.columns.append(ident.column)
+            last = start
+        count("resolve.memo.hit", lookups - len(resolved))
+        count("resolve.memo.miss", len(resolved))
+        return edges
+
+    @staticmethod
+    def Lookup(index: SymbolIndex, name: str, scopes: list[str]) -> int:
+        """Returns the id of the definition that `name` refers to when
+        used within the given `scopes` (innermost first), or -1."""
+        ids = index.ids
+        # Attributes accessed through `self` or `cls` are resolved within
+        # the enclosing scopes.
+        if name.startswith("self.") or name.startswith("cls."):
+            name = name.split(".", 1)[1]
+        for scope in scopes:
+            if (i := ids.get(f"{scope}.{name}")) is not None:
+                return i
+        if (i := ids.get(name)) is not None:
+            return i
+        candidates = index.namedIds(name.rsplit(".", 1)[-1])
+        if "." in name:
+            suffix = f".{name}"
+            candidates = [_ for _ in candidates if index.qualnames[_].endswith(suffix)]
+        return candidates[0] if len(candidates) == 1 else -1
+
+
+if __name__ == "__main__":
+    import sys
+    from ..utils.profile import options
+
+    # Usage: references.py [--profile] [--trace TRACE] INDEX PATH…
+    args = options(sys.argv[1:])
+    index = SymbolIndex.Load(args[0])
+    for path in args[1:]:
+        with open(path) as f:
+            text = f.read()
+        blocks = list(
+            BlockParser.Blocks(
+                BlockParser.BlockLines(
+                    BlockParser.Lines(splitLines(text), path=path)
+                )
+            )
+        )
+        edges = ReferenceParser.Resolve(text, blocks, index, path=path)
+        for i, symbol in enumerate(edges.symbols):
+            print(
+                f"{path}:{edges.lines[i] + 1}:{edges.columns[i]}\t{edges.blocks[i]}\t{index.qualnames[symbol]}"
+            )
+
+# EOF
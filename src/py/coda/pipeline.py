@@ -0,0 +1,308 @@
+from typing import Any, Callable, Iterable, Iterator, NamedTuple
+from concurrent.futures import (
+    Executor,
+    Future,
+    ThreadPoolExecutor,
+    wait,
+    FIRST_COMPLETED,
+)
+from pathlib import Path
+import hashlib
+import heapq
+import json
+import os
+from .utils.files import atomicWrite
+from .utils.profile import count, span
+
+# --
+# # Pipeline
+#
+# The pipeline runs stages (parse, extract, link, render) over a set of files.
+# A stage is either per file, taking the results of the stages it requires
+# for the same file, or global, taking the results of its requirements for
+# all the files. This makes a DAG of tasks, which are dispatched to a pool of
+# workers as soon as their requirements are met. Ready tasks are taken from
+# a shared queue by whichever worker is free, the tasks of the latest stages
+# first, so that files move through all the stages concurrently rather than
+# stage by stage. Results are passed in memory, and released once all their
+# dependents ran.
+#
+# Tasks run on threads by default: stages are often closures over their
+# configuration (see the command below), which a process pool can't send to
+# its workers, and results are passed along without being pickled. Stages
+# that are CPU-bound and defined at module level can run on a
+# `ProcessPoolExecutor` given as `executor`.
+
+# The file of a global task
+ALL: str = ""
+
+
+class Stage(NamedTuple):
+    """A stage of the pipeline, where `run(path, inputs)` returns the result
+    for the file at `path` given the results of the `requires` stages by
+    name. For a `shared` stage, `path` is `ALL` and each input maps paths
+    to results. Results of `cached` stages must be JSON values."""
+
+    name: str
+    run: Callable[[str, dict[str, Any]], Any]
+    requires: tuple[str, ...] = ()
+    shared: bool = False
+    cached: bool = False
+    version: str = "1"
+
+
+class Outcome(NamedTuple):
+    stage: str
+    path: str
+    value: Any = None
+    error: BaseException | None = None
+    cached: bool = False
+
+
+class Task(NamedTuple):
+    stage: Stage
+    path: str
+    # The index of the stage in topological order, used as priority
+    rank: int
+
+
+def fileDigest(path: str) -> str:
+    h = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as f:
+        while chunk := f.read(1 << 20):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+class Pipeline:
+    def __init__(self, *stages: Stage, cache: str | Path | None = None):
+        self.stages: dict[str, Stage] = {}
+        for stage in stages:
+            for name in stage.requires:
+                if name not in self.stages:
+                    raise ValueError(
+                        f"Stage '{stage.name}' requires undeclared stage '{name}'"
+                    )
+            self.stages[stage.name] = stage
+        self.cache: Path | None = Path(cache) if cache else None
+        self.keys: dict[tuple[str, str], str] = {}
+
+    def requirements(self, stage: Stage, path: str) -> list[tuple[str, str]]:
+        """Returns the `(stage, path)` tasks the given task depends on."""
+        res: list[tuple[str, str]] = []
+        for name in stage.requires:
+            required = self.stages[name]
+            if required.shared:
+                res.append((name, ALL))
+            elif stage.shared:
+                res.extend((name, _) for _ in self.paths)
+            else:
+                res.append((name, path))
+        return res
+
+    def key(self, stage: Stage, path: str) -> str:
+        """Returns the cache key for the task, derived from the contents of
+        the file and the keys of its requirements."""
+        if (res := self.keys.get((stage.name, path))) is None:
+            h = hashlib.blake2b(digest_size=16)
+            h.update(f"{stage.name}:{stage.version}:{path}\0".encode("utf8"))
+            if path:
+                h.update(fileDigest(path).encode("ascii"))
+            for name, p in self.requirements(stage, path):
+                h.update(self.key(self.stages[name], p).encode("ascii"))
+            self.keys[(stage.name, path)] = res = h.hexdigest()
+        return res
+
+    def cached(self, stage: Stage, path: str) -> tuple[bool, Any]:
+        if not (self.cache and stage.cached):
+            return False, None
+        try:
+            with open(self.cache / f"{self.key(stage, path)}.json", "rt") as f:
+                res = json.load(f)
+        except (OSError, ValueError):
+            count(f"cache.{stage.name}.miss")
+            return False, None
+        count(f"cache.{stage.name}.hit")
+        return True, res
+
+    def store(self, stage: Stage, path: str, value: Any) -> None:
+        if self.cache and stage.cached:
+            atomicWrite(self.cache / f"{self.key(stage, path)}.json", json.dumps(value))
+
+    @staticmethod
+    def Execute(task: Task, inputs: dict[str, Any]) -> Any:
+        with span(task.stage.name, "pipeline", path=task.path):
+            return task.stage.run(task.path, inputs)
+
+    def Run(
+        self,
+        paths: Iterable[str],
+        *,
+        jobs: int | None = None,
+        executor: Executor | None = None,
+    ) -> Iterator[Outcome]:
+        """Runs the pipeline over the given files, yielding the outcome of
+        each task as it completes. Tasks run on the given `executor`, or on
+        a pool of threads, with at most `jobs` tasks submitted at once
+        (which should match the workers of the `executor`). When a task
+        fails, the tasks that depend on it are not run."""
+        self.paths: list[str] = list(dict.fromkeys(paths))
+        # Files may have changed since the previous run
+        self.keys.clear()
+        ranks = {name: i for i, name in enumerate(self.stages)}
+        tasks: dict[tuple[str, str], Task] = {}
+        for stage in self.stages.values():
+            for path in [ALL] if stage.shared else self.paths:
+                tasks[(stage.name, path)] = Task(stage, path, ranks[stage.name])
+        # The number of unmet requirements and the dependents of each task
+        waiting: dict[tuple[str, str], int] = {}
+        dependents: dict[tuple[str, str], list[tuple[str, str]]] = {
+            _: [] for _ in tasks
+        }
+        for k, task in tasks.items():
+            requirements = self.requirements(task.stage, task.path)
+            waiting[k] = len(requirements)
+            for _ in requirements:
+                dependents[_].append(k)
+        # Ready tasks, the latest stages first and then in file order
+        order = {p: i for i, p in enumerate(self.paths)}
+        ready: list[tuple[int, int, tuple[str, str]]] = [
+            (-tasks[k].rank, order.get(k[1], -1), k)
+            for k, n in waiting.items()
+            if not n
+        ]
+        heapq.heapify(ready)
+        results: dict[tuple[str, str], Any] = {}
+        # The number of dependents that still need each result
+        pending: dict[tuple[str, str], int] = {k: len(v) for k, v in dependents.items()}
+        running: dict[Future[Any], tuple[str, str]] = {}
+        workers: int = jobs or os.cpu_count() or 1
+        pool = executor or ThreadPoolExecutor(workers)
+
+        def inputs(task: Task) -> dict[str, Any]:
+            res: dict[str, Any] = {}
+            for name in task.stage.requires:
+                if self.stages[name].shared:
+                    res[name] = results[(name, ALL)]
+                elif task.stage.shared:
+                    res[name] = {p: results[(name, p)] for p in self.paths}
+                else:
+                    res[name] = results[(name, task.path)]
+            return res
+
+        def release(k: tuple[str, str]) -> None:
+            for _ in self.requirements(tasks[k].stage, k[1]):
+                pending[_] -= 1
+                if not pending[_]:
+                    results.pop(_, None)
+
+        def complete(k: tuple[str, str], value: Any) -> None:
+            results[k] = value
+            release(k)
+            for _ in dependents[k]:
+                waiting[_] -= 1
+                if not waiting[_]:
+                    heapq.heappush(ready, (-tasks[_].rank, order.get(_[1], -1), _))
+            if not pending[k]:
+                results.pop(k, None)
+
+        def skip(k: tuple[str, str]) -> Iterator[Outcome]:
+            """Skips the dependents of a failed task, transitively."""
+            stack = list(dependents[k])
+            while stack:
+                if (d := stack.pop()) in waiting and waiting[d] >= 0:
+                    waiting[d] = -1
+                    release(d)
+                    stack.extend(dependents[d])
+                    yield Outcome(d[0], d[1], error=RuntimeError(f"Skipped: {k}"))
+
+        try:
+            while ready or running:
+                while ready and len(running) < workers:
+                    k = heapq.heappop(ready)[2]
+                    task = tasks[k]
+                    is_cached, value = self.cached(task.stage, task.path)
+                    if is_cached:
+                        complete(k, value)
+                        yield Outcome(k[0], k[1], value, cached=True)
+                        continue
+                    future = pool.submit(Pipeline.Execute, task, inputs(task))
+                    running[future] = k
+                if not running:
+                    continue
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    k = running.pop(future)
+                    if (error := future.exception()) is not None:
+                        release(k)
+                        yield Outcome(k[0], k[1], error=error)
+                        yield from skip(k)
+                    else:
+                        value = future.result()
+                        self.store(tasks[k].stage, k[1], value)
+                        complete(k, value)
+                        yield Outcome(k[0], k[1], value)
+        finally:
+            if executor is None:
+                pool.shutdown(cancel_futures=True)
+
+
+if __name__ == "__main__":
+    import argparse
+    import time
+    from array import array
+    from .parser.blocks import BlockParser, splitLines
+    from .render.site import Page, Site
+    from .utils.profile import enable
+
+    parser = argparse.ArgumentParser(description="Renders sources through a pipeline")
+    parser.add_argument("sources", nargs="+")
+    parser.add_argument("-o", "--output", default="dist")
+    parser.add_argument("-j", "--jobs", type=int, default=None)
+    parser.add_argument("-c", "--cache", help="Cache directory")
+    parser.add_argument(
+        "-p", "--profile", action="store_true", help="Prints a profile report"
+    )
+    parser.add_argument("--trace", help="Writes a Chrome trace of the build")
+    args = parser.parse_args()
+    profiler = enable(args.profile or bool(args.trace))
+
+    def parse(path: str, inputs: dict[str, Any]) -> list[int]:
+        """Returns the packed blocks of the file, as a list to be cached."""
+        with open(path, "rb") as f:
+            lines = splitLines(str(f.read(), "utf8"))
+        packed = Site.Pack(
+            BlockParser.Blocks(
+                BlockParser.BlockLines(BlockParser.Lines(lines, path=path))
+            )
+        )
+        return array("i", packed).tolist()
+
+    def render(path: str, inputs: dict[str, Any]) -> int:
+        page = Page(
+            path,
+            str(Path(args.output) / f"{path}.html"),
+            array("i", inputs["parse"]).tobytes(),
+        )
+        return Site.Render(page)[1]
+
+    def summary(path: str, inputs: dict[str, Any]) -> int:
+        return sum(len(_) // 3 for _ in inputs["parse"].values())
+
+    t = time.monotonic()
+    for outcome in Pipeline(
+        Stage("parse", parse, cached=True),
+        Stage("render", render, ("parse",)),
+        Stage("summary", summary, ("parse",), shared=True),
+        cache=args.cache,
+    ).Run(args.sources, jobs=args.jobs):
+        if outcome.error:
+            print(f"!!! {outcome.stage} {outcome.path}: {outcome.error}")
+        elif outcome.stage == "summary":
+            print(f"--- {outcome.value} blocks in {time.monotonic() - t:.3f}s")
+    if args.trace:
+        profiler.save(args.trace)
+    if args.profile:
+        print(profiler.report())
+
+# EOF
@@ -0,0 +1,87 @@
+from typing import Iterable
+from pathlib import Path
+import hashlib
+import json
+from ..model import SymbolIndex
+from ..utils.files import atomicWrite
+from ..utils.profile import count
+from .html import TEMPLATE_VERSION
+
+# --
+# # Output Cache
+#
+# Pages are content-addressed: the key of a page is a hash of everything
+# that goes into it (source, symbols, template version and design tokens).
+# The manifest maps each output to the key it was rendered from, so that
+# a page whose key didn't change is neither rendered nor rewritten, which
+# keeps its modification time and downstream (rsync, CDN) caches intact.
+
+
+def digest(*chunks: str | bytes) -> str:
+    h = hashlib.blake2b(digest_size=16)
+    for chunk in chunks:
+        data = chunk.encode("utf8") if isinstance(chunk, str) else chunk
+        # We prefix with the length so that chunk boundaries matter
+        h.update(len(data).to_bytes(8, "little"))
+        h.update(data)
+    return h.hexdigest()
+
+
+def symbolsDigest(index: SymbolIndex | None, path: str) -> str:
+    """Returns the digest of the symbols that the page for `path` depends
+    on: its own definitions and the definitions it references."""
+    if index is None:
+        return ""
+    lines: list[str] = []
+    for i in index.definedIn(path):
+        lines.append(f"D {index.qualnames[i]} {index.types[i]} {index.lines[i]}")
+    symbols = {index.refSymbols[_] for _ in index.referencedFrom(path)}
+    for i in sorted(symbols):
+        p = index.paths[i]
+        location = f"{index.pathNames[p] if p >= 0 else ''}:{index.lines[i]}"
+        lines.append(f"R {index.qualnames[i]} {index.types[i]} {location}")
+    return digest("\n".join(lines))
+
+
+def pageKey(source: bytes, blocks: bytes, symbols: str, tokens: str = "") -> str:
+    """Returns the key for a page rendered from the given inputs."""
+    return digest(TEMPLATE_VERSION, tokens, symbols, blocks, source)
+
+
+class Manifest:
+    """Maps output paths to the key of the inputs they were rendered from."""
+
+    @staticmethod
+    def Load(path: str | Path) -> "Manifest":
+        path = Path(path)
+        entries: dict[str, str] = {}
+        if path.exists():
+            try:
+                with open(path, "rt") as f:
+                    entries = json.load(f)
+            except ValueError:
+                # A corrupted manifest only means that we render everything
+                entries = {}
+        return Manifest(path, entries)
+
+    def __init__(self, path: Path, entries: dict[str, str] | None = None):
+        self.path = path
+        self.entries: dict[str, str] = entries or {}
+
+    def isFresh(self, output: str, key: str) -> bool:
+        """Tells if the output exists and was rendered from `key`."""
+        res = self.entries.get(output) == key and Path(output).exists()
+        count("cache.pages.hit" if res else "cache.pages.miss")
+        return res
+
+    def update(self, entries: Iterable[tuple[str, str]]) -> "Manifest":
+        self.entries.update(entries)
+        return self
+
+    def save(self) -> int:
+        return atomicWrite(
+            self.path, json.dumps(self.entries, indent=0, sort_keys=True)
+        )
+
+
+# EOF
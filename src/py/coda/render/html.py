@@ -0,0 +1,155 @@
+from typing import Iterable, Iterator, TextIO
+from ..parser.blocks import (
+    Block,
+    BlockParser,
+    CodaLine,
+    RE_CODA_COMMENT,
+    RE_CODA_START,
+)
+from ..utils.tree import XML_ESCAPED
+
+# --
+# # HTML Rendering
+#
+# The renderer is a pipeline of generators: lines are read from the source,
+# parsed into blocks by the `BlockParser`, rendered to HTML chunks and
+# written to the output in bounded chunks. Each stage pulls from the previous
+# one, and lines are rendered as soon as the parser has classified them (it
+# looks ahead by one line), so memory stays constant regardless of the size
+# of the document and of its blocks, and the first bytes are written before
+# the source is fully parsed.
+
+# NOTE: This is bumped whenever the generated HTML changes, as it is part
+# of what defines the output of a page.
+TEMPLATE_VERSION = "1"
+CHUNK_SIZE: int = 64 * 1024
+
+
+def escape(text: str) -> str:
+    return text.translate(XML_ESCAPED)
+
+
+def comment(text: str) -> str | None:
+    """Returns the content of a comment line, without the `#` and the space
+    that follows it, or `None` if it is not a comment."""
+    if not (match := RE_CODA_COMMENT.match(text.rstrip("\r\n"))):
+        return None
+    content = match.group("content")
+    return content[1:] if content.startswith(" ") else content
+
+
+class HTMLRenderer:
+    @staticmethod
+    def Header(title: str | None = None) -> str:
+        return (
+            '<!DOCTYPE html>\n<html><head><meta charset="utf-8" />'
+            f"<title>{escape(title or '')}</title></head><body>\n"
+        )
+
+    @staticmethod
+    def Footer() -> str:
+        return "</body></html>\n"
+
+    @staticmethod
+    def Open(line: int, meta: str | None = None, *, doc: bool = False) -> str:
+        """Returns the opening tag of a block starting at the given line."""
+        if not doc:
+            return f'<pre class="block code" id="L{line}">'
+        meta = (meta or "").strip()
+        return f'<div class="block doc" id="L{line}"' + (
+            f' data-meta="{escape(meta)}">' if meta else ">"
+        )
+
+    @staticmethod
+    def Close(*, doc: bool = False) -> str:
+        return "</div>\n" if doc else "</pre>\n"
+
+    @staticmethod
+    def Line(text: str, *, doc: bool = False) -> str:
+        """Renders a line within a block (other than the first of a doc)."""
+        if not doc:
+            return escape(text)
+        return "" if (content := comment(text)) is None else f"{escape(content)}\n"
+
+    @staticmethod
+    def Block(block: Block, lines: list[str]) -> Iterator[str]:
+        """Renders the given block, made of the given `lines`."""
+        line = block.fragment.line
+        if lines and (match := RE_CODA_START.match(lines[0])):
+            yield HTMLRenderer.Open(line, match.group("meta"), doc=True)
+            for text in lines[1:]:
+                yield HTMLRenderer.Line(text, doc=True)
+            yield HTMLRenderer.Close(doc=True)
+        else:
+            yield HTMLRenderer.Open(line)
+            for text in lines:
+                yield HTMLRenderer.Line(text)
+            yield HTMLRenderer.Close()
+
+    @staticmethod
+    def Blocks(lines: Iterable[str], *, path: str | None = None) -> Iterator[str]:
+        """Parses the given lines (with their end of lines) into blocks and
+        renders them line by line, as they are classified by the parser.
+        The output is the same as rendering each block of `BlockParser.Blocks`
+        with `Block`, where a block is a run of lines of the same kind."""
+        doc: bool | None = None
+        for item in BlockParser.BlockLines(BlockParser.Lines(lines, path=path)):
+            is_doc = isinstance(item, CodaLine)
+            if is_doc is not doc:
+                if doc is not None:
+                    yield HTMLRenderer.Close(doc=doc)
+                doc = is_doc
+                yield HTMLRenderer.Open(
+                    item.line.number,
+                    item.meta if isinstance(item, CodaLine) else None,
+                    doc=doc,
+                )
+                # The first line of a doc block is its `--` start line
+                if doc:
+                    continue
+            yield HTMLRenderer.Line(item.line.text, doc=is_doc)
+        if doc is not None:
+            yield HTMLRenderer.Close(doc=doc)
+
+    @staticmethod
+    def Document(
+        lines: Iterable[str], *, path: str | None = None, title: str | None = None
+    ) -> Iterator[str]:
+        yield HTMLRenderer.Header(title or path)
+        yield from HTMLRenderer.Blocks(lines, path=path)
+        yield HTMLRenderer.Footer()
+
+    @staticmethod
+    def Write(chunks: Iterable[str], out: TextIO, size: int = CHUNK_SIZE) -> int:
+        """Writes the given chunks to `out`, buffering them into writes of
+        about `size` characters. Returns the number of characters written."""
+        buffer: list[str] = []
+        buffered: int = 0
+        written: int = 0
+        for chunk in chunks:
+            buffer.append(chunk)
+            buffered += len(chunk)
+            if buffered >= size:
+                written += out.write("".join(buffer))
+                buffer.clear()
+                buffered = 0
+        if buffer:
+            written += out.write("".join(buffer))
+        return written
+
+    @staticmethod
+    def RenderFile(path: str, out: TextIO, *, title: str | None = None) -> int:
+        """Renders the source file at `path` to `out`, streaming."""
+        with open(path, "rt") as f:
+            return HTMLRenderer.Write(
+                HTMLRenderer.Document(f, path=path, title=title), out
+            )
+
+
+if __name__ == "__main__":
+    import sys
+
+    for path in sys.argv[1:]:
+        HTMLRenderer.RenderFile(path, sys.stdout)
+
+# EOF
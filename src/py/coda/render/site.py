@@ -0,0 +1,290 @@
+from typing import Iterable, Iterator, NamedTuple
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from array import array
+import os
+from ..model import Fragment, SymbolIndex
+from ..parser.blocks import Block, BlockParser, splitLines
+from ..utils.files import atomicWrite
+from ..utils.profile import PROFILER, TEvent, count, enable, span
+from .html import HTMLRenderer, escape
+from .cache import Manifest, digest, pageKey, symbolsDigest
+
+# --
+# # Site Rendering
+#
+# Each source module is rendered as one page, and pages are independent jobs
+# run in a process pool. Blocks are parsed upfront and sent to the workers
+# as packed integer arrays, while the symbol index, which is shared by all
+# pages, is memory-mapped by each worker rather than pickled with each job.
+# Pages whose inputs didn't change since the last run are skipped, see
+# `cache`.
+
+
+class Page(NamedTuple):
+    """A page job: the `source` is rendered to `output` using the given
+    `blocks`, packed as `(offset, length, line)` integer triples. The `key`
+    identifies the inputs of the page."""
+
+    source: str
+    output: str
+    blocks: bytes
+    key: str = ""
+
+
+# The symbol index for the worker process, see `Site.Init`
+INDEX: SymbolIndex | None = None
+
+
+class Site:
+    @staticmethod
+    def Init(index: str | None = None) -> None:
+        """Initializes the rendering process, mapping the symbol index."""
+        global INDEX
+        INDEX = SymbolIndex.Map(index) if index else None
+
+    @staticmethod
+    def InitWorker(index: str | None = None, profile: bool = False) -> None:
+        """Initializes a pool worker, which starts with an empty profile:
+        forked workers inherit the profile data of the parent, which would
+        otherwise be merged back into it."""
+        Site.Init(index)
+        enable(profile).collect()
+
+    @staticmethod
+    def Pack(blocks: Iterable[Block]) -> bytes:
+        res: array[int] = array("i")
+        for block in blocks:
+            fragment = block.fragment
+            res.extend((fragment.offset, fragment.length, fragment.line))
+        return res.tobytes()
+
+    @staticmethod
+    def Unpack(data: bytes, path: str | None = None) -> Iterator[Block]:
+        packed: array[int] = array("i")
+        packed.frombytes(data)
+        for i in range(0, len(packed), 3):
+            yield Block(
+                Fragment(
+                    offset=packed[i],
+                    length=packed[i + 1],
+                    line=packed[i + 2],
+                    column=0,
+                    path=path,
+                )
+            )
+
+    @staticmethod
+    def Pages(
+        sources: Iterable[str | Path],
+        output: str | Path,
+        *,
+        base: str | Path = ".",
+        index: SymbolIndex | None = None,
+        tokens: str = "",
+        changed: set[str] | None = None,
+    ) -> Iterator[Page]:
+        """Parses the given sources, yielding the corresponding page jobs.
+        Pages are written in `output`, at the source path relative to
+        `base`, with an `.html` suffix. The `index` and the `tokens` digest
+        are part of the page keys. When the `changed` paths are given, the
+        other sources are neither parsed nor rendered, paths being compared
+        once resolved. Sources outside of `base` are written at their
+        absolute path, within `output/_`."""
+        base_path = Path(base).absolute()
+        output_path = Path(output)
+        resolved: set[Path] | None = (
+            None if changed is None else {Path(_).resolve() for _ in changed}
+        )
+        for source in sources:
+            if resolved is not None and Path(source).resolve() not in resolved:
+                continue
+            path = Path(source)
+            with span("parse", path=str(path)):
+                with open(path, "rb") as f:
+                    data = f.read()
+                count("bytes.read", len(data))
+                blocks = Site.Pack(
+                    BlockParser.Blocks(
+                        BlockParser.BlockLines(
+                            BlockParser.Lines(
+                                splitLines(str(data, "utf8")), path=str(path)
+                            )
+                        )
+                    )
+                )
+            absolute = path.absolute()
+            rel = (
+                absolute.relative_to(base_path)
+                if absolute.is_relative_to(base_path)
+                else Path("_", *absolute.parts[1:])
+            )
+            yield Page(
+                str(path),
+                str(output_path / f"{rel}.html"),
+                blocks,
+                pageKey(data, blocks, symbolsDigest(index, str(path)), tokens),
+            )
+
+    @staticmethod
+    def Navigation(index: SymbolIndex, path: str) -> Iterator[str]:
+        """Renders the list of symbols defined in the page."""
+        defined = index.definedIn(path)
+        if not len(defined):
+            return
+        yield '<nav class="symbols"><ul>'
+        for i in sorted(defined, key=index.qualnames.__getitem__):
+            qualname = escape(index.qualnames[i])
+            yield f'<li><a href="#L{index.lines[i]}">{qualname}</a></li>'
+        yield "</ul></nav>\n"
+
+    @staticmethod
+    def Render(page: Page) -> tuple[str, int]:
+        """Renders the given page job, writing the output atomically.
+        Returns the output path and the number of bytes written."""
+        with span("render", path=page.source):
+            return Site.RenderPage(page)
+
+    @staticmethod
+    def Profiled(page: Page) -> tuple[str, int, tuple[list[TEvent], dict[str, int]]]:
+        """Renders the page in a worker, returning the profile data along."""
+        output, size = Site.Render(page)
+        return output, size, PROFILER.collect()
+
+    @staticmethod
+    def RenderPage(page: Page) -> tuple[str, int]:
+        # The source is decoded and split as in `Pages`, so that the block
+        # offsets match: text mode would translate the line endings.
+        with open(page.source, "rb") as f:
+            text = str(f.read(), "utf8")
+        chunks: list[str] = [HTMLRenderer.Header(page.source)]
+        if INDEX is not None:
+            chunks += Site.Navigation(INDEX, page.source)
+        for block in Site.Unpack(page.blocks, page.source):
+            o = block.fragment.offset
+            chunks += HTMLRenderer.Block(
+                block, splitLines(text[o : o + block.fragment.length])
+            )
+        chunks.append(HTMLRenderer.Footer())
+        data = "".join(chunks).encode("utf8")
+        # Even if the inputs changed, the output may be the same, in which
+        # case we leave the file untouched.
+        output = Path(page.output)
+        if output.exists() and output.stat().st_size == len(data):
+            if output.read_bytes() == data:
+                count("cache.output.hit")
+                return page.output, 0
+        count("cache.output.miss")
+        size = atomicWrite(output, data)
+        count("bytes.written", size)
+        return page.output, size
+
+    @staticmethod
+    def Run(
+        pages: Iterable[Page],
+        *,
+        index: str | Path | None = None,
+        jobs: int | None = None,
+        manifest: Manifest | None = None,
+    ) -> Iterator[tuple[str, int]]:
+        """Renders the pages in a pool of `jobs` processes (one per CPU
+        by default), yielding `(output, size)` as pages are rendered, where
+        `size` is 0 when the page was already up to date. Pages that are
+        fresh in the `manifest` are skipped altogether, and the manifest is
+        updated with the rendered pages."""
+        if manifest is not None:
+            pending = [_ for _ in pages if not manifest.isFresh(_.output, _.key)]
+            keys = {_.output: _.key for _ in pending}
+            for output, size in Site.Process(pending, index=index, jobs=jobs):
+                manifest.entries[output] = keys[output]
+                yield output, size
+        else:
+            yield from Site.Process(pages, index=index, jobs=jobs)
+
+    @staticmethod
+    def Process(
+        pages: Iterable[Page],
+        *,
+        index: str | Path | None = None,
+        jobs: int | None = None,
+    ) -> Iterator[tuple[str, int]]:
+        index_path = str(index) if index else None
+        if jobs == 1:
+            Site.Init(index_path)
+            yield from (Site.Render(_) for _ in pages)
+        else:
+            with ProcessPoolExecutor(
+                max_workers=jobs or os.cpu_count(),
+                initializer=Site.InitWorker,
+                initargs=(index_path, PROFILER.enabled),
+            ) as pool:
+                if PROFILER.enabled:
+                    # The profile data of workers is merged as pages complete
+                    for output, size, data in pool.map(
+                        Site.Profiled, pages, chunksize=8
+                    ):
+                        PROFILER.merge(*data)
+                        yield output, size
+                else:
+                    yield from pool.map(Site.Render, pages, chunksize=8)
+
+
+if __name__ == "__main__":
+    import argparse
+    import sys
+    from ..utils.changes import Changes
+
+    parser = argparse.ArgumentParser(description="Renders source files as HTML pages")
+    parser.add_argument("sources", nargs="+")
+    parser.add_argument("-o", "--output", default="dist")
+    parser.add_argument("-b", "--base", default=".")
+    parser.add_argument("-i", "--index", help="Symbol index file")
+    parser.add_argument("-j", "--jobs", type=int, default=None)
+    parser.add_argument("-t", "--tokens", help="Design tokens file")
+    parser.add_argument("-m", "--manifest", help="Manifest file of rendered pages")
+    parser.add_argument("-f", "--force", action="store_true", help="Renders all pages")
+    parser.add_argument(
+        "-c", "--changed-since", help="Only renders the files changed since REVISION"
+    )
+    parser.add_argument(
+        "-p", "--profile", action="store_true", help="Prints a profile report"
+    )
+    parser.add_argument("--trace", help="Writes a Chrome trace of the build")
+    args = parser.parse_args()
+    enable(args.profile or bool(args.trace) or PROFILER.enabled)
+    tokens = ""
+    if args.tokens:
+        with open(args.tokens, "rb") as f:
+            tokens = digest(f.read())
+    manifest = Manifest.Load(args.manifest or Path(args.output) / ".coda-manifest.json")
+    if args.force:
+        manifest.entries.clear()
+    index = SymbolIndex.Map(args.index) if args.index else None
+    changed: set[str] | None = None
+    if args.changed_since:
+        changed = Changes.Since(args.changed_since)
+        if index:
+            changed = Changes.Dependents(changed, index)
+    try:
+        for path, size in Site.Run(
+            Site.Pages(
+                args.sources,
+                args.output,
+                base=args.base,
+                index=index,
+                tokens=tokens,
+                changed=changed,
+            ),
+            index=args.index,
+            jobs=args.jobs,
+            manifest=manifest,
+        ):
+            print(f"{size}\t{path}")
+    finally:
+        manifest.save()
+    if args.trace:
+        PROFILER.save(args.trace)
+    if args.profile:
+        print(PROFILER.report(), file=sys.stderr)
+
+# EOF
@@ -0,0 +1,128 @@
+from typing import Iterable
+from pathlib import Path
+from subprocess import run
+import json
+import os
+from .files import atomicWrite
+from ..model import SymbolIndex
+
+# --
+# # Change Detection
+#
+# Incremental builds only process the files that changed since the last
+# build, plus their reverse dependents: the files that reference symbols
+# defined in the changed files. The state of the files is a mapping of
+# paths to signatures, which comes either from git, using the blob ids of
+# the index, or from `stat`, using the modification time and size. Comparing
+# two states gives the dirty set.
+
+
+def git(*args: str, cwd: str | Path = ".") -> list[str]:
+    """Runs the given git command, returning the output lines, or the
+    NUL-separated entries when `-z` is given, which keeps paths verbatim
+    (git otherwise quotes paths with unusual characters)."""
+    result = run(
+        ["git", *args], cwd=cwd, capture_output=True, text=True, check=False
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"git {' '.join(args)} failed: {result.stderr.strip()}")
+    return [_ for _ in result.stdout.split("\0" if "-z" in args else "\n") if _]
+
+
+def statSignature(path: str | Path) -> str | None:
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return f"{st.st_mtime_ns:x}:{st.st_size:x}"
+
+
+class Changes:
+    @staticmethod
+    def Git(cwd: str | Path = ".") -> dict[str, str]:
+        """Returns the state of the files tracked by git (and of the untracked
+        files that are not ignored), in one `ls-files` run. Files modified
+        in the work tree are signed using `stat`, as their index blob id
+        doesn't reflect their content. Paths are relative to `cwd`."""
+        res: dict[str, str] = {}
+        # Each entry is `MODE BLOB STAGE\tPATH`
+        for line in git("ls-files", "-s", "-z", cwd=cwd):
+            meta, path = line.split("\t", 1)
+            res[path] = meta.split(" ", 2)[1]
+        modified = git("ls-files", "-m", "-o", "--exclude-standard", "-z", cwd=cwd)
+        for path in modified:
+            if (signature := statSignature(Path(cwd) / path)) is None:
+                res.pop(path, None)
+            else:
+                res[path] = signature
+        return res
+
+    @staticmethod
+    def Stat(paths: Iterable[str]) -> dict[str, str]:
+        """Returns the state of the given files, using `stat`."""
+        return {
+            path: signature
+            for path in paths
+            if (signature := statSignature(path)) is not None
+        }
+
+    @staticmethod
+    def Since(revision: str, cwd: str | Path = ".") -> set[str]:
+        """Returns the files changed since the given revision, including the
+        changes in the work tree and untracked files, which is what CI
+        typically knows. Like with `Git`, paths are relative to `cwd`, and
+        the changes outside of it are left out."""
+        return set(
+            git("diff", "--name-only", "--relative", "-z", revision, cwd=cwd)
+        ) | set(git("ls-files", "-o", "--exclude-standard", "-z", cwd=cwd))
+
+    @staticmethod
+    def Dirty(previous: dict[str, str], current: dict[str, str]) -> set[str]:
+        """Returns the paths that were added, modified or removed."""
+        res = {k for k, v in current.items() if previous.get(k) != v}
+        res.update(k for k in previous if k not in current)
+        return res
+
+    @staticmethod
+    def Dependents(dirty: Iterable[str], index: SymbolIndex) -> set[str]:
+        """Returns the dirty paths along with the paths that reference symbols
+        defined in them, according to the index of the previous build."""
+        res: set[str] = set(dirty)
+        defined: set[int] = set()
+        for path in res:
+            defined.update(index.definedIn(path))
+        if defined:
+            paths = index.pathNames
+            ref_paths = index.refPaths
+            for i, symbol in enumerate(index.refSymbols):
+                if symbol in defined and (p := ref_paths[i]) >= 0:
+                    res.add(paths[p])
+        return res
+
+    @staticmethod
+    def Load(path: str | Path) -> dict[str, str]:
+        """Loads a state saved with `Save`, which is empty if there's none."""
+        try:
+            with open(path, "rt") as f:
+                return dict(json.load(f))
+        except (OSError, ValueError):
+            return {}
+
+    @staticmethod
+    def Save(path: str | Path, state: dict[str, str]) -> int:
+        return atomicWrite(path, json.dumps(state, indent=0, sort_keys=True))
+
+
+if __name__ == "__main__":
+    import sys
+
+    # Usage: changes.py [STATE]
+    # Prints the files that changed since the state was saved, and saves
+    # the new state.
+    state_path = sys.argv[1] if len(sys.argv) > 1 else ".coda-state.json"
+    current = Changes.Git()
+    for path in sorted(Changes.Dirty(Changes.Load(state_path), current)):
+        print(path)
+    Changes.Save(state_path, current)
+
+# EOF
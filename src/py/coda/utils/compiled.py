@@ -0,0 +1,95 @@
+from importlib.machinery import EXTENSION_SUFFIXES, ModuleSpec
+from pathlib import Path
+from types import ModuleType
+from typing import Sequence
+import os
+import sys
+
+# --
+# # Compiled modules
+#
+# The hot modules can be compiled with mypyc (`make build-mypyc`), which
+# puts the extensions in `.build/lib/py` (or `CODA_BUILD`). When an
+# extension is present and newer than its source, it is imported instead of
+# the source, otherwise the pure Python module is used. Setting `CODA_PURE`
+# always uses the sources, which is how both are benchmarked. Modules in
+# `EXCLUDED` are always imported from source, which is how commands run
+# their `__main__` block (extensions have no code to run).
+#
+# This is imported by the package, and so by every command: the finder
+# does not subclass `importlib.abc.MetaPathFinder`, which takes longer to
+# import than the rest of the startup.
+
+MODULES: tuple[str, ...] = ("coda.model", "coda.parser.blocks", "coda.parser.ctags")
+SOURCES: Path = Path(__file__).parent.parent.parent
+BUILD: Path = Path(
+    os.getenv("CODA_BUILD") or SOURCES.parent.parent / ".build" / "lib" / "py"
+)
+PURE: bool = os.getenv("CODA_PURE", "").lower() in ("1", "true")
+EXCLUDED: set[str] = set()
+
+
+class CompiledFinder:
+    """Finds the compiled extensions of `MODULES` in the build directory."""
+
+    def __init__(self, build: Path = BUILD, sources: Path = SOURCES):
+        self.build = build
+        self.sources = sources
+
+    def extension(self, name: str) -> Path | None:
+        """Returns the extension for the given module, if it is up to date."""
+        parts = name.split(".")
+        base = self.build.joinpath(*parts[:-1])
+        source = self.sources.joinpath(*parts[:-1], f"{parts[-1]}.py")
+        for suffix in EXTENSION_SUFFIXES:
+            path = base / f"{parts[-1]}{suffix}"
+            try:
+                if path.stat().st_mtime >= source.stat().st_mtime:
+                    return path
+            except OSError:
+                continue
+        return None
+
+    def find_spec(
+        self,
+        fullname: str,
+        path: Sequence[str] | None = None,
+        target: ModuleType | None = None,
+    ) -> ModuleSpec | None:
+        if (
+            fullname not in MODULES
+            or fullname in EXCLUDED
+            or not (extension := self.extension(fullname))
+        ):
+            return None
+        from importlib.util import spec_from_file_location
+
+        return spec_from_file_location(fullname, extension)
+
+
+def install(build: Path = BUILD, pure: bool = PURE) -> bool:
+    """Installs the finder for the compiled modules, unless `pure` or when
+    nothing was built. Returns `True` when installed."""
+    if pure or not build.is_dir():
+        return False
+    if not any(isinstance(_, CompiledFinder) for _ in sys.meta_path):
+        # The extensions import the mypyc runtime as a top-level module
+        if str(build) not in sys.path:
+            sys.path.append(str(build))
+        sys.meta_path.insert(0, CompiledFinder(build))
+    return True
+
+
+def compiled() -> list[str]:
+    """Returns the modules of `MODULES` that are loaded from extensions."""
+    return [
+        name
+        for name in MODULES
+        if (module := sys.modules.get(name))
+        and (getattr(module, "__file__", None) or "").endswith(
+            tuple(EXTENSION_SUFFIXES)
+        )
+    ]
+
+
+# EOF
@@ -1,4 +1,5 @@
 from typing import NamedTuple, cast
+from array import array
 from enum import Enum
 from pathlib import Path
 
@@ -13,6 +14,8 @@ def asPrimitive(value):
         return str(value)
     elif isinstance(value, list):
         return [asPrimitive(_) for _ in value]
+    elif isinstance(value, array):
+        return value.tolist()
     elif isinstance(value, tuple):
         return tuple(*(asPrimitive(_) for _ in value))
     elif isinstance(value, dict):
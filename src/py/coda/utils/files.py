@@ -0,0 +1,30 @@
+from pathlib import Path
+import os
+import tempfile
+
+# The umask can only be read by setting it, so we do that once
+UMASK: int = os.umask(0o022)
+os.umask(UMASK)
+
+
+def atomicWrite(path: str | Path, data: str | bytes) -> int:
+    """Writes `data` to `path` atomically: the content is written to
+    a temporary file in the same directory, which then replaces `path`.
+    Readers see either the previous or the new content, never a partial
+    one."""
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            n = f.write(data.encode("utf8") if isinstance(data, str) else data)
+        # Temporary files are private, we want the permissions of a regular file
+        os.chmod(tmp, 0o666 & ~UMASK)
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+    return n
+
+
+# EOF
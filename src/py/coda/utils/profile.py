@@ -0,0 +1,259 @@
+from typing import Any, Callable, Iterable, Iterator, ParamSpec, TypeVar
+from contextlib import nullcontext
+from functools import wraps
+from time import perf_counter_ns
+from pathlib import Path
+import os
+import threading
+
+# --
+# # Profiling
+#
+# Stages are instrumented with spans (timed sections, like parsing or
+# rendering a file) and counters (like bytes read or cache hits). When
+# profiling is disabled, which is the default, a span is a shared no-op
+# context and a counter a single test, so instrumentation is left in place.
+# Spans are exported in the Chrome trace event format, which can be opened
+# in `chrome://tracing` or Perfetto, and summarized as a report.
+
+P = ParamSpec("P")
+T = TypeVar("T")
+
+# Counters named `NAME.hit` and `NAME.miss` are reported as cache hit rates
+HIT: str = ".hit"
+MISS: str = ".miss"
+
+# An event is `(name, category, start µs, duration µs, pid, tid, args)`
+TEvent = tuple[str, str, int, int, int, int, dict[str, Any]]
+
+
+class Span:
+    __slots__ = ("profiler", "name", "cat", "args", "start")
+
+    def __init__(
+        self, profiler: "Profiler", name: str, cat: str, args: dict[str, Any]
+    ):
+        self.profiler = profiler
+        self.name = name
+        self.cat = cat
+        self.args = args
+        self.start: int = 0
+
+    def __enter__(self) -> "Span":
+        self.start = perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        end = perf_counter_ns()
+        self.profiler.events.append(
+            (
+                self.name,
+                self.cat,
+                self.start // 1000,
+                (end - self.start) // 1000,
+                os.getpid(),
+                threading.get_ident(),
+                self.args,
+            )
+        )
+
+
+class Profiler:
+    def __init__(self, enabled: bool = False):
+        self.enabled: bool = enabled
+        self.events: list[TEvent] = []
+        self.counters: dict[str, int] = {}
+
+    def span(self, name: str, cat: str = "stage", **args: Any) -> Span:
+        return Span(self, name, cat, args)
+
+    def count(self, name: str, value: int = 1) -> None:
+        self.counters[name] = self.counters.get(name, 0) + value
+
+    def collect(self) -> tuple[list[TEvent], dict[str, int]]:
+        """Returns and clears the events and counters, so that they can be
+        merged into the profiler of another process."""
+        res = (self.events, self.counters)
+        self.events = []
+        self.counters = {}
+        return res
+
+    def merge(self, events: Iterable[TEvent], counters: dict[str, int]) -> None:
+        self.events.extend(events)
+        for k, v in counters.items():
+            self.count(k, v)
+
+    def trace(self) -> dict[str, Any]:
+        """Returns the events in the Chrome trace event format."""
+        events: list[dict[str, Any]] = [
+            dict(name=k, cat=cat, ph="X", ts=ts, dur=dur, pid=pid, tid=tid, args=args)
+            for k, cat, ts, dur, pid, tid, args in self.events
+        ]
+        end = max((_["ts"] + _["dur"] for _ in events), default=0)
+        events.extend(
+            dict(name=k, ph="C", ts=end, pid=os.getpid(), args={"value": v})
+            for k, v in sorted(self.counters.items())
+        )
+        return dict(traceEvents=events, displayTimeUnit="ms")
+
+    def save(self, path: str | Path) -> int:
+        import json
+        from .files import atomicWrite
+
+        return atomicWrite(path, json.dumps(self.trace()))
+
+    def report(self, top: int = 10) -> str:
+        """Returns a text report of the time per stage, the slowest files,
+        the counters and the cache hit rates."""
+        lines: list[str] = []
+        stages: dict[str, list[int]] = {}
+        for name, cat, _, dur, _, _, _ in self.events:
+            key = name if cat == "stage" else f"{cat}.{name}"
+            stages.setdefault(key, []).append(dur)
+        lines.append(
+            f"{'stage':<24} {'count':>8} {'total ms':>10} {'mean ms':>9} {'max ms':>9}"
+        )
+        for name, durations in sorted(stages.items(), key=lambda _: -sum(_[1])):
+            n = len(durations)
+            total = sum(durations) / 1000
+            longest = max(durations) / 1000
+            lines.append(
+                f"{name:<24} {n:>8} {total:>10.1f} {total / n:>9.2f} {longest:>9.2f}"
+            )
+        files = sorted(
+            (_ for _ in self.events if "path" in _[6]), key=lambda _: -_[3]
+        )[:top]
+        if files:
+            lines.append("")
+            lines.append("Slowest files")
+            for name, cat, _, dur, _, _, args in files:
+                key = name if cat == "stage" else f"{cat}.{name}"
+                lines.append(f"  {dur / 1000:>9.2f}ms {key:<16} {args['path']}")
+        if self.counters:
+            lines.append("")
+            lines.append("Counters")
+            for k, v in sorted(self.counters.items()):
+                lines.append(f"  {k:<32} {v:>12}")
+        rates = sorted(
+            k[: -len(HIT)] for k in self.counters if k.endswith(HIT)
+        ) + sorted(
+            k[: -len(MISS)]
+            for k in self.counters
+            if k.endswith(MISS) and f"{k[: -len(MISS)]}{HIT}" not in self.counters
+        )
+        if rates:
+            lines.append("")
+            lines.append("Cache hit rates")
+            for k in rates:
+                hits = self.counters.get(f"{k}{HIT}", 0)
+                total = hits + self.counters.get(f"{k}{MISS}", 0)
+                lines.append(f"  {k:<32} {hits / total:>11.1%} of {total}")
+        return "\n".join(lines)
+
+
+# The profiler of the process
+PROFILER: Profiler = Profiler(bool(os.environ.get("CODA_PROFILE")))
+NO_SPAN: nullcontext[None] = nullcontext()
+
+
+def span(name: str, cat: str = "stage", **args: Any) -> Span | nullcontext[None]:
+    """Returns a span timing the `with` block, when profiling is enabled."""
+    return PROFILER.span(name, cat, **args) if PROFILER.enabled else NO_SPAN
+
+
+def count(name: str, value: int = 1) -> None:
+    if PROFILER.enabled:
+        PROFILER.count(name, value)
+
+
+def enable(enabled: bool = True) -> Profiler:
+    PROFILER.enabled = enabled
+    return PROFILER
+
+
+def counted(
+    name: str,
+    size: str | None = None,
+    measure: Callable[[Any], int] = len,
+    *,
+    calls: str | None = None,
+) -> Callable[[Callable[P, Iterator[T]]], Callable[P, Iterator[T]]]:
+    """Decorates a generator function so that, when profiling is enabled,
+    the items it yields are counted as `name`, their total `measure` as
+    `size` and the calls as `calls`. Counts are recorded when the generator
+    is closed, even when it's not consumed entirely. Otherwise, the
+    generator is returned as-is, so that hot loops are left untouched."""
+
+    def decorator(generator: Callable[P, Iterator[T]]) -> Callable[P, Iterator[T]]:
+        @wraps(generator)
+        def wrapper(*args: P.args, **kwargs: P.kwargs) -> Iterator[T]:
+            items = generator(*args, **kwargs)
+            if not PROFILER.enabled:
+                return items
+            return counting(items, name, size, measure, calls)
+
+        return wrapper
+
+    return decorator
+
+
+def counting(
+    items: Iterator[T],
+    name: str,
+    size: str | None,
+    measure: Callable[[Any], int],
+    calls: str | None,
+) -> Iterator[T]:
+    n: int = 0
+    total: int = 0
+    try:
+        for item in items:
+            n += 1
+            if size:
+                total += measure(item)
+            yield item
+    finally:
+        count(name, n)
+        if size:
+            count(size, total)
+        if calls:
+            count(calls)
+
+
+def options(args: list[str]) -> list[str]:
+    """Handles the profiling options of the commands that don't parse their
+    arguments with `argparse`: `--profile` prints a report on stderr and
+    `--trace PATH` saves a Chrome trace, both when the process exits.
+    Returns the remaining arguments."""
+    rest: list[str] = []
+    report: bool = False
+    trace: str | None = None
+    i: int = 0
+    while i < len(args):
+        if args[i] == "--profile":
+            report = True
+        elif args[i] == "--trace" and i + 1 < len(args):
+            i += 1
+            trace = args[i]
+        elif args[i].startswith("--trace="):
+            trace = args[i].split("=", 1)[1]
+        else:
+            rest.append(args[i])
+        i += 1
+    if report or trace:
+        import atexit
+        import sys
+
+        enable()
+
+        def done() -> None:
+            if trace:
+                PROFILER.save(trace)
+            if report:
+                print(PROFILER.report(), file=sys.stderr)
+
+        atexit.register(done)
+    return rest
+
+
+# EOF
@@ -0,0 +1,520 @@
+from typing import Optional, Any, Callable, Union, Iterable, Iterator, TypeVar, Generic
+import json
+
+T = TypeVar('T')
+
+# NOTE: This is the same as `html.escape(text, quote=True)`, but done with
+# a single precompiled translation.
+XML_ESCAPED = str.maketrans(
+    {"&": "&amp;", "<": "&lt;", ">": "&gt;", '"': "&quot;", "'": "&#x27;"}
+)
+HTML_NOT_EMPTY = ("ul", "div", "script", "span")
+
+
+# NOTE: This is copied from parsource, originally from tlang.
+# NOTE: Each node caches its index within its parent's children, so that
+# sibling navigation is O(1) instead of `O(n)` with `list.index`. Mutations
+# of the children list are responsible for keeping the indexes up to date.
+class Node(Generic[T]):
+    """A node is an uniquely identified, named object with zero or one parent,
+    a set of attributes and a list of children."""
+
+    __slots__ = (
+        "name",
+        "data",
+        "id",
+        "parent",
+        "attributes",
+        "_children",
+        "_index",
+        "metadata",
+    )
+
+    IDS = 0
+
+    def __init__(self, name: str, attributes: Optional[dict[str, Any]] = None):
+        assert isinstance(
+            name, str), f"Node name must be a string, got: {name}"
+        self.name = name
+        self.data: Optional[T] = None
+        self.id = Node.IDS
+        Node.IDS += 1
+        self.parent: Optional['Node[T]'] = None
+        # The index of this node in its parent's children
+        self._index: int = -1
+        # FIXME: This does not support namespaces for attributes
+        self.attributes: dict[str, Any] = attributes if attributes else {}
+        self._children: list['Node[T]'] = []
+        self.metadata: Optional[dict[str, Any]] = None
+
+    @property
+    def head(self) -> Optional['Node[T]']:
+        return self._children[0] if self._children else None
+
+    @property
+    def tail(self) -> list['Node[T]']:
+        return self._children[1:]
+
+    @property
+    def children(self) -> list['Node[T]']:
+        return self._children
+
+    @property
+    def count(self) -> int:
+        return len(self._children)
+
+    @property
+    def root(self) -> Optional['Node[T]']:
+        root = None
+        parent = self.parent
+        while parent:
+            root = parent
+            parent = parent.parent
+        return root
+
+    @property
+    def isTree(self) -> bool:
+        return not self.parent
+
+    @property
+    def isEmpty(self) -> bool:
+        return self.isLeaf and not self.hasAttributes
+
+    @property
+    def isSubtree(self) -> bool:
+        return bool(self.parent)
+
+    @property
+    def ancestors(self) -> Iterator['Node[T]']:
+        node = self.parent
+        while node:
+            yield node
+            node = node.parent
+
+    @property
+    def descendants(self) -> Iterator['Node[T]']:
+        stack = self._children[::-1]
+        while stack:
+            node = stack.pop()
+            yield node
+            if node._children:
+                stack.extend(reversed(node._children))
+
+    @property
+    def previousSibling(self) -> Optional['Node[T]']:
+        if not self.parent:
+            return None
+        i = self._index
+        return self.parent._children[i - 1] if i > 0 else None
+
+    @property
+    def nextSibling(self) -> Optional['Node[T]']:
+        if not self.parent:
+            return None
+        siblings = self.parent._children
+        i = self._index
+        return siblings[i + 1] if i + 1 < len(siblings) else None
+
+    @property
+    def previousSiblings(self) -> Iterable['Node[T]']:
+        if not self.parent:
+            return ()
+        children = self.parent._children
+        i = self._index
+        assert i >= 0
+        return (children[j] for j in range(i - 1, -1, -1))
+
+    @property
+    def nextSiblings(self) -> Iterable['Node[T]']:
+        if not self.parent:
+            return ()
+        children = self.parent._children
+        i = self._index
+        assert i >= 0
+        return (children[j] for j in range(i + 1, len(children)))
+
+    @property
+    def firstChild(self) -> Optional['Node[T]']:
+        return self._children[0] if self._children else None
+
+    @property
+    def lastChild(self) -> Optional['Node[T]']:
+        return self._children[-1] if self._children else None
+
+    @property
+    def isLeaf(self) -> bool:
+        return len(self._children) == 0
+
+    @property
+    def isNode(self) -> bool:
+        return len(self._children) > 0
+
+    @property
+    def hasAttributes(self) -> bool:
+        return len(self.attributes) > 0
+
+    def hasAttribute(self, name: str) -> bool:
+        return name in self.attributes
+
+    def setAttribute(self, name: str, value: Any = None) -> 'Node[T]':
+        self.attributes[name] = value
+        return self
+
+    def getAttribute(self, name: str) -> Any:
+        return self.attributes.get(name)
+
+    def removeAttribute(self, name: str) -> 'Node[T]':
+        del self.attributes[name]
+        return self
+
+    def updateAttributes(self, attributes: dict[str, Any]) -> 'Node[T]':
+        self.attributes.update(attributes)
+        return self
+
+    def copy(self, depth: int = -1) -> 'Node[T]':
+        """Does a deep copy of this node. If a depth is given, it will
+        stop at the given depth."""
+        node: Node[T] = Node(self.name)
+        node.attributes = type(self.attributes)((k, v)
+                                                for k, v in self.attributes.items())
+        if depth != 0:
+            for child in self._children:
+                node.append(child.copy(depth - 1))
+        return node
+
+    def index(self, node: Optional['Node[T]'] = None) -> Optional[int]:
+        if not node:
+            return self._index if self.parent else None
+        elif node.parent is self:
+            return node._index
+        else:
+            raise ValueError(f"Node is not a child of {self}: {node}")
+
+    def _reindex(self, start: int = 0) -> None:
+        """Updates the cached index of the children from `start`."""
+        children = self._children
+        for i in range(start, len(children)):
+            children[i]._index = i
+
+    def detach(self) -> 'Node[T]':
+        if self.parent:
+            self.parent.remove(self)
+        return self
+
+    def wrap(self, node: 'Node[T]') -> 'Node[T]':
+        """Moves the current node into the given `node`, attaching the given
+        `node` where the current node was in the parent."""
+        parent = self.parent
+        if parent:
+            parent.set(self._index, node)
+        node.append(self)
+        return self
+
+    def absorb(self, node: 'Node[T]') -> 'Node[T]':
+        """Detaches the given node and merges in its children and attributes."""
+        node.detach()
+        self.merge(node)
+        return self
+
+    def merge(
+        self, node: 'Node[T]', attributes: bool = True, replace: bool = False
+    ) -> 'Node[T]':
+        children = [_ for _ in node._children]
+        if attributes:
+            # TODO: We could do a smarter merge
+            for k, v in node.attributes.items():
+                if replace or k not in self.attributes:
+                    self.attributes[k] = v
+        for c in children:
+            self.add(c.detach())
+        return self
+
+    def add(self, node: 'Node[T]') -> 'Node[T]':
+        assert isinstance(node, Node), f"Expected a Node, got: {node}"
+        assert not node.parent, "Cannot add node to {0}, it already has a parent: {1}".format(
+            self, node)
+        node.parent = self
+        node._index = len(self._children)
+        self._children.append(node)
+        return self
+
+    def set(self, index: int, node: 'Node[T]') -> 'Node[T]':
+        assert isinstance(node, Node), f"Expected a Node, got: {node}"
+        assert not node.parent, "Cannot set node to {0}, it already has a parent: {1}".format(
+            self, node)
+        n = len(self._children)
+        if n == 0:
+            return self.add(node)
+        else:
+            # NOTE: We don't want to use detach here
+            i = min(max(0, n + index if index < 0 else index), n - 1)
+            previous = self._children[i]
+            self._children[i] = node
+            previous.parent = None
+            previous._index = -1
+            node.parent = self
+            node._index = i
+            return node
+
+    def setChildren(self, children: Iterable['Node[T]']) -> 'Node[T]':
+        if self.children:
+            for child in self.children:
+                child.parent = None
+                child._index = -1
+            self._children = []
+        for child in children:
+            self.append(child)
+        return self
+
+    def append(self, node: 'Node[T]') -> 'Node[T]':
+        return self.add(node)
+
+    def extend(self, nodes: list['Node[T]']) -> 'Node[T]':
+        for node in nodes:
+            self.add(node.detach())
+        return self
+
+    def remove(self, node: 'Node[T]') -> 'Node[T]':
+        assert node.parent is self, "Cannot remove node from {0}, it has a different parent: {1}".format(
+            self, node.parent)
+        i = node._index
+        node.parent = None
+        node._index = -1
+        del self._children[i]
+        self._reindex(i)
+        return node
+
+    def insert(self, index: int, node: 'Node[T]') -> 'Node[T]':
+        index = index if index >= 0 else len(self._children) + index
+        assert index >= 0 and index <= len(
+            self._children), "Index out of bounds {0} in: {1}".format(index, self)
+        assert not node.parent, "Cannot add node to {0}, it already has a parent: {1}".format(
+            self, node)
+        node.parent = self
+        node._index = index
+        if index == len(self._children):
+            self._children.append(node)
+        else:
+            self._children.insert(index, node)
+            self._reindex(index + 1)
+        return node
+
+    def replaceWith(self, nodes: Union['Node[T]', list['Node[T]']]) -> 'Node[T]':
+        nodes = [nodes] if isinstance(nodes, Node) else nodes
+        index = self.index()
+        if index is None:
+            assert self.parent
+            for child in self.children:
+                self.parent.append(child)
+        else:
+            for i in range(len(nodes) - 1, -1, -1):
+                if self.parent:
+                    self.parent.insert(index, nodes[i])
+        self.detach()
+        return self
+
+    def walk(
+        self,
+        functor: Optional[Callable[['Node[T]'], Any]] = None,
+        processor: Optional[Callable[['Node[T]'], Any]] = None,
+        filter: Optional[Callable[['Node[T]'], Any]] = None,
+    ) -> list[Any]:
+        return list(self.iterWalk(functor=functor, processor=processor, filter=filter))
+
+    def iterWalk(
+        self,
+        functor: Optional[Callable[['Node[T]'], Any]] = None,
+        processor: Optional[Callable[['Node[T]'], Any]] = None,
+        filter: Optional[Callable[['Node[T]'], Any]] = None,
+    ) -> Iterator[Any]:
+        stack: list[Node[T]] = [self]
+        while stack:
+            node = stack.pop()
+            if (not functor) or functor(node) is not False:
+                if (not filter) or filter(node):
+                    yield processor(node) if processor else node
+                if node._children:
+                    stack.extend(reversed(node._children))
+
+    def asDict(self) -> dict[str, Any]:
+        root: list[dict[str, Any]] = []
+        # The stack holds the nodes to convert along with the list of children
+        # of the converted parent they should be added to.
+        stack: list[tuple[Node[T], list[dict[str, Any]]]] = [(self, root)]
+        while stack:
+            node, siblings = stack.pop()
+            res: dict[str, Any] = {"id": node.id}
+            if node.name:
+                res["name"] = node.name
+            if node.parent:
+                res["parent"] = node.parent.id
+            if node.attributes:
+                res["attributes"] = node.attributes
+            if node.metadata:
+                res["metadata"] = node.metadata
+            if node._children:
+                children: list[dict[str, Any]] = []
+                res["children"] = children
+                stack.extend((_, children) for _ in reversed(node._children))
+            siblings.append(res)
+        return root[0]
+
+    # NOTE: The serializers below use an explicit stack rather than
+    # recursive generators, so that each chunk doesn't go through one
+    # generator frame per level and deep trees don't hit the recursion limit.
+    # Closing tags are pushed on the stack as strings.
+    def iterXML(
+        self,
+        level: int = 0,
+        indent: str = "",
+        eol: bool = False,
+        notEmpty: Optional[Iterable[str]] = None,
+    ) -> Iterator[str]:
+        end = "\n" if eol else ""
+        not_empty = frozenset(notEmpty) if notEmpty else frozenset()
+        dumps = json.dumps
+        stack: list[Union[Node[T], str]] = [self]
+        while stack:
+            node = stack.pop()
+            if isinstance(node, str):
+                yield node
+                continue
+            attrs = node.attributes
+            if node.name == "#text" and "value" in attrs and len(attrs) == 1:
+                yield str(attrs["value"]).translate(XML_ESCAPED)
+                continue
+            name = "text" if node.name == "#text" else node.name
+            attributes = " ".join(
+                f"{k}={dumps(v) if isinstance(v, str) else dumps(repr(v))}" for k, v in attrs.items())
+            prefix = f"{name} {attributes}" if attributes else name
+            # As with the recursive version, only the tags of this node end
+            # with `eol`.
+            suffix = end if node is self else ""
+            if node._children or node.name in not_empty:
+                yield f"<{prefix}>{suffix}"
+                stack.append(f"</{name}>{suffix}")
+                stack.extend(reversed(node._children))
+            else:
+                yield f"<{prefix} />{suffix}"
+
+    def writeXML(
+        self, out: list[str], eol: bool = False, notEmpty: Optional[Iterable[str]] = None
+    ) -> list[str]:
+        """Writes the XML serialization to the given list buffer."""
+        out.extend(self.iterXML(eol=eol, notEmpty=notEmpty))
+        return out
+
+    def toXML(self, indent: str = "") -> str:
+        return "".join(self.writeXML([]))
+
+    def toHTML(self, indent: str = "") -> str:
+        return "".join(self.writeXML([], notEmpty=HTML_NOT_EMPTY))
+
+    def iterTDoc(self, level: int = 0) -> Iterator[str]:
+        # Each entry is the node, the leader of its first line and the
+        # leader of its children's lines.
+        stack: list[tuple[Node[T], str, str]] = [(self, "", "")]
+        while stack:
+            node, leader, prefix = stack.pop()
+            attributes = " ".join(f"{k}={repr(v)}" for k,
+                                  v in node.attributes.items())
+            yield f"{leader}{node.name or '──'} {attributes}"
+            last_i = len(node._children) - 1
+            for i in range(last_i, -1, -1):
+                stack.append((
+                    node._children[i],
+                    prefix + ("└ " if i == last_i else "├ "),
+                    prefix + ("   " if i == last_i else "│  "),
+                ))
+
+    def toTDoc(self) -> str:
+        return "\n".join(self.iterTDoc())
+
+    def __getitem__(self, index: Union[int, str]) -> Any:
+        if isinstance(index, str):
+            if index not in self.attributes:
+                raise IndexError(f"Node has no attribute '{index}': {self}")
+            else:
+                return self.attributes[index]
+        else:
+            return self._children[index]
+
+    # FIXME: Does not seem to work, should check
+    def __contains__(self, value: Union[int, str, 'Node[T]']) -> bool:
+        if isinstance(value, int):
+            return value >= 0 and value < self.count
+        elif isinstance(value, Node):
+            return value.parent is self
+        elif isinstance(value, str):
+            return value in self.attributes
+        else:
+            return False
+
+    def __repr__(self) -> str:
+        return f"<Node:{self.name} {' '.join(str(k)+'='+repr(v) for k,v in self.attributes.items())}{' …' + str(len(self.children)) if self._children else ''}>"
+
+
+def node(name: str, *children: Node[Any], **attributes: Any) -> Node[Any]:
+    res: Node[Any] = Node(name, attributes)
+    return res.setChildren(children)
+
+
+
+
+def toASCIILines(node: Node[Any], prefix: str = "") -> Iterator[str]:
+    # FIXME: It's ~OK but needs improvement
+    p = "─┬" if node.children else "──"
+    yield f"{prefix}{p} {node.name or ':root'}"
+    last_child = len(node.children) - 1
+    prefix = prefix.replace("├", "│").replace("└", " ")
+    for i, child in enumerate(node.children):
+        yield from toASCIILines(child, prefix + (" ├" if i < last_child else " └"))
+
+
+def toSExprLines(node: Node[Any], prefix: str = "", suffix: str = "") -> Iterator[str]:
+    # FIXME: It's ~OK but needs improvement
+    last_child = len(node.children) - 1
+    suffix += ")" if last_child < 0 else ""
+    if node.name == "#text":
+        yield f"{prefix}({node.name or ':root'} {json.dumps(node.data)}{suffix}"
+    else:
+        yield f"{prefix}({node.name or ':root'}{suffix}"
+    if last_child >= 0:
+        child_prefix = " " * len(prefix)
+        for i, child in enumerate(node.children):
+            yield from toSExprLines(child, child_prefix + ("  " if i < last_child else "  "), ")" if i == last_child else "")
+
+
+def toGraphvizLines(root: Node[Any]) -> Iterator[str]:
+    yield "digraph {"
+    for node in root.walk():
+        if node.name:
+            yield f"  {node.id}[label={node.name}];"
+        else:
+            yield f"  {node.id};"
+        for child in node.children:
+            yield f"  {node.id}->{child.id};"
+    yield "}"
+
+
+def withNumbers(lines: Iterable[str]) -> Iterator[str]:
+    for i, line in enumerate(lines):
+        yield f"{i:03d} {line}"
+
+
+def toText(lines: Iterable[str], numbers: bool = False) -> str:
+    return "\n".join(withNumbers(lines) if numbers else lines)
+
+
+def toASCII(node: Node[Any], numbers: bool = False) -> str:
+    return toText(toASCIILines(node), numbers=numbers)
+
+
+def toSExpr(node: Node[Any], numbers: bool = False) -> str:
+    return toText(toSExprLines(node), numbers=numbers)
+
+
+def toGraphviz(node: Node[Any], numbers: bool = False) -> str:
+    return toText(toGraphvizLines(node), numbers=numbers)
+
+# EOF
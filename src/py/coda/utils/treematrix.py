@@ -0,0 +1,189 @@
+from typing import Generic, TypeVar, Iterator, Any, NamedTuple
+from array import array
+
+T = TypeVar("T")
+V = TypeVar("V")
+
+# --
+# # Tree Matrix
+#
+# Stores a tree in a columnar format: node identifiers are interned to
+# integers, and the structure is kept in `parent`, `first child` and `next
+# sibling` integer arrays. This keeps the memory footprint low for large
+# catalogues, and allows for traversals without recursion.
+
+
+class Node(NamedTuple):
+    id: Any
+    value: Any
+    children: list["Node"] | None = None
+
+
+class Encoded(NamedTuple):
+    """A flat preorder encoding of a forest, where `counts[i]` is the
+    number of children of node `ids[i]`."""
+
+    ids: list[Any]
+    values: list[Any]
+    counts: "array[int]"
+
+
+class TreeMatrix(Generic[T, V]):
+    """Stores a tree in matricial format."""
+
+    def __init__(self) -> None:
+        self.keys: list[T] = []
+        self.ids: dict[T, int] = {}
+        self.values: list[V | None] = []
+        # Nodes can be referenced as parents before they are registered.
+        self.registered: bytearray = bytearray()
+        self.parent: array[int] = array("i")
+        self.firstChild: array[int] = array("i")
+        self.lastChild: array[int] = array("i")
+        self.nextSibling: array[int] = array("i")
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def __contains__(self, nid: T) -> bool:
+        return nid in self.ids
+
+    def intern(self, nid: T) -> int:
+        """Returns the integer id for the given node id, creating it
+        if necessary."""
+        if (i := self.ids.get(nid)) is not None:
+            return i
+        self.ids[nid] = i = len(self.keys)
+        self.keys.append(nid)
+        self.values.append(None)
+        self.registered.append(0)
+        self.parent.append(-1)
+        self.firstChild.append(-1)
+        self.lastChild.append(-1)
+        self.nextSibling.append(-1)
+        return i
+
+    def register(self, nid: T, node: V, parent: T | None = None) -> "TreeMatrix[T, V]":
+        i = self.intern(nid)
+        if self.registered[i]:
+            raise RuntimeError(f"Node already registered: {nid}")
+        self.registered[i] = 1
+        self.values[i] = node
+        if parent is not None:
+            self.attach(i, self.intern(parent))
+        return self
+
+    def attach(self, i: int, p: int) -> None:
+        """Attaches the node `i` as the last child of `p`."""
+        if self.parent[i] != -1:
+            raise RuntimeError(f"Node already has a parent: {self.keys[i]}")
+        self.parent[i] = p
+        if (last := self.lastChild[p]) == -1:
+            self.firstChild[p] = i
+        else:
+            self.nextSibling[last] = i
+        self.lastChild[p] = i
+
+    def value(self, nid: T) -> V | None:
+        return self.values[self.ids[nid]]
+
+    def parentOf(self, nid: T) -> T | None:
+        p = self.parent[self.ids[nid]]
+        return None if p == -1 else self.keys[p]
+
+    def children(self, nid: T) -> Iterator[T]:
+        c = self.firstChild[self.ids[nid]]
+        while c != -1:
+            yield self.keys[c]
+            c = self.nextSibling[c]
+
+    def roots(self) -> Iterator[T]:
+        """Iterates on the registered nodes that have no parent, or whose
+        parent was referenced but never registered, so that every
+        registered node is reachable from a root. Parents that were never
+        registered are not roots."""
+        registered = self.registered
+        return (
+            self.keys[i]
+            for i, p in enumerate(self.parent)
+            if registered[i] and (p == -1 or not registered[p])
+        )
+
+    def iwalk(self, root: int) -> Iterator[int]:
+        """Iterates on the integer ids of the subtree at `root`, in preorder.
+        This uses the sibling links, so it needs neither recursion nor
+        a stack."""
+        first_child = self.firstChild
+        next_sibling = self.nextSibling
+        parent = self.parent
+        i = root
+        while True:
+            yield i
+            if (c := first_child[i]) != -1:
+                i = c
+                continue
+            while i != root and next_sibling[i] == -1:
+                i = parent[i]
+            if i == root:
+                return
+            i = next_sibling[i]
+
+    def walk(self, root: T) -> Iterator[T]:
+        keys = self.keys
+        return (keys[_] for _ in self.iwalk(self.ids[root]))
+
+    def encode(self, *roots: T) -> Encoded:
+        """Returns the flat preorder encoding of the subtrees at `roots`,
+        or of the whole forest if no root is given."""
+        ids: list[Any] = []
+        values: list[Any] = []
+        counts: array[int] = array("i")
+        first_child = self.firstChild
+        next_sibling = self.nextSibling
+        for root in roots or tuple(self.roots()):
+            for i in self.iwalk(self.ids[root]):
+                ids.append(self.keys[i])
+                values.append(self.values[i])
+                n = 0
+                c = first_child[i]
+                while c != -1:
+                    n += 1
+                    c = next_sibling[c]
+                counts.append(n)
+        return Encoded(ids, values, counts)
+
+    @staticmethod
+    def Decode(encoded: Encoded) -> "TreeMatrix[Any, Any]":
+        """Creates a tree matrix from its flat preorder encoding."""
+        res: TreeMatrix[Any, Any] = TreeMatrix()
+        # Each entry is `[node, remaining children]`
+        stack: list[list[int]] = []
+        for nid, value, count in zip(*encoded):
+            while stack and stack[-1][1] == 0:
+                stack.pop()
+            i = res.intern(nid)
+            res.registered[i] = 1
+            res.values[i] = value
+            if stack:
+                res.attach(i, stack[-1][0])
+                stack[-1][1] -= 1
+            stack.append([i, count])
+        return res
+
+    def asNode(self, node: T) -> Node:
+        """Returns the subtree at `node` as nested `Node` tuples, built
+        bottom-up from the preorder so that deep trees don't recurse."""
+        order = list(self.iwalk(self.ids[node]))
+        built: dict[int, Node] = {}
+        for i in reversed(order):
+            children: list[Node] | None = None
+            if (c := self.firstChild[i]) != -1:
+                children = []
+                while c != -1:
+                    children.append(built.pop(c))
+                    c = self.nextSibling[c]
+            built[i] = Node(id=self.keys[i], value=self.values[i], children=children)
+        return built[order[0]]
+
+
+# EOF
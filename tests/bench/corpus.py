@@ -0,0 +1,88 @@
+from typing import Iterator, NamedTuple
+from pathlib import Path
+import random
+
+# --
+# # Corpus
+#
+# Generates synthetic Python sources to benchmark the parsers against. The
+# generation is seeded, so that a given corpus is the same from one run to
+# the next. The `density` is the probability for a line to start a Coda
+# block (a `# --` comment followed by a few comment lines).
+
+WORDS: tuple[str, ...] = (
+    "block",
+    "fragment",
+    "symbol",
+    "parse",
+    "render",
+    "index",
+    "value",
+    "path",
+    "line",
+    "offset",
+    "tokens",
+    "module",
+)
+
+
+class Corpus(NamedTuple):
+    files: int = 50
+    lines: int = 400
+    density: float = 0.05
+    seed: int = 0
+
+    def sources(self) -> Iterator[tuple[str, list[str]]]:
+        """Yields the relative path and lines of each file."""
+        rng = random.Random(self.seed)
+        for i in range(self.files):
+            yield f"pkg/mod{i:04d}.py", list(self.source(rng))
+
+    def source(self, rng: random.Random) -> Iterator[str]:
+        n: int = 0
+        while n < self.lines:
+            name = "_".join(rng.sample(WORDS, 2))
+            if rng.random() < self.density:
+                yield "# --\n"
+                yield f"# # {name.title()}\n"
+                for _ in range(rng.randint(1, 4)):
+                    yield f"# {' '.join(rng.choices(WORDS, k=8))}\n"
+                n += 3
+            elif rng.random() < 0.2:
+                yield f"class {name.title().replace('_', '')}:\n"
+                yield f'    """{" ".join(rng.choices(WORDS, k=6))}"""\n'
+                n += 2
+            else:
+                yield f"def {name}(value: int) -> int:\n"
+                yield f"    return value + {rng.randint(0, 1000)}\n"
+                yield "\n"
+                n += 3
+
+    def write(self, path: str | Path) -> list[Path]:
+        """Writes the corpus in the given directory, returning the paths."""
+        res: list[Path] = []
+        for rel, lines in self.sources():
+            p = Path(path) / rel
+            p.parent.mkdir(parents=True, exist_ok=True)
+            with open(p, "wt") as f:
+                f.writelines(lines)
+            res.append(p)
+        return res
+
+    def tags(self, path: str | Path) -> list[str]:
+        """Returns the lines of a ctags file for the corpus written at the
+        given path, with one entry per function and class."""
+        res: list[str] = ["!_TAG_FILE_FORMAT\t2\t/extended format/\n"]
+        for rel, lines in self.sources():
+            for line in lines:
+                if line.startswith(("def ", "class ")):
+                    kind, rest = line.split(" ", 1)
+                    symbol = rest.split("(", 1)[0].split(":", 1)[0]
+                    res.append(
+                        f"{symbol}\t{rel}\t/^{line.rstrip()}$/;\"\t"
+                        f"{'f' if kind == 'def' else 'c'}\n"
+                    )
+        return sorted(res)
+
+
+# EOF
@@ -0,0 +1,221 @@
+#!/usr/bin/env python
+from typing import Any, Callable, NamedTuple
+from pathlib import Path
+import gc
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "..", "src", "py"))
+sys.path.insert(0, os.path.dirname(__file__))
+
+from corpus import Corpus  # noqa: E402
+from coda.model import Fragment  # noqa: E402
+from coda.parser.blocks import BlockParser  # noqa: E402
+from coda.parser.ctags import Tags  # noqa: E402
+from coda.utils.compiled import compiled  # noqa: E402
+from coda.utils.export import asPrimitive  # noqa: E402
+
+# --
+# # Benchmarks
+#
+# Times the hot paths of the parsers over a synthetic corpus (see `Corpus`).
+# Each benchmark is a function that takes the corpus directory and returns
+# the function to time, so that the setup is not measured. Timings are the
+# best of the repeated runs (the least disturbed by the rest of the system),
+# with the garbage collector disabled, and the memory peak is measured in a
+# separate run with `tracemalloc`.
+#
+# Results are compared against a JSON baseline, and the run fails when a
+# benchmark is slower (or uses more memory) than its baseline by more than
+# the threshold. Baselines are specific to a machine and a corpus, and are
+# not versioned: create or update them with `--save` (`make bench-baseline`).
+# The pure Python and mypyc-compiled modules (see `coda.utils.compiled`) each
+# have their own baseline.
+
+MODE: str = "mypyc" if compiled() else "pure"
+BASELINE: Path = Path(__file__).parent / f"baseline-{MODE}.json"
+THRESHOLD: float = 0.25
+DEFAULTS: dict[str, Any] = Corpus._field_defaults
+BENCHMARKS: dict[str, Callable[[Path, Corpus], Callable[[], Any]]] = {}
+
+
+class Result(NamedTuple):
+    time: float
+    peak: int
+    runs: int
+
+
+def benchmark(name: str):
+    def decorator(setup: Callable[[Path, Corpus], Callable[[], Any]]):
+        BENCHMARKS[name] = setup
+        return setup
+
+    return decorator
+
+
+@benchmark("blocks")
+def benchBlocks(path: Path, corpus: Corpus) -> Callable[[], Any]:
+    sources = [(str(rel), lines) for rel, lines in corpus.sources()]
+
+    def run() -> int:
+        n: int = 0
+        for rel, lines in sources:
+            for _ in BlockParser.Blocks(
+                BlockParser.BlockLines(BlockParser.Lines(lines, path=rel))
+            ):
+                n += 1
+        return n
+
+    return run
+
+
+@benchmark("tags.parse")
+def benchTagsParse(path: Path, corpus: Corpus) -> Callable[[], Any]:
+    tags = corpus.tags(path)
+    tagsfile = path / "tags"
+
+    def run() -> int:
+        return sum(1 for _ in Tags.Parse(iter(tags), path=tagsfile))
+
+    return run
+
+
+@benchmark("fragment.find")
+def benchFragmentFind(path: Path, corpus: Corpus) -> Callable[[], Any]:
+    queries: list[tuple[Path, str]] = []
+    for line in corpus.tags(path)[1:]:
+        symbol, rel, pattern = line.split("\t", 3)[:3]
+        # Both the anchored ctags patterns and plain text searches
+        queries.append((path / rel, pattern))
+        queries.append((path / rel, symbol))
+
+    def run() -> int:
+        return sum(len(list(Fragment.Find(p, q, base=path))) for p, q in queries)
+
+    return run
+
+
+@benchmark("asPrimitive")
+def benchAsPrimitive(path: Path, corpus: Corpus) -> Callable[[], Any]:
+    entries = list(Tags.Parse(iter(corpus.tags(path)), path=path / "tags"))
+
+    def run() -> int:
+        return len(asPrimitive(entries))
+
+    return run
+
+
+def measure(run: Callable[[], Any], repeat: int) -> Result:
+    # Warm up, so that caches and lazy compilation are not measured.
+    run()
+    times: list[float] = []
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        for _ in range(repeat):
+            t = time.perf_counter()
+            run()
+            times.append(time.perf_counter() - t)
+    finally:
+        if enabled:
+            gc.enable()
+    tracemalloc.start()
+    try:
+        run()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return Result(min(times), peak, repeat)
+
+
+def compare(
+    results: dict[str, Result], baseline: dict[str, Any], threshold: float
+) -> list[str]:
+    """Returns the regressions of the results against the baseline."""
+    res: list[str] = []
+    for name, result in results.items():
+        if not (base := baseline.get("results", {}).get(name)):
+            continue
+        for metric in ("time", "peak"):
+            current, previous = getattr(result, metric), base[metric]
+            if previous and current > previous * (1.0 + threshold):
+                res.append(
+                    f"{name} {metric} {current / previous - 1.0:+.0%}"
+                    f" ({previous:.6g} → {current:.6g})"
+                )
+    return res
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Runs the Coda benchmarks")
+    parser.add_argument("names", nargs="*", help="Benchmarks to run (default all)")
+    parser.add_argument("-f", "--files", type=int, default=DEFAULTS["files"])
+    parser.add_argument("-l", "--lines", type=int, default=DEFAULTS["lines"])
+    parser.add_argument("-d", "--density", type=float, default=DEFAULTS["density"])
+    parser.add_argument("-s", "--seed", type=int, default=DEFAULTS["seed"])
+    parser.add_argument("-r", "--repeat", type=int, default=5)
+    parser.add_argument("-b", "--baseline", default=str(BASELINE))
+    parser.add_argument("-t", "--threshold", type=float, default=THRESHOLD)
+    parser.add_argument(
+        "--save", action="store_true", help="Saves the results as the baseline"
+    )
+    args = parser.parse_args()
+    if unknown := [_ for _ in args.names if _ not in BENCHMARKS]:
+        parser.error(f"Unknown benchmarks: {', '.join(unknown)}")
+    corpus = Corpus(args.files, args.lines, args.density, args.seed)
+    try:
+        with open(args.baseline, "rt") as f:
+            baseline = json.load(f)
+    except FileNotFoundError:
+        if not args.save:
+            print(f"--- No baseline at {args.baseline}, create it with --save")
+        baseline = {}
+    if baseline and baseline.get("corpus") != list(corpus):
+        print(f"--- Baseline corpus differs {baseline.get('corpus')}, ignoring it")
+        baseline = {}
+
+    print(f"--- BENCH MODE {MODE} {' '.join(compiled())}".rstrip())
+    results: dict[str, Result] = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        corpus.write(tmp)
+        for name, setup in BENCHMARKS.items():
+            if args.names and name not in args.names:
+                continue
+            results[name] = result = measure(setup(Path(tmp), corpus), args.repeat)
+            print(
+                f"--- BENCH {name:<16} {result.time * 1000:>9.2f}ms"
+                f" {result.peak / 1024:>9.0f}KiB"
+            )
+
+    if args.save:
+        saved = {
+            **baseline.get("results", {}),
+            **{k: v._asdict() for k, v in results.items()},
+        }
+        with open(args.baseline, "wt") as f:
+            json.dump(
+                {
+                    "corpus": list(corpus),
+                    "python": sys.version.split()[0],
+                    "mode": MODE,
+                    "results": saved,
+                },
+                f,
+                indent=2,
+            )
+            f.write("\n")
+        print(f"... OK Saved baseline {args.baseline}")
+    elif regressions := compare(results, baseline, args.threshold):
+        for _ in regressions:
+            print(f"!!! FAIL {_}")
+        sys.exit(1)
+    else:
+        print(f"... OK {len(results)} benchmarks within {args.threshold:.0%}")
+
+# EOF
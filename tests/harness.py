@@ -3,7 +3,9 @@ import sys
 import os
 import subprocess
 import shutil
+import tempfile
 import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 # --
 # # Harness
@@ -12,33 +14,44 @@ import time
 # [Test Anything Protocol](http://testanything.org/) with a focus on nicer
 # looking, more parseable output.
 #
+# Tests run concurrently in a pool of `JOBS` workers, each in its own
+# temporary directory (given as `TESTDIR`). The output of a test is
+# buffered and written in one piece when it completes, so results stream
+# as tests finish without interleaving. Unless `KEEP_GOING` is set, the
+# tests that haven't started yet are cancelled after the first failure, and
+# reported as not run, while the ones already running complete and are
+# reported.
+#
 # Note that the implementation uses binary output as we never know what the
 # commands might spit out.
 
 ENCODING = sys.stdout.encoding
 QUIET = os.getenv("QUIET", "").lower() in ("1", "true")
+KEEP_GOING = os.getenv("KEEP_GOING", "").lower() in ("1", "true")
+JOBS = int(os.getenv("JOBS", "0")) or os.cpu_count() or 1
 RUNNERS = {
     "py": os.getenv("PYTHON", "python"),
     "sh": os.getenv("BASH", "bash"),
 }
 
 
-TMPDIR = os.path.abspath(".tmp")
-
-
 def run(path: str, out, quiet=QUIET):
-    out(b"--- TEST ")
-    out(bytes(path, ENCODING))
-    out(b"\n")
+    buffer: list[bytes] = []
+    write = buffer.append
+    write(b"--- TEST ")
+    write(bytes(path, ENCODING))
+    write(b"\n")
     now = time.time()
-    # We create a temporary directory
-    if not os.path.exists(TMPDIR):
-        os.mkdir(TMPDIR)
-    os.environ["TESTDIR"] = TMPDIR
-    res = subprocess.run(
-        [RUNNERS[path.rsplit(".", 1)[-1]], path], stdout=subprocess.PIPE
-    )
-    shutil.rmtree(TMPDIR)
+    # Each test gets its own temporary directory
+    tmpdir = tempfile.mkdtemp(prefix=f"coda-{os.path.basename(path)}-")
+    try:
+        res = subprocess.run(
+            [RUNNERS[path.rsplit(".", 1)[-1]], path],
+            stdout=subprocess.PIPE,
+            env={**os.environ, "TESTDIR": tmpdir},
+        )
+    finally:
+        shutil.rmtree(tmpdir, ignore_errors=True)
     oks = 0
     fails = 0
     if success := res.returncode == 0:
@@ -46,45 +59,71 @@ def run(path: str, out, quiet=QUIET):
             if line.startswith(b"!!! FAIL ") or line.startswith(b"!! FAIL"):
                 fails += 1
                 if not quiet:
-                    out(b"!!! \t")
+                    write(b"!!! \t")
             elif line.startswith(b"... OK ") or line.startswith(b".. OK"):
                 oks += 1
                 if not quiet:
-                    out(b"... \t")
+                    write(b"... \t")
             elif not quiet:
-                out(b"\t")
+                write(b"\t")
             if not quiet:
-                out(line)
-                out(b"\n")
+                write(line)
+                write(b"\n")
     if success and not fails:
-        out(b"... OK")
+        write(b"... OK")
     else:
-        out(b"!!! FAIL")
-    out(bytes(f" TIME {time.time() - now:0.2f}s ", ENCODING))
-    out(bytes(path, ENCODING))
-    out(b"\n")
+        write(b"!!! FAIL")
+    write(bytes(f" TIME {time.time() - now:0.2f}s ", ENCODING))
+    write(bytes(path, ENCODING))
+    write(b"\n")
+    out(b"".join(buffer))
     return success and not fails
 
 
-def run_tests(args=sys.argv[1:], out=lambda _: None):
-    success = True
+def run_tests(args=sys.argv[1:], out=lambda _: None, jobs=JOBS, keep_going=KEEP_GOING):
     now = time.time()
     out(bytes(f"--- TEST Harness EXPECT {len(args)}\n", ENCODING))
-    for path in args:
-        success = success and run(path, out)
-        if not success:
-            out(b"===\n")
+    failed: list[str] = []
+    with ThreadPoolExecutor(max(1, jobs)) as pool:
+        futures = {pool.submit(run, path, out): path for path in args}
+        for future in as_completed(futures):
+            if future.cancelled():
+                continue
+            elif not future.result():
+                failed.append(futures[future])
+                if not keep_going:
+                    for _ in futures:
+                        _.cancel()
+    if failed:
+        out(b"===\n")
+        for path in failed:
             out(b"!!! FAIL ")
             out(bytes(path, ENCODING))
             out(b"\n")
-            return False
+        for path in (futures[_] for _ in futures if _.cancelled()):
+            out(b"--- SKIP ")
+            out(bytes(path, ENCODING))
+            out(b" not run\n")
+        return False
     out(bytes(f"... OK TIME {time.time() - now:0.2f}s\n", ENCODING))
     return True
 
 
 if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Runs tests with TAP-like output")
+    parser.add_argument("tests", nargs="*")
+    parser.add_argument("-j", "--jobs", type=int, default=JOBS)
+    parser.add_argument("-k", "--keep-going", action="store_true", default=KEEP_GOING)
+    args = parser.parse_args()
     with open("/dev/stdout", "wb") as f:
-        if run_tests(out=f.write):
+
+        def out(data: bytes):
+            f.write(data)
+            f.flush()
+
+        if run_tests(args.tests, out, jobs=args.jobs, keep_going=args.keep_going):
             f.write(b"\nEOK\n")
             sys.exit(0)
         else:
@@ -0,0 +1,52 @@
+from pathlib import Path
+import contextlib
+import io
+import json
+import os
+import subprocess
+import sys
+import coda
+from coda.cli import COMMANDS, main, usage
+
+# --
+# ## Dispatching
+stderr = io.StringIO()
+with contextlib.redirect_stderr(stderr):
+    assert main(["nope"]) == 2
+assert "unknown command 'nope'" in stderr.getvalue(), stderr.getvalue()
+assert usage() in stderr.getvalue()
+
+stdout = io.StringIO()
+with contextlib.redirect_stdout(stdout):
+    assert main([]) == 0
+    assert main(["--help"]) == 0
+assert stdout.getvalue() == f"{usage()}\n{usage()}\n"
+assert all(f"  {_} " in usage() for _ in COMMANDS)
+
+# --
+# ## Lazy imports
+# Only the module of the command is run, without importing the others, which
+# is checked in a fresh interpreter.
+source = Path(coda.__file__).parent / "cli.py"
+script = """
+import json, sys
+from coda.cli import main
+rc = main(sys.argv[1:])
+print(json.dumps([rc, sorted(_ for _ in sys.modules if _.startswith("coda"))]))
+"""
+result = subprocess.run(
+    [sys.executable, "-c", script, "blocks", str(source)],
+    capture_output=True,
+    text=True,
+    env={**os.environ, "PYTHONPATH": os.pathsep.join(sys.path)},
+    check=True,
+)
+rc, modules = json.loads(result.stdout.rstrip("\n").rsplit("\n", 1)[-1])
+assert rc == 0, result.stderr
+for name in ("coda.render.html", "coda.render.site", "coda.pipeline"):
+    assert name not in modules, modules
+assert "coda.model" in modules, modules
+# The command runs from source, even when the module is compiled
+assert result.stdout.startswith("<<<\n0 from typing import"), result.stdout
+
+# EOF
@@ -0,0 +1,42 @@
+from coda.collect.files import Files, Ignore
+from pathlib import Path
+import tempfile
+
+ignore = Ignore().extend(["*.log", "!keep.log", "build/", "/root.txt", "docs/**/*.tmp"])
+assert ignore.ignores("a.log") and ignore.ignores("sub/a.log")
+assert not ignore.ignores("sub/keep.log"), "Negated rules re-include"
+assert ignore.ignores("build", True) and not ignore.ignores("build"), "Directory rules"
+assert ignore.ignores("root.txt") and not ignore.ignores("sub/root.txt"), "Anchored"
+assert ignore.ignores("docs/a/b/c.tmp") and not ignore.ignores("c.tmp")
+
+with tempfile.TemporaryDirectory() as base:
+    for path in (
+        "a.py",
+        "b.txt",
+        "debug.log",
+        "src/c.py",
+        "src/gen/d.py",
+        "src/.gitignore",
+        "node_modules/e.py",
+        "build/f.py",
+    ):
+        (Path(base) / path).parent.mkdir(parents=True, exist_ok=True)
+        (Path(base) / path).write_text("")
+    (Path(base) / ".gitignore").write_text("*.log\nbuild/\n")
+    (Path(base) / "src/.gitignore").write_text("gen\n")
+    paths = list(Files.Walk(base))
+    assert paths == [".gitignore", "a.py", "b.txt", "src/.gitignore", "src/c.py"], paths
+    assert list(Files.Walk(base, includes=["*.py"])) == ["a.py", "src/c.py"]
+    assert list(Files.Walk(base, excludes=[".*"], gitignore=False)) == [
+        "a.py",
+        "b.txt",
+        "debug.log",
+        "build/f.py",
+        "src/c.py",
+        "src/gen/d.py",
+    ]
+    catalogue = Files.Catalogue(Files.Walk(base, includes=["*.py"]))
+    assert sorted(catalogue.roots()) == ["a.py", "src"]
+    assert list(catalogue.children("src")) == ["src/c.py"]
+    assert catalogue.value("src/c.py").file == ("c", ".py", None)
+# EOF
@@ -0,0 +1,81 @@
+from pathlib import Path
+import os
+import sys
+import tempfile
+import time
+from coda.collect.inspect import Introspector, submodules
+
+base = Path(tempfile.mkdtemp(dir=os.environ.get("TESTDIR")))
+package = base / "inspected"
+package.mkdir()
+modules = {
+    "__init__.py": "",
+    "ok.py": "A = 1\n\n\nclass C:\n    def m(self):\n        pass\n",
+    "fails.py": "raise ValueError('broken')\n",
+    # The worker never returns
+    "hangs.py": "import time\ntime.sleep(60)\n",
+    "hangs2.py": "import time\ntime.sleep(60)\n",
+    # The worker process dies
+    "crashes.py": "import os\nos._exit(1)\n",
+    # Healthy, but slow enough to be still queued when the first timeouts hit
+    **{f"slow{i}.py": "import time\ntime.sleep(0.5)\n" for i in range(4)},
+}
+for name, text in modules.items():
+    (package / name).write_text(text)
+sys.path.insert(0, str(base))
+os.environ["PYTHONPATH"] = os.pathsep.join(
+    [str(base), *filter(None, [os.environ.get("PYTHONPATH")])]
+)
+
+found = dict(submodules("inspected"))
+assert set(found) == {
+    "inspected",
+    *(f"inspected.{_[:-3]}" for _ in modules if _ != "__init__.py"),
+}, found
+
+# There are as many stuck modules as workers, which are killed and replaced
+# once their own module timed out, so that the modules queued after them
+# still get their full timeout.
+order = [
+    "inspected.hangs",
+    "inspected.hangs2",
+    "inspected.crashes",
+    "inspected.fails",
+    "inspected.ok",
+    *(f"inspected.slow{_}" for _ in range(4)),
+]
+t = time.monotonic()
+results = {
+    _.module: _
+    for _ in Introspector.Run(((_, found[_]) for _ in order), jobs=2, timeout=1.5)
+}
+elapsed = time.monotonic() - t
+assert elapsed < 6.0, elapsed
+assert set(results) == set(order), results
+
+for name in ("inspected.hangs", "inspected.hangs2"):
+    assert results[name].records is None
+    assert results[name].error == "Timed out after 1.5s", results[name]
+# A worker that dies is reported as such, without waiting for the timeout
+assert results["inspected.crashes"].records is None
+assert results["inspected.crashes"].error == "Worker crashed (exit code 1)"
+assert results["inspected.fails"].error == "ValueError: broken"
+for i in range(4):
+    assert results[f"inspected.slow{i}"].records is not None, results
+records = {_.qualname: _ for _ in results["inspected.ok"].records or []}
+assert set(records) == {
+    "inspected.ok",
+    "inspected.ok.A",
+    "inspected.ok.C",
+    "inspected.ok.C.m",
+}, records
+assert records["inspected.ok.C.m"].line == 5, records
+
+# Workers are replaced after a number of modules, and results are cached
+cache = base / "cache"
+healthy = [(_, found[_]) for _ in ("inspected.ok", "inspected.fails")]
+first = list(Introspector.Run(healthy, jobs=1, tasksPerWorker=1, cache=cache))
+assert [_.error for _ in first] == [None, "ValueError: broken"], first
+assert list(Introspector.Run(healthy[:1], cache=cache)) == first[:1]
+
+# EOF
@@ -0,0 +1,62 @@
+from io import BytesIO
+from coda.model import Fragment, SymbolIndex, SymbolType
+
+index = SymbolIndex()
+for qualname, type in (
+    ("coda.model.Fragment", SymbolType.Class),
+    ("coda.model.Fragment.Find", SymbolType.Method),
+    ("coda.model.Fragment.read", SymbolType.Method),
+    ("coda.parser.blocks.BlockParser", SymbolType.Class),
+    ("coda.parser.blocks.Block", SymbolType.Class),
+    ("coda.utils.export.asPrimitive", SymbolType.Function),
+    ("coda.model.SymbolType", None),
+):
+    index.define(
+        qualname,
+        type,
+        Fragment(offset=len(qualname), length=4, line=1, column=0, path="a.py"),
+    )
+
+# Qualnames are unique
+assert index.define("coda.model.Fragment") == 0
+assert len(index) == 7
+
+# Prefix search is ordered and bounded by the prefix
+assert [_.qualname for _ in index.prefixed("coda.model.Fragment")] == [
+    "coda.model.Fragment",
+    "coda.model.Fragment.Find",
+    "coda.model.Fragment.read",
+]
+assert [_.qualname for _ in index.prefixed("coda.parser", limit=1)] == [
+    "coda.parser.blocks.Block"
+]
+assert list(index.prefixed("zzz")) == []
+
+# Name lookup
+assert [_.qualname for _ in index.named("Block")] == ["coda.parser.blocks.Block"]
+assert index["coda.model.Fragment.Find"].parent == "coda.model.Fragment"
+assert index["coda.model.SymbolType"].type is None
+
+# References
+fragment = Fragment(offset=10, length=8, line=2, column=4, path="b.py")
+index.reference("coda.model.Fragment", fragment)
+index.reference("coda.parser.blocks.Block", fragment._replace(offset=20))
+index.reference("coda.model.Fragment", fragment._replace(offset=30))
+assert [_.fragment.offset for _ in index.references("coda.model.Fragment")] == [10, 30]
+assert index.references("coda.utils.export.asPrimitive") == []
+
+# Binary roundtrip
+buffer = BytesIO()
+index.write(buffer)
+buffer.seek(0)
+loaded = SymbolIndex.Read(buffer)
+assert loaded.qualnames == index.qualnames
+for i in range(len(index)):
+    assert loaded.definition(i) == index.definition(i)
+assert loaded.references("coda.model.Fragment") == index.references(
+    "coda.model.Fragment"
+)
+assert [_.qualname for _ in loaded.prefixed("coda.utils")] == [
+    "coda.utils.export.asPrimitive"
+]
+# EOF
@@ -0,0 +1,81 @@
+from pathlib import Path
+import os
+import stat
+import tempfile
+from coda.parser.ctags import BATCH_SIZE, Tags
+
+base = Path(tempfile.mkdtemp(dir=os.environ.get("TESTDIR")))
+os.chdir(base)
+for name in (
+    "src/a.py",
+    "src/b.txt",
+    "src/pkg/c.py",
+    "src/pkg/sub/d.py",
+    "src/.hidden.py",
+    "src/.hdir/e.py",
+    "src/.git/f.py",
+    "docs/x.md",
+):
+    Path(name).parent.mkdir(parents=True, exist_ok=True)
+    Path(name).touch()
+
+# --
+# ## Expansion
+assert Tags.Expand("src/*.py") == ["src/a.py"]
+# `**` matches any number of directories, including none
+assert Tags.Expand("src/**/*.py") == ["src/a.py", "src/pkg/c.py", "src/pkg/sub/d.py"]
+assert Tags.Expand("**/*.md", "src/**/*.py") == [
+    "docs/x.md",
+    "src/a.py",
+    "src/pkg/c.py",
+    "src/pkg/sub/d.py",
+]
+# Wildcards only match hidden files when the pattern does
+assert Tags.Expand("src/.*.py") == ["src/.hidden.py"]
+assert "src/.hdir/e.py" not in Tags.Expand("src/**")
+# Nested bases are walked once, and matched relative to their own base
+assert Tags.Expand("src/*.py", "src/pkg/*.py") == ["src/a.py", "src/pkg/c.py"]
+# Paths are unique, with the leading `./` stripped
+assert Tags.Expand("src/a.py", "./src/a.py", "src/*.py", "./src/*.py") == ["src/a.py"]
+
+# --
+# ## Differences with `glob`
+# Matched directories are expanded to all the files below them, skipping the
+# pruned directories.
+assert Tags.Expand("src/p*") == ["src/pkg/c.py", "src/pkg/sub/d.py"]
+assert Tags.Expand("src/**") == [
+    "src/a.py",
+    "src/b.txt",
+    "src/pkg/c.py",
+    "src/pkg/sub/d.py",
+]
+# Paths without wildcards are passed through, when they exist
+assert Tags.Expand("src/pkg", "src/b.txt", "nope.py") == ["src/pkg", "src/b.txt"]
+
+# --
+# ## Batching
+# A `ctags` that logs the number of paths it's given, and its arguments.
+tools = base / "bin"
+tools.mkdir()
+(tools / "ctags").write_text(
+    "#!/bin/sh\n"
+    'echo "$(grep -c \'\') $*" >> "$CTAGS_LOG"\n'
+    "printf '!_TAG_FILE_FORMAT\\t2\\t/extended format/\\n' > tags\n"
+)
+(tools / "ctags").chmod(stat.S_IRWXU)
+os.environ["PATH"] = f"{tools}{os.pathsep}{os.environ['PATH']}"
+os.environ["CTAGS_LOG"] = str(base / "ctags.log")
+
+many = base / "many"
+many.mkdir()
+for i in range(BATCH_SIZE + 1):
+    (many / f"m{i:05d}.py").touch()
+assert list(Tags.Make("many/*.py")) == []
+runs = [_.split() for _ in (base / "ctags.log").read_text().splitlines()]
+# The batches after the first one are appended to the same tags file
+assert [(int(_[0]), "--append=yes" in _) for _ in runs] == [
+    (BATCH_SIZE, False),
+    (1, True),
+], runs
+
+# EOF
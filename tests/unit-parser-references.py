@@ -0,0 +1,57 @@
+from coda.model import Fragment, SymbolIndex, SymbolType
+from coda.parser.blocks import BlockParser
+from coda.parser.references import ReferenceParser
+
+EXAMPLE = """\
+from .model import Fragment
+# --
+# Tags are parsed with `Tags.Parse`, which creates `Fragment`s
+class Tags:
+    def Parse(cls):
+        return cls.Find(Fragment)
+    def Find(cls):
+        return Parse
+"""
+
+
+def fragment(text: str, end: str | None = None) -> Fragment:
+    offset = EXAMPLE.index(text)
+    return Fragment(
+        offset=offset,
+        length=(EXAMPLE.index(end) if end else len(EXAMPLE)) - offset,
+        line=EXAMPLE.count("\n", 0, offset),
+        column=0,
+        path="tags.py",
+    )
+
+
+index = SymbolIndex()
+index.define("model.Fragment", SymbolType.Class)
+index.define("tags.Tags", SymbolType.Class, fragment("class Tags"))
+index.define("tags.Tags.Parse", SymbolType.Method, fragment("    def Parse", "    def Find"))
+index.define("tags.Tags.Find", SymbolType.Method, fragment("    def Find"))
+index.define("other.Find", SymbolType.Function)
+
+blocks = list(
+    BlockParser.Blocks(
+        BlockParser.BlockLines(BlockParser.Lines(EXAMPLE.splitlines(True)))
+    )
+)
+edges = ReferenceParser.Resolve(EXAMPLE, blocks, index, path="tags.py", scope="tags")
+assert [
+    (edges.blocks[i], index.qualnames[s], edges.lines[i], edges.columns[i])
+    for i, s in enumerate(edges.symbols)
+] == [
+    (0, "model.Fragment", 0, 19),
+    (1, "tags.Tags", 2, 2),
+    (1, "tags.Tags.Parse", 2, 24),
+    (1, "model.Fragment", 2, 52),
+    (2, "tags.Tags.Find", 5, 15),
+    (2, "model.Fragment", 5, 24),
+    # `Parse` is resolved within `Tags`, not as the `Find` method's scope
+    (2, "tags.Tags.Parse", 7, 15),
+], edges
+
+assert edges.register(index, "tags.py") == 7
+assert [_.fragment.line for _ in index.references("model.Fragment")] == [0, 2, 5]
+# EOF
@@ -0,0 +1,97 @@
+from pathlib import Path
+from typing import Any
+import os
+import tempfile
+from coda.pipeline import ALL, Pipeline, Stage
+
+base = Path(tempfile.mkdtemp(dir=os.environ.get("TESTDIR")))
+paths = [str(base / f"{_}.txt") for _ in "abc"]
+for path in paths:
+    Path(path).write_text(f"{Path(path).stem}\n")
+calls: list[tuple[str, str]] = []
+
+
+def parse(path: str, inputs: dict[str, Any]) -> str:
+    calls.append(("parse", path))
+    text = Path(path).read_text()
+    if text.startswith("!"):
+        raise ValueError(text.strip())
+    return text.strip()
+
+
+def render(path: str, inputs: dict[str, Any]) -> str:
+    calls.append(("render", path))
+    return f"<{inputs['parse']}>"
+
+
+def summary(path: str, inputs: dict[str, Any]) -> str:
+    calls.append(("summary", path))
+    return "".join(inputs["parse"][_] for _ in sorted(inputs["parse"]))
+
+
+pipeline = Pipeline(
+    Stage("parse", parse, cached=True),
+    Stage("render", render, ("parse",)),
+    Stage("summary", summary, ("parse",), shared=True),
+    cache=base / "cache",
+)
+
+# --
+# ## Ordering
+# With one worker, each file goes through all its stages before the next
+# file is parsed, and the shared stage waits for all the files. The latest
+# stages go first, so the summary runs before the last render.
+outcomes = list(pipeline.Run(paths, jobs=1))
+assert [(_.stage, _.path) for _ in outcomes] == calls, (outcomes, calls)
+assert calls == [
+    ("parse", paths[0]),
+    ("render", paths[0]),
+    ("parse", paths[1]),
+    ("render", paths[1]),
+    ("parse", paths[2]),
+    ("summary", ALL),
+    ("render", paths[2]),
+], calls
+assert not any(_.cached or _.error for _ in outcomes), outcomes
+assert {_.stage: _.value for _ in outcomes}["summary"] == "abc", outcomes
+assert [_.value for _ in outcomes if _.stage == "render"] == ["<a>", "<b>", "<c>"]
+
+# --
+# ## Cache hits
+# Cached stages are not run again, unless their file changed, which the
+# same pipeline sees from one run to the next.
+calls.clear()
+Path(paths[1]).write_text("B\n")
+outcomes = list(pipeline.Run(paths, jobs=2))
+assert {(_.stage, _.path) for _ in outcomes if _.cached} == {
+    ("parse", paths[0]),
+    ("parse", paths[2]),
+}, outcomes
+assert ("parse", paths[1]) in calls and ("parse", paths[0]) not in calls, calls
+assert {_.stage: _.value for _ in outcomes}["summary"] == "aBc", outcomes
+
+# --
+# ## Failures
+# The dependents of a failed task are skipped, the other files still run.
+calls.clear()
+Path(paths[1]).write_text("!broken\n")
+outcomes = list(pipeline.Run(paths, jobs=2))
+errors = {(_.stage, _.path): _.error for _ in outcomes if _.error}
+assert set(errors) == {
+    ("parse", paths[1]),
+    ("render", paths[1]),
+    ("summary", ALL),
+}, errors
+assert isinstance(errors[("parse", paths[1])], ValueError)
+assert str(errors[("render", paths[1])]).startswith("Skipped"), errors
+assert ("render", paths[1]) not in calls and ("summary", ALL) not in calls, calls
+assert len(outcomes) == 2 * len(paths) + 1, outcomes
+
+# Stages can only require the stages declared before them
+try:
+    Pipeline(Stage("render", render, ("parse",)))
+    raise AssertionError("Expected a ValueError")
+except ValueError:
+    pass
+
+# EOF
@@ -0,0 +1,80 @@
+from pathlib import Path
+import os
+import tempfile
+from coda.render.cache import Manifest, digest, pageKey
+from coda.render.site import Site
+
+base = Path(tempfile.mkdtemp(dir=os.environ.get("TESTDIR")))
+output = base / "dist"
+sources = [base / f"{_}.py" for _ in "abc"]
+for i, path in enumerate(sources):
+    path.write_text(f"# --\n# Module {i}\nvalue = {i}\n")
+manifest_path = output / ".coda-manifest.json"
+
+
+def build(tokens: str = "") -> list[tuple[str, int]]:
+    """Renders the sources like the site command, with the saved manifest."""
+    manifest = Manifest.Load(manifest_path)
+    try:
+        return list(
+            Site.Run(
+                Site.Pages(sources, output, base=base, tokens=tokens),
+                jobs=1,
+                manifest=manifest,
+            )
+        )
+    finally:
+        manifest.save()
+
+
+def mtimes() -> dict[str, int]:
+    return {str(_): _.stat().st_mtime_ns for _ in output.glob("*.html")}
+
+
+# --
+# ## Keys
+# Each input is part of the key, and chunk boundaries matter.
+key = pageKey(b"a", b"b", "s", "t")
+assert key == pageKey(b"a", b"b", "s", "t")
+assert len({key, pageKey(b"x", b"b", "s", "t"), pageKey(b"a", b"b", "s", "u")}) == 3
+assert digest("ab", "c") != digest("a", "bc")
+
+# --
+# ## Skipping fresh pages
+rendered = build()
+assert len(rendered) == 3 and all(size > 0 for _, size in rendered), rendered
+# Outputs are backdated, so that a rewrite would show in their mtime
+for path in output.glob("*.html"):
+    os.utime(path, ns=(1_000_000_000, 1_000_000_000))
+before = mtimes()
+# A second run neither renders nor writes anything
+assert build() == []
+assert mtimes() == before
+
+# Changing a source only renders its page again
+sources[1].write_text("# --\n# Module 1, changed\nvalue = 1\n")
+assert [_ for _, size in build()] == [str(output / "b.py.html")]
+after = mtimes()
+assert after[str(output / "b.py.html")] != before[str(output / "b.py.html")]
+assert {k: v for k, v in after.items() if not k.endswith("b.py.html")} == {
+    k: v for k, v in before.items() if not k.endswith("b.py.html")
+}
+assert "Module 1, changed" in (output / "b.py.html").read_text()
+
+# --
+# ## Manifest
+manifest = Manifest.Load(manifest_path)
+assert set(manifest.entries) == {str(output / f"{_}.py.html") for _ in "abc"}
+page = next(Site.Pages(sources[:1], output, base=base))
+assert manifest.isFresh(page.output, page.key)
+assert not manifest.isFresh(page.output, pageKey(b"", b"", ""))
+# Removed outputs are rendered again, and so are pages with other tokens
+os.unlink(page.output)
+assert not manifest.isFresh(page.output, page.key)
+assert [_ for _, size in build()] == [page.output]
+assert len(build(tokens=digest("tokens"))) == 3
+# A corrupted manifest means that everything is rendered
+manifest_path.write_text("{")
+assert Manifest.Load(manifest_path).entries == {}
+
+# EOF
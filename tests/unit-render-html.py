@@ -0,0 +1,51 @@
+from itertools import count
+from coda.parser.blocks import BlockParser
+from coda.render.html import HTMLRenderer
+
+SOURCE = """\
+import os
+
+# --
+# # Title
+#   Indented <doc>
+#
+# -- meta "x"
+# More
+def f(a):
+    # A comment
+    return a & 1
+    # -- not a block
+"""
+lines = SOURCE.splitlines(True)
+
+# The streamed output is the same as rendering each parsed block
+blocks = BlockParser.Blocks(BlockParser.BlockLines(BlockParser.Lines(lines)))
+expected = ""
+for block in blocks:
+    o = block.fragment.offset
+    expected += "".join(
+        HTMLRenderer.Block(
+            block, SOURCE[o : o + block.fragment.length].splitlines(True)
+        )
+    )
+assert "".join(HTMLRenderer.Blocks(lines)) == expected
+assert '<div class="block doc" id="L2">' in expected
+assert "# Title\n  Indented &lt;doc&gt;\n" in expected
+assert "return a &amp; 1" in expected
+
+# Lines are rendered as they are read, even within a single large block
+read: list[int] = []
+
+
+def infinite():
+    for i in count():
+        read.append(i)
+        yield f"x = {i}\n"
+
+
+chunks = HTMLRenderer.Blocks(infinite())
+assert next(chunks) == '<pre class="block code" id="L0">'
+assert next(chunks) == "x = 0\n"
+assert len(read) <= 3
+
+# EOF
@@ -0,0 +1,36 @@
+from pathlib import Path
+import os
+import tempfile
+from coda.render.site import Site
+
+base = Path(tempfile.mkdtemp(dir=os.environ.get("TESTDIR")))
+output = base / "dist"
+(base / "src").mkdir()
+sources = {
+    # Windows line endings
+    "src/crlf.py": "a = 1\r\n# --\r\n# Doc line\r\nb = 2\r\n",
+    # Characters that `str.splitlines` treats as line breaks
+    "src/breaks.py": "s = '\x0c\x1c '\n# --\n# Doc line\nb = 2\n",
+}
+for name, text in sources.items():
+    with open(base / name, "w", newline="") as f:
+        f.write(text)
+
+pages = list(Site.Pages([base / _ for _ in sources], output, base=base))
+for page in pages:
+    Site.RenderPage(page)
+    html = Path(page.output).read_text()
+    assert '<div class="block doc" id="L1">Doc line\n</div>' in html, html
+    assert '<pre class="block code" id="L3">b = 2' in html, html
+assert Path(pages[0].output) == output / "src/crlf.py.html"
+assert b'<pre class="block code" id="L0">a = 1\r\n</pre>' in Path(
+    pages[0].output
+).read_bytes()
+
+# Sources outside of the base are written within `output/_`
+outside = Path(tempfile.mkdtemp(dir=os.environ.get("TESTDIR"))) / "m.py"
+outside.write_text("x = 1\n")
+(page,) = Site.Pages([outside], output, base=base / "src")
+assert Path(page.output) == output / "_" / f"{outside.relative_to('/')}.html"
+
+# EOF
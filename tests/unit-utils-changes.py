@@ -0,0 +1,82 @@
+from pathlib import Path
+from subprocess import run
+import os
+import tempfile
+from coda.utils.changes import Changes
+from coda.parser.ctags import Tags
+from coda.render.site import Site
+
+base = Path(tempfile.mkdtemp(dir=os.environ.get("TESTDIR"))).resolve()
+os.chdir(base)
+env = {
+    **os.environ,
+    "GIT_AUTHOR_NAME": "test",
+    "GIT_AUTHOR_EMAIL": "test@example.com",
+    "GIT_COMMITTER_NAME": "test",
+    "GIT_COMMITTER_EMAIL": "test@example.com",
+}
+
+
+def git(*args: str) -> None:
+    run(["git", *args], check=True, capture_output=True, env=env)
+
+
+files = {
+    "top.py": "a = 1\n",
+    "src/mod.py": "def f():\n    pass\n",
+    # Git quotes such paths unless `-z` is used
+    "src/é x.py": "b = 2\n",
+}
+for name, text in files.items():
+    (base / name).parent.mkdir(parents=True, exist_ok=True)
+    (base / name).write_text(text)
+git("init", "-q", ".")
+git("add", ".")
+git("commit", "-q", "-m", "initial")
+
+# --
+# ## State and dirty sets
+state = Changes.Git()
+assert set(state) == set(files), state
+assert Changes.Dirty(state, Changes.Git()) == set()
+(base / "src/é x.py").write_text("b = 3\n")
+(base / "src/new.py").write_text("c = 1\n")
+dirty = Changes.Dirty(state, Changes.Git())
+assert dirty == {"src/é x.py", "src/new.py"}, dirty
+
+# --
+# ## Changes since a revision
+(base / "top.py").write_text("a = 2\n")
+assert Changes.Since("HEAD") == {"top.py", "src/é x.py", "src/new.py"}
+# Both the diff and the untracked files are relative to the directory, and
+# the changes outside of it are left out.
+changed = Changes.Since("HEAD", cwd=base / "src")
+assert changed == {"é x.py", "new.py"}, changed
+
+# The site compares the resolved paths, whatever their form
+pages = list(
+    Site.Pages(
+        ["./src/new.py", base / "top.py", "src/mod.py"],
+        base / "dist",
+        changed={"src/../src/new.py", str(base / "top.py"), "other.py"},
+    )
+)
+assert [_.source for _ in pages] == ["src/new.py", str(base / "top.py")], pages
+
+# --
+# ## Tags update
+# Entries are relative to the tags file directory, which is given as output.
+(base / "out").mkdir()
+tags = base / "out" / "tags"
+tags.write_text(
+    "!_TAG_FILE_FORMAT\t2\t/extended format/\n"
+    'f\t../src/mod.py\t/^def f():$/;"\tf\n'
+    'a\t../top.py\t/^a = 1$/;"\tv\n'
+)
+# None of the changed files is tagged, so ctags doesn't run, but the entries
+# of the changed files are removed.
+entries = list(Tags.Make("src/*.py", output=tags, changed={"top.py"}))
+assert [_.symbol for _ in entries] == ["f"], entries
+assert entries[0].fragment and entries[0].fragment[0].path, entries
+
+# EOF
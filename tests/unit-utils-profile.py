@@ -0,0 +1,147 @@
+from pathlib import Path
+from typing import Iterator
+import json
+import os
+import subprocess
+import sys
+import tempfile
+from coda.utils.profile import (
+    PROFILER,
+    NO_SPAN,
+    Profiler,
+    count,
+    counted,
+    enable,
+    span,
+)
+from coda.model import Fragment
+from coda.parser.blocks import BlockParser
+from coda.render.site import Site
+
+# --
+# ## Spans and counters
+profiler = Profiler(True)
+for i in range(3):
+    with profiler.span("parse", path=f"f{i}.py"):
+        pass
+with profiler.span("load", "index"):
+    pass
+profiler.count("bytes.read", 10)
+profiler.count("bytes.read", 5)
+profiler.count("cache.page.hit", 3)
+profiler.count("cache.page.miss")
+profiler.count("cache.tags.miss", 2)
+assert profiler.counters["bytes.read"] == 15
+
+# Data collected in another process is merged, adding up the counters
+other = Profiler(True)
+with other.span("parse", path="g.py"):
+    pass
+other.count("bytes.read", 7)
+profiler.merge(*other.collect())
+assert not other.events and not other.counters
+assert profiler.counters["bytes.read"] == 22
+assert len(profiler.events) == 5
+
+report = profiler.report().split("\n")
+assert report[0].split()[:2] == ["stage", "count"], report
+stages = {_.split()[0]: int(_.split()[1]) for _ in report[1 : report.index("")]}
+assert stages == {"parse": 4, "index.load": 1}, stages
+assert "Slowest files" in report
+assert any(_.split() == ["cache.page", "75.0%", "of", "4"] for _ in report), report
+assert any(_.split() == ["cache.tags", "0.0%", "of", "2"] for _ in report), report
+
+# --
+# ## Trace
+trace = profiler.trace()
+spans = [_ for _ in trace["traceEvents"] if _["ph"] == "X"]
+counters = {_["name"]: _ for _ in trace["traceEvents"] if _["ph"] == "C"}
+assert [_["name"] for _ in spans] == ["parse"] * 3 + ["load", "parse"]
+assert spans[0]["args"] == {"path": "f0.py"} and spans[3]["cat"] == "index"
+assert all({"ts", "dur", "pid", "tid"} <= set(_) for _ in spans)
+assert counters["bytes.read"]["args"] == {"value": 22}
+assert counters["bytes.read"]["ts"] == max(_["ts"] + _["dur"] for _ in spans)
+base = Path(tempfile.mkdtemp(dir=os.environ.get("TESTDIR")))
+profiler.save(base / "trace.json")
+assert json.loads((base / "trace.json").read_text()) == trace
+
+# --
+# ## Process profiler
+# When disabled, spans are a shared no-op and counters are ignored.
+enable(False)
+assert span("parse") is NO_SPAN
+count("ignored")
+assert "ignored" not in PROFILER.counters
+
+# Generators count what was read even when they're not consumed entirely
+enable(True)
+PROFILER.collect()
+source = base / "source.py"
+source.write_text("a = 1\na = 2\na = 3\n")
+found = Fragment.Find(source, "a =")
+assert next(found).line == 0
+found.close()
+assert PROFILER.counters["fragment.find"] == 1, PROFILER.counters
+lines = BlockParser.Lines(["a\n", "b\n", "c\n"])
+next(lines)
+lines.close()
+assert PROFILER.counters["blocks.lines"] == 1, PROFILER.counters
+
+# Decorated generators are left as-is when profiling is disabled
+@counted("words", "words.chars", calls="split")
+def words(text: str) -> Iterator[str]:
+    yield from text.split()
+
+
+enable(False)
+assert words("a b").gi_code.co_name == "words"
+enable(True)
+assert list(words("ab cd e")) == ["ab", "cd", "e"]
+partial = words("ab cd e")
+next(partial)
+partial.close()
+assert PROFILER.counters["words"] == 4, PROFILER.counters
+assert PROFILER.counters["words.chars"] == 7, PROFILER.counters
+assert PROFILER.counters["split"] == 2, PROFILER.counters
+
+# Rendering in the process keeps its profile data, unlike pool workers
+count("before")
+(page,) = Site.Pages([source], base / "dist", base=base)
+((output, size),) = Site.Process([page], jobs=1)
+assert size == Path(output).stat().st_size > 0
+assert PROFILER.counters["before"] == 1, PROFILER.counters
+assert PROFILER.counters["cache.output.miss"] == 1, PROFILER.counters
+assert [_[0] for _ in PROFILER.events if _[0] == "render"] == ["render"]
+# Pool workers start empty, so what they inherit isn't merged back twice
+((output, size),) = Site.Process([page], jobs=2)
+assert size == 0, size
+assert PROFILER.counters["before"] == 1, PROFILER.counters
+assert PROFILER.counters["cache.output.hit"] == 1, PROFILER.counters
+assert [_[0] for _ in PROFILER.events if _[0] == "render"] == ["render"] * 2
+enable(False)
+
+# --
+# ## Command options
+# The commands report on stderr, and save the trace when they exit.
+result = subprocess.run(
+    [
+        sys.executable,
+        "-m",
+        "coda",
+        "blocks",
+        "--profile",
+        "--trace",
+        str(base / "blocks.json"),
+        str(source),
+    ],
+    capture_output=True,
+    text=True,
+    env={**os.environ, "PYTHONPATH": os.pathsep.join(sys.path)},
+    check=True,
+)
+assert "--profile" not in result.stdout and "<<<" in result.stdout, result.stdout
+assert "blocks.lines" in result.stderr and "Slowest files" in result.stderr
+events = json.loads((base / "blocks.json").read_text())["traceEvents"]
+assert [_["args"] for _ in events if _["ph"] == "X"] == [{"path": str(source)}]
+
+# EOF
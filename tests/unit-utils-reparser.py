@@ -0,0 +1,46 @@
+from coda.utils.reparser import Marks, Block, MarkerEvent, text, iterMarks, compile
+
+BLOCKS = """
+# --
+# Block 1
+Line 1
+
+# --
+# Block 2.1
+# Block 2.2
+Line 2
+Line 3
+"""
+
+
+g = compile(
+    Marks(
+        {
+            "block": r"^([ \t]*)#[ ]+--[ ]*\n",
+            "comment": r"^([ \t]*)#(?P<text>.*)$",
+        },
+        {"paren": Block(text("("), text(")"))},
+    )
+)
+markers = list(iterMarks(BLOCKS, g))
+assert [_.type for _ in markers if _.type != "#text"] == [
+    "block",
+    "comment",
+    "block",
+    "comment",
+    "comment",
+    "#eos",
+], "Marks are typed after their outermost group"
+assert "".join(_.text for _ in markers) == BLOCKS, "Markers cover the whole text"
+for m in markers:
+    assert BLOCKS[m.start : m.end] == m.text, f"Marker span is its text: {m}"
+
+markers = list(iterMarks("f(a, (b))", g))
+assert [(_.type, _.event) for _ in markers if _.type != "#text"] == [
+    ("STA_paren", MarkerEvent.Start),
+    ("STA_paren", MarkerEvent.Start),
+    ("END_paren", MarkerEvent.End),
+    ("END_paren", MarkerEvent.End),
+    ("#eos", MarkerEvent.EOS),
+]
+# EOF
@@ -0,0 +1,63 @@
+from coda.utils.tree import Node, node, toGraphviz, toSExpr
+
+# Sibling navigation goes through the cached `_index`, which mutations
+# keep up to date.
+root = node("ul", node("li", id=1), node("li", id=2), node("li", id=3))
+a, b, c = root.children
+assert [_.index() for _ in root.children] == [0, 1, 2]
+assert b.previousSibling is a and b.nextSibling is c
+assert a.previousSibling is None and c.nextSibling is None
+assert list(c.previousSiblings) == [b, a]
+assert list(a.nextSiblings) == [b, c]
+
+d: Node[None] = Node("li", {"id": 4})
+root.insert(1, d)
+assert [_["id"] for _ in root.children] == [1, 4, 2, 3]
+assert [_.index() for _ in root.children] == [0, 1, 2, 3]
+assert d.nextSibling is b and b.previousSibling is d
+
+root.remove(a)
+assert a.parent is None and a.index() is None
+assert [_.index() for _ in root.children] == [0, 1, 2]
+assert d.previousSibling is None
+
+e: Node[None] = Node("li", {"id": 5})
+root.set(-1, e)
+assert c.parent is None and e.index() == 2 and b.nextSibling is e
+
+b.wrap(Node("span"))
+assert root.children[1].name == "span" and b.parent is root.children[1]
+assert b.index() == 0 and b.nextSibling is None
+
+# Serialization
+tree = node("div", node("p", node("#text", value="a < b")), node("br"), cls="x")
+assert tree.toXML() == '<div cls="x"><p>a &lt; b</p><br /></div>'
+assert node("div").toHTML() == "<div></div>"
+assert node("p", node("span")).toHTML() == "<p><span></span></p>"
+assert tree.toTDoc() == "\n".join(
+    ["div cls='x'", "├ p ", "│  └ #text value='a < b'", "└ br "]
+)
+assert tree.asDict()["children"][0]["name"] == "p"
+assert tree.asDict()["children"][0]["parent"] == tree.id
+graph = toGraphviz(tree)
+assert graph.startswith("digraph {") and graph.endswith("}")
+assert f"  {tree.id}->{tree.children[0].id};" in graph.split("\n")
+assert toSExpr(node("a", node("b"))) == "(a\n  (b))"
+
+# Only the tags of the serialized node end with `eol`
+assert "".join(tree.iterXML(eol=True)) == (
+    '<div cls="x">\n<p>a &lt; b</p><br /></div>\n'
+)
+
+# Deep trees serialize without recursion
+deep: Node[None] = Node("div")
+leaf = deep
+for _ in range(50_000):
+    child: Node[None] = Node("div")
+    leaf.add(child)
+    leaf = child
+xml = deep.toXML()
+assert xml == "<div>" * 50_000 + "<div />" + "</div>" * 50_000
+assert deep.asDict()["children"][0]["parent"] == deep.id
+
+# EOF
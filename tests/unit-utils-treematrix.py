@@ -0,0 +1,51 @@
+from array import array
+from coda.utils.export import asPrimitive
+from coda.utils.treematrix import TreeMatrix, Node
+
+tree: TreeMatrix[str, int] = TreeMatrix()
+tree.register("a", 1)
+tree.register("b", 2, "a")
+tree.register("c", 3, "a")
+tree.register("d", 4, "b")
+# Referenced as a parent, but never registered
+tree.register("x", 5, "orphan")
+
+assert list(tree.children("a")) == ["b", "c"]
+assert tree.parentOf("d") == "b"
+assert list(tree.walk("a")) == ["a", "b", "d", "c"]
+# Nodes with an unregistered parent are roots, so that they're encoded
+assert list(tree.roots()) == ["a", "x"]
+assert tree.asNode("a") == Node(
+    "a", 1, [Node("b", 2, [Node("d", 4)]), Node("c", 3)]
+)
+
+# Encoding roundtrip
+decoded = TreeMatrix.Decode(tree.encode())
+assert list(decoded.walk("a")) == ["a", "b", "d", "c"]
+assert decoded.asNode("a") == tree.asNode("a")
+assert list(decoded.roots()) == ["a", "x"] and decoded.value("x") == 5
+assert "orphan" not in decoded
+
+# Deep trees are walked and converted without recursion
+deep: TreeMatrix[int, int] = TreeMatrix()
+deep.register(0, 0)
+for i in range(1, 100_000):
+    deep.register(i, i, i - 1)
+assert sum(1 for _ in deep.walk(0)) == 100_000
+node = deep.asNode(0)
+depth = 0
+while node.children:
+    node = node.children[0]
+    depth += 1
+assert depth == 99_999
+assert list(TreeMatrix.Decode(deep.encode()).walk(0))[-1] == 99_999
+
+# Integer columns export as lists
+assert asPrimitive(tree.encode()) == {
+    "ids": ["a", "b", "d", "c", "x"],
+    "values": [1, 2, 4, 3, 5],
+    "counts": [2, 1, 0, 0, 0],
+}
+assert asPrimitive(array("i", [1, 2])) == [1, 2]
+
+# EOF